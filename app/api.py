@@ -1,28 +1,142 @@
+import asyncio
+import json
+import tempfile
 from datetime import datetime
-from fastapi import FastAPI, Depends, HTTPException
+from decouple import config
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, \
+    Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from typing import List
 
-from app.auth.auth_bearer import verify_password
-from app.auth.auth_handler import create_access_token, decode_jwt, \
-    credentials_exception
+from app.auth.auth_bearer import get_password_hash, shutdown_hash_pool, \
+    verify_password
+from app.auth.auth_handler import admin_emails, create_access_token, \
+    decode_jwt, credentials_exception, sign_write_time, verify_write_time
 from app.db import crud
 from app.db import models, schemas
-from app.db.database import engine, SessionLocal
+from app.db.database import get_engine, preconnect, SessionLocal
+from app.db.replicas import WriteTimeMiddleware
 from app.db.schemas import Token
-from app.helpers import math
+from app.diagnostics.profiling import ProfiledRoute, ProfilingMiddleware
+from app.diagnostics.slow_queries import SlowQueryLog
+from app.events.hub import EventHub
+from app.helpers import banks, math
+from app.helpers.batching import BatchLoader
+from app.helpers.cache import default_shared_directory, LRUCache, \
+    TwoTierCache
+from app.helpers.leaderboard import Leaderboards
+from app.helpers.packing import answer_order, pack_scores, pack_selections
+from app.helpers.search import SearchIndexes
+from app.jobs.tasks import job_queue, outbox_relay, solve_archiver, \
+    solve_sweeper
+from app.tools import changes, interchange, provisioning
 
 from fastapi.encoders import jsonable_encoder
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 
-models.Base.metadata.create_all(bind=engine)
-
 app = FastAPI()
+app.router.route_class = ProfiledRoute
+app.add_middleware(
+    ProfilingMiddleware,
+    directory=config('PROFILE_DIR', default='profiles'),
+    sample_rate=config('PROFILE_SAMPLE_RATE', default=0.0, cast=float)
+)
+app.add_middleware(WriteTimeMiddleware, sign=sign_write_time,
+                   verify=verify_write_time)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+leaderboards = Leaderboards(
+    maxsize=config('LEADERBOARD_CACHE_SIZE', default=1000, cast=int),
+    sync_seconds=config('LEADERBOARD_SYNC_SECONDS', default=1.0, cast=float)
+)
+quiz_cache = TwoTierCache(
+    maxsize=config('QUIZ_CACHE_SIZE', default=1000, cast=int),
+    directory=config('QUIZ_CACHE_DIR', default=default_shared_directory())
+)
+bank_cache = LRUCache(
+    maxsize=config('BANK_CACHE_SIZE', default=100, cast=int)
+)
+QUESTION_SCORES_STORAGE = config('QUESTION_SCORES_STORAGE', default='rows')
+search_indexes = SearchIndexes(
+    maxsize=config('SEARCH_CACHE_SIZE', default=1000, cast=int),
+    max_age=config('SEARCH_CACHE_SECONDS', default=300.0, cast=float)
+)
+
+
+# The live event of a finished solve, made from its outbox event. Workers
+# load it back from there when it is too large to go through NOTIFY.
+def solve_event(payload: dict):
+    return {
+        'id': payload['solve_id'],
+        'user_id': payload['user_id'],
+        'quiz_score': payload['quiz_score'],
+        'finish_datetime': payload['finish_datetime'],
+        'question_scores': payload['question_scores']
+    }
+
+
+def fetch_solve_event(bind, event_id: int):
+    with Session(bind=bind) as db:
+        db_event = crud.get_outbox_event(db, event_id)
+        return solve_event(json.loads(db_event.payload))
+
+
+events = EventHub(
+    buffer_size=config('EVENTS_BUFFER_SIZE', default=100, cast=int),
+    notify=config('EVENTS_NOTIFY', default=True, cast=bool),
+    fetch=fetch_solve_event
+)
+# Streams are closed after this long (clients reconnect), so a worker
+# shutting down never waits on them for longer.
+EVENTS_STREAM_SECONDS = config('EVENTS_STREAM_SECONDS', default=60.0,
+                               cast=float)
+EVENTS_KEEPALIVE_SECONDS = 15.0
+IMPORT_MAX_BYTES = config('IMPORT_MAX_BYTES', default=100 * 2 ** 20, cast=int)
+USERS_BULK_MAX_ROWS = config('USERS_BULK_MAX_ROWS', default=10000, cast=int)
+BATCH_MAX_IDS = config('BATCH_MAX_IDS', default=1000, cast=int)
+slow_queries = SlowQueryLog(
+    threshold_ms=config('SLOW_QUERY_MS', default=200.0, cast=float),
+    explain=config('SLOW_QUERY_EXPLAIN', default=True, cast=bool)
+)
+
+
+@app.on_event("startup")
+def warm_up():
+    preconnect(get_engine())
+    # Loads the deferred bcrypt and JWT imports so the first login doesn't
+    # pay for them.
+    get_password_hash('warm-up')
+    decode_jwt(create_access_token(data={"sub": 'warm-up'}))
+    with SessionLocal() as db:
+        for db_quiz in crud.get_most_solved_quizes(
+                db, limit=config('QUIZ_CACHE_PRELOAD', default=100, cast=int)
+        ):
+            quiz_payload(db, db_quiz)
+    job_queue.start(get_engine())
+    solve_sweeper.start(get_engine())
+    solve_archiver.start(get_engine())
+    outbox_relay.start(get_engine())
+    events.listen(get_engine())
+
+
+@app.on_event("shutdown")
+def drain():
+    events.close()
+    solve_sweeper.stop()
+    solve_archiver.stop()
+    outbox_relay.stop()
+    shutdown_hash_pool()
+    job_queue.stop(
+        timeout=config('SHUTDOWN_DRAIN_SECONDS', default=30, cast=float)
+    )
 
 
-def get_db():
+def get_db(request: Request):
     db = SessionLocal()
+    # Keeps the client's reads on the primary for a while after it wrote,
+    # through whichever worker.
+    db.info['request_state'] = request.scope.setdefault('state', {})
     try:
         yield db
     finally:
@@ -39,6 +153,8 @@ def get_current_user(
     db_user = crud.get_user_by_email(db, email=user['sub'])
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
+    # Lets the session keep this user's reads on the primary after a write.
+    db.info['user_id'] = db_user.id
     return db_user
 
 
@@ -50,12 +166,72 @@ def get_current_active_user(
     return current_user
 
 
+def get_current_admin_user(
+        current_user: schemas.User = Depends(get_current_active_user)
+):
+    if current_user.email not in admin_emails():
+        raise HTTPException(status_code=403, detail="Admins only")
+    return current_user
+
+
 def get_user_id(
         current_user: schemas.User = Depends(get_current_user)
 ):
     return current_user.id
 
 
+# The workers share the cached payloads of the database they serve, and
+# only those.
+def get_quiz_cache(db: Session):
+    if quiz_cache.directory and quiz_cache.shared is None:
+        quiz_cache.open(crud.get_database_namespace(db))
+    return quiz_cache
+
+
+# Published quizes are served from a pre-serialized payload shared by all
+# workers and keyed by the quiz version, which crud bumps on every change.
+def quiz_payload(db: Session, db_quiz: models.Quiz):
+    if not db_quiz.is_active:
+        return schemas.Quiz.from_orm(db_quiz).json().encode()
+    cache = get_quiz_cache(db)
+    name = f'quiz-{db_quiz.id}'
+    payload = cache.get(name, db_quiz.version)
+    if payload is None:
+        payload = schemas.Quiz.from_orm(db_quiz).json().encode()
+        cache.put(name, db_quiz.version, payload)
+    return payload
+
+
+# Kept per worker while the bank is published, which it stays until it is
+# deleted.
+def compiled_bank(db: Session, db_quiz: models.Quiz):
+    bank = bank_cache.get((db_quiz.id, db_quiz.version))
+    if bank is None:
+        bank = banks.CompiledBank(db_quiz,
+                                  crud.get_quiz_questions(db, db_quiz.id))
+        bank_cache.put((db_quiz.id, db_quiz.version), bank)
+    return bank
+
+
+# The questions a solve is scored on: all of the quiz's, or those its seed
+# drew from a bank.
+def solve_questions(db: Session, db_solve: models.Solve):
+    if db_solve.seed is None:
+        return db_solve.quiz.questions
+    bank = bank_cache.get((db_solve.quiz_id, db_solve.quiz.version))
+    if bank is not None:
+        return bank.questions(db_solve.seed)
+    return crud.get_drawn_questions(db, db_solve.quiz, db_solve.seed)
+
+
+def solve_response(db_solve: models.Solve, payload: bytes):
+    solve = schemas.SolveUpdate.from_orm(db_solve).json().encode()
+    return Response(
+        content=solve[:-1] + b',"question_scores":[],"quiz":' + payload + b'}',
+        media_type='application/json'
+    )
+
+
 @app.post("/token", response_model=Token)
 def login_for_access_token(
         db: Session = Depends(get_db),
@@ -81,6 +257,23 @@ def create_user(
     return crud.create_user(db=db, user=user)
 
 
+@app.post("/users/bulk", response_model=list[schemas.UserStatus])
+async def create_users(
+        request: Request,
+        current_user: schemas.User = Depends(get_current_admin_user),
+        db: Session = Depends(get_db)
+):
+    data = await request.body()
+    try:
+        return await run_in_threadpool(
+            provisioning.provision_users, db, data,
+            request.headers.get('content-type', 'application/json'),
+            USERS_BULK_MAX_ROWS
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e)) from e
+
+
 @app.get("/users", response_model=schemas.User)
 def read_users_me(
         current_user: models.User = Depends(get_current_user)
@@ -97,7 +290,9 @@ def create_quiz_for_user(
 ):
     if not crud.get_user(db, user_id=user_id):
         raise HTTPException(status_code=404, detail="User not found")
-    return crud.create_quiz(db=db, quiz=quiz, user_id=user_id)
+    db_quiz = crud.create_quiz(db=db, quiz=quiz, user_id=user_id)
+    search_indexes.invalidate(user_id)
+    return db_quiz
 
 
 @app.get("/quizes/{quiz_id}", response_model=schemas.Quiz)
@@ -109,7 +304,8 @@ def get_quiz(
     db_quiz = crud.get_quiz(db, quiz_id=quiz_id, user_id=user_id)
     if db_quiz is None:
         raise HTTPException(status_code=404, detail="Quiz not found")
-    return db_quiz
+    return Response(content=quiz_payload(db, db_quiz),
+                    media_type='application/json')
 
 
 @app.get('/quizes', response_model=List[schemas.Quiz])
@@ -140,9 +336,16 @@ def update_quiz(
         )
     if quiz.dict()['is_active']:
         detail = ''
-        if not db_quiz.questions:
+        questions = crud.get_quiz_questions(db, quiz_id)
+        draw_count = quiz.dict(exclude_unset=True).get('draw_count',
+                                                       db_quiz.draw_count)
+        if not questions:
             detail = "A quiz needs at least one question to be activated"
-        for question in db_quiz.questions:
+        elif draw_count is None and len(questions) > 10:
+            detail = "Maximum questions for a quiz reached: 10"
+        elif draw_count is not None and draw_count > len(questions):
+            detail = "A question bank can't draw more questions than it has"
+        for question in questions:
             if len(question.answers) < 2:
                 detail = "A question needs at leat two answers " \
                          "for the quiz to be activated"
@@ -171,10 +374,87 @@ def update_quiz(
     stored_quiz_model = schemas.QuizUpdate(**db_quiz.__dict__)
     update_data = quiz.dict(exclude_unset=True)
     updated_quiz = stored_quiz_model.copy(update=update_data)
+    if updated_quiz.is_active:
+        crud.add_outbox_event(db, 'quiz_published', {
+            'quiz_id': quiz_id,
+            'user_id': user_id,
+            'title': updated_quiz.title,
+            'draw_count': updated_quiz.draw_count
+        })
     crud.update_quiz(db, jsonable_encoder(updated_quiz), quiz_id)
+    search_indexes.invalidate(user_id)
     return updated_quiz
 
 
+@app.patch('/quizes/{quiz_id}', response_model=schemas.Quiz)
+def patch_quiz(
+        quiz_id: int,
+        patch: schemas.QuizPatch,
+        user_id: int = Depends(get_user_id),
+        db: Session = Depends(get_db)
+):
+    db_quiz = crud.get_quiz(db, quiz_id=quiz_id, user_id=user_id)
+    if not db_quiz:
+        raise HTTPException(status_code=404, detail="Quiz not found")
+    if db_quiz.is_active:
+        raise HTTPException(
+            status_code=405,
+            detail="You can't update a published quiz."
+        )
+    questions = crud.get_quiz_questions(db, quiz_id)
+    answer_counts = {question.id: len(question.answers)
+                     for question in questions}
+    question_of = {answer.id: question.id for question in questions
+                   for answer in question.answers}
+    removed_questions = set(patch.questions.remove)
+    removed_answers = set(patch.answers.remove)
+    if not removed_questions.union(
+            change.id for change in patch.questions.update
+    ).union(
+        answer.question_id for answer in patch.answers.add
+    ) <= answer_counts.keys():
+        raise HTTPException(status_code=404, detail="Question not found")
+    if not removed_answers.union(
+            change.id for change in patch.answers.update
+    ) <= question_of.keys():
+        raise HTTPException(status_code=404, detail="Answer not found")
+    if any(change.id in removed_questions
+           for change in patch.questions.update) or \
+            any(answer.question_id in removed_questions
+                for answer in patch.answers.add) or \
+            any(change.id in removed_answers or
+                question_of[change.id] in removed_questions
+                for change in patch.answers.update):
+        raise HTTPException(
+            status_code=422,
+            detail="Can't change a question or answer that is removed"
+        )
+
+    draw_count = patch.dict(exclude_unset=True).get('draw_count',
+                                                    db_quiz.draw_count)
+    limit = banks.MAX_QUESTIONS if draw_count else 10
+    if len(questions) - len(removed_questions) + \
+            len(patch.questions.add) > limit:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Maximum questions for a quiz reached: {limit}"
+        )
+    for answer_id in removed_answers:
+        answer_counts[question_of[answer_id]] -= 1
+    for answer in patch.answers.add:
+        answer_counts[answer.question_id] += 1
+    if any(count > 5 for question_id, count in answer_counts.items()
+           if question_id not in removed_questions) or \
+            any(len(question.answers) > 5
+                for question in patch.questions.add):
+        raise HTTPException(status_code=409,
+                            detail="Maximum answers for a question reached: 5")
+
+    crud.patch_quiz(db, quiz_id, patch, questions)
+    search_indexes.invalidate(user_id)
+    return crud.get_owned_quizes(db, [quiz_id], user_id=user_id)[0]
+
+
 @app.delete("/quizes/{quiz_id}")
 def delete_quiz(
         quiz_id: int,
@@ -184,7 +464,13 @@ def delete_quiz(
     db_quiz = crud.get_quiz(db, quiz_id=quiz_id, user_id=user_id)
     if not db_quiz:
         raise HTTPException(status_code=404, detail="Quiz not found")
+    crud.add_outbox_event(db, 'quiz_deleted', {'quiz_id': quiz_id,
+                                               'user_id': user_id})
     crud.delete_quiz(db, quiz_id=quiz_id, user_id=user_id)
+    leaderboards.discard(quiz_id)
+    search_indexes.invalidate(user_id)
+    get_quiz_cache(db).discard(f'quiz-{quiz_id}')
+    bank_cache.discard(quiz_id)
     return {'ok': True}
 
 
@@ -199,10 +485,16 @@ def create_question_for_quiz(
     db_quiz = crud.get_quiz(db, quiz_id=quiz_id, user_id=user_id)
     if not db_quiz:
         raise HTTPException(status_code=404, detail="Quiz not found.")
-    if len(db_quiz.questions) >= 10:
-        raise HTTPException(status_code=409,
-                            detail="Maximum questions for a quiz reached: 10")
-    return crud.create_question(db=db, question=question, quiz_id=quiz_id)
+    limit = banks.MAX_QUESTIONS if db_quiz.draw_count else 10
+    if crud.count_questions(db, quiz_id) >= limit:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Maximum questions for a quiz reached: {limit}"
+        )
+    db_question = crud.create_question(db=db, question=question,
+                                       quiz_id=quiz_id)
+    search_indexes.invalidate(user_id)
+    return db_question
 
 
 @app.get("/questions/{question_id}")
@@ -226,12 +518,12 @@ def update_question(
         user_id: int = Depends(get_user_id),
         db: Session = Depends(get_db)
 ):
-    db_question = crud.get_question(db,
+    owned = crud.get_owned_question(db,
                                     question_id=question_id,
                                     user_id=user_id)
-    if not db_question:
+    if owned is None:
         raise HTTPException(status_code=404, detail="Question not found")
-    db_quiz = crud.get_quiz(db, db_question.quiz_id, user_id=user_id)
+    db_question, db_quiz, _ = owned
     if db_quiz.is_active:
         raise HTTPException(
             status_code=405,
@@ -241,6 +533,7 @@ def update_question(
     update_data = question.dict(exclude_unset=True)
     updated_question = stored_question_model.copy(update=update_data)
     crud.update_question(db, jsonable_encoder(updated_question), question_id)
+    search_indexes.invalidate(user_id)
     return updated_question
 
 
@@ -250,12 +543,21 @@ def delete_question(
         user_id: int = Depends(get_user_id),
         db: Session = Depends(get_db)
 ):
-    db_question = crud.get_question(db,
+    owned = crud.get_owned_question(db,
                                     question_id=question_id,
                                     user_id=user_id)
-    if not db_question:
+    if owned is None:
         raise HTTPException(status_code=404, detail="Question not found")
+    _, db_quiz, _ = owned
+    # Packed scores and selections are aligned to the quiz's questions and
+    # answers, so a published quiz keeps them as they are.
+    if db_quiz.is_active:
+        raise HTTPException(
+            status_code=405,
+            detail="You can't update a published quiz."
+        )
     crud.delete_question(db, question_id=question_id)
+    search_indexes.invalidate(user_id)
     return {'ok': True}
 
 
@@ -267,12 +569,20 @@ def create_answer_for_question(
         user_id: int = Depends(get_user_id),
         db: Session = Depends(get_db)
 ):
-    db_question = crud.get_question(db,
+    owned = crud.get_owned_question(db,
                                     question_id=question_id,
                                     user_id=user_id)
-    if len(db_question.answers) >= 5:
+    if owned is None:
+        raise HTTPException(status_code=404, detail="Question not found")
+    _, db_quiz, answer_count = owned
+    if answer_count >= 5:
         raise HTTPException(status_code=409,
                             detail="Maximum answers for a question reached: 5")
+    if db_quiz.is_active:
+        raise HTTPException(
+            status_code=405,
+            detail="You can't update a published quiz."
+        )
     return crud.create_answer(db=db, answer=answer,
                               question_id=question_id)
 
@@ -296,13 +606,10 @@ def update_answer(
         user_id: int = Depends(get_user_id),
         db: Session = Depends(get_db)
 ):
-    db_answer = crud.get_answer(db, answer_id=answer_id, user_id=user_id)
-    if not db_answer:
+    owned = crud.get_owned_answer(db, answer_id=answer_id, user_id=user_id)
+    if owned is None:
         raise HTTPException(status_code=404, detail="Answer not found")
-    db_question = crud.get_question(db,
-                                    question_id=db_answer.question_id,
-                                    user_id=user_id)
-    db_quiz = crud.get_quiz(db, db_question.quiz_id, user_id=user_id)
+    db_answer, _, db_quiz = owned
     if db_quiz.is_active:
         raise HTTPException(
             status_code=405,
@@ -321,19 +628,72 @@ def delete_answer(
         user_id: int = Depends(get_user_id),
         db: Session = Depends(get_db)
 ):
-    db_answer = crud.get_answer(db, answer_id, user_id)
-    if not db_answer:
+    owned = crud.get_owned_answer(db, answer_id=answer_id, user_id=user_id)
+    if owned is None:
         raise HTTPException(status_code=404, detail="Answer not found")
+    _, _, db_quiz = owned
+    if db_quiz.is_active:
+        raise HTTPException(
+            status_code=405,
+            detail="You can't update a published quiz."
+        )
     crud.delete_answer(db, answer_id=answer_id)
     return {'ok': True}
 
 
+# BATCH
+# What a quiz editor would otherwise fetch one GET at a time. Quizes come
+# with their questions and answers, so asking for those too costs nothing.
+@app.post("/batch/get", response_model=schemas.BatchResult)
+def batch_get(
+        batch: schemas.BatchGet,
+        user_id: int = Depends(get_user_id),
+        db: Session = Depends(get_db)
+):
+    if len(batch.quiz_ids) + len(batch.question_ids) + \
+            len(batch.answer_ids) > BATCH_MAX_IDS:
+        raise HTTPException(status_code=422,
+                            detail=f"More than {BATCH_MAX_IDS} ids")
+    quizes = BatchLoader(
+        lambda ids: crud.get_owned_quizes(db, ids, user_id=user_id)
+    )
+    questions = BatchLoader(
+        lambda ids: crud.get_owned_questions(db, ids, user_id=user_id)
+    )
+    answers = BatchLoader(
+        lambda ids: crud.get_owned_answers(db, ids, user_id=user_id)
+    )
+    quizes.want(batch.quiz_ids)
+    questions.want(batch.question_ids)
+    answers.want(batch.answer_ids)
+    found_quizes, missing_quizes = quizes.resolve()
+    for db_quiz in found_quizes:
+        for db_question in db_quiz.questions:
+            questions.prime(db_question)
+    found_questions, missing_questions = questions.resolve()
+    for db_question in found_questions:
+        for db_answer in db_question.answers:
+            answers.prime(db_answer)
+    found_answers, missing_answers = answers.resolve()
+    return {
+        'quizes': found_quizes,
+        'questions': found_questions,
+        'answers': found_answers,
+        'missing': {
+            'quiz_ids': missing_quizes,
+            'question_ids': missing_questions,
+            'answer_ids': missing_answers
+        }
+    }
+
+
 # SOLVE
 @app.post("/solve", response_model=schemas.Solve)
 def create_solve(
         user_id: int = Depends(get_user_id),
         db: Session = Depends(get_db)
 ):
+    crud.lock_open_solves(db, user_id=user_id)
     if crud.get_unfinished_solves(db, user_id=user_id):
         raise HTTPException(
             status_code=409,
@@ -345,11 +705,24 @@ def create_solve(
             status_code=404,
             detail="No available quizes at the moment"
         )
+    seed = None
+    if db_quiz.draw_count:
+        seed = banks.draw_seed()
+        payload = compiled_bank(db, db_quiz).payload(seed)
+    else:
+        payload = quiz_payload(db, db_quiz)
     solve = models.Solve(
         user_id=user_id,
-        quiz_id=db_quiz.id
+        quiz_id=db_quiz.id,
+        seed=seed
     )
-    return crud.create_solve(db=db, solve=solve)
+    db_solve = crud.create_solve(db=db, solve=solve)
+    if db_solve is None:
+        raise HTTPException(
+            status_code=409,
+            detail="User already has an unfinished quiz opened"
+        )
+    return solve_response(db_solve, payload)
 
 
 @app.get("/users/finished_solves", response_model=schemas.Solve)
@@ -358,9 +731,12 @@ def get_finished_solves(
         db: Session = Depends(get_db)
 ):
     db_solve = crud.get_finished_solves(db, user_id=user_id)
-    if not db_solve:
+    if db_solve:
+        return db_solve
+    record = crud.get_archived_solve(db, user_id=user_id)
+    if record is None:
         raise HTTPException(status_code=404, detail="No solved quiz found")
-    return db_solve
+    return dict(record, quiz=db.get(models.Quiz, record['quiz_id']))
 
 
 @app.get("/users/unfinished_solves", response_model=schemas.Solve)
@@ -371,6 +747,10 @@ def get_unfinished_solves(
     db_solve = crud.get_unfinished_solves(db, user_id=user_id)
     if not db_solve:
         raise HTTPException(status_code=404, detail="No unfinished quiz found")
+    if db_solve.seed is not None:
+        return solve_response(
+            db_solve, compiled_bank(db, db_solve.quiz).payload(db_solve.seed)
+        )
     return db_solve
 
 
@@ -395,30 +775,65 @@ def update_solve(
     for item in answers_solutions:
         user_answers[item.id] = item.user_answer
 
+    questions = solve_questions(db, db_solve)
     try:
         question_scores, quiz_score = \
-            math.calculate_scores(db_solve.quiz.questions, user_answers)
+            math.calculate_scores(questions, user_answers)
     except (ValueError, KeyError) as e:
         raise HTTPException(
             status_code=404,
             detail=repr(e)
         ) from e
 
-    for qs in question_scores:
-        crud.create_question_score(
-            db,
-            question_id=qs['question_id'],
-            score=qs['score'],
-            solve_id=solve_id
-        )
-
     update_data = {
         'quiz_score': quiz_score,
         'is_finished': True,
         'finish_datetime': datetime.utcnow().isoformat()
         }
     updated_solve = stored_solve_model.copy(update=update_data)
-    crud.update_solve(db, jsonable_encoder(updated_solve), solve_id)
+    stored_data = jsonable_encoder(updated_solve)
+
+    order = answer_order(questions)
+    selected = {answer_id for answer_id in order if user_answers[answer_id]}
+    stored_data['packed_answers'] = pack_selections(order, selected)
+    post_solve = {
+        'solve_id': solve_id,
+        'quiz_id': updated_solve.quiz_id,
+        'selected_answer_ids': sorted(selected)
+    }
+    if QUESTION_SCORES_STORAGE == 'packed':
+        scores = {qs['question_id']: qs['score'] for qs in question_scores}
+        stored_data['packed_question_scores'] = pack_scores(
+            [scores[question_id] for question_id in sorted(scores)]
+        )
+    else:
+        post_solve['question_scores'] = question_scores
+    job_queue.submit(db, 'post_solve', post_solve)
+    finished = {
+        'solve_id': solve_id,
+        'quiz_id': updated_solve.quiz_id,
+        'user_id': user_id,
+        'quiz_score': quiz_score,
+        'start_datetime': updated_solve.start_datetime,
+        'finish_datetime': updated_solve.finish_datetime,
+        'question_scores': question_scores
+    }
+    db_event = crud.add_outbox_event(db, 'solve_finished', finished)
+    events.publish(db, f'quiz-{updated_solve.quiz_id}',
+                   solve_event(finished), reference=db_event.id)
+    if not crud.update_solve(db, stored_data, solve_id,
+                             updated_solve.quiz_id):
+        raise HTTPException(
+            status_code=404,
+            detail="Unfinished quiz not found"
+        )
+    leaderboards.record(
+        updated_solve.quiz_id,
+        solve_id=solve_id,
+        user_id=user_id,
+        score=quiz_score,
+        finish_datetime=updated_solve.finish_datetime
+    )
 
     return updated_solve
 
@@ -434,4 +849,231 @@ def get_solutions_for_quizes(
         raise HTTPException(status_code=404, detail="Quiz not found")
     db_solves = crud.get_finished_solves_by_quiz(db, quiz_id=quiz_id)
 
-    return db_solves
+    return crud.get_archived_solves(db, quiz_id=quiz_id) + db_solves
+
+
+async def quiz_events(topic: str):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + EVENTS_STREAM_SECONDS
+    subscription = events.subscribe(topic)
+    try:
+        yield 'retry: 1000\n\n'
+        while loop.time() < deadline:
+            try:
+                data = await subscription.get(min(
+                    EVENTS_KEEPALIVE_SECONDS, deadline - loop.time()
+                ))
+            except asyncio.TimeoutError:
+                yield ': keep-alive\n\n'
+                continue
+            if data is None:
+                return
+            if subscription.dropped:
+                yield f'event: dropped\ndata: {subscription.dropped}\n\n'
+                subscription.dropped = 0
+            yield f'event: solve\ndata: {data}\n\n'
+    finally:
+        events.unsubscribe(subscription)
+
+
+@app.get("/quizes/{quiz_id}/events")
+def stream_quiz_events(
+        quiz_id: int,
+        user_id: int = Depends(get_user_id),
+        db: Session = Depends(get_db)
+):
+    db_quiz = crud.get_quiz(db, quiz_id=quiz_id, user_id=user_id)
+    if not db_quiz:
+        raise HTTPException(status_code=404, detail="Quiz not found")
+    events.listen(db.get_bind())
+    # Don't keep a database connection for as long as the stream is open.
+    db.close()
+    return StreamingResponse(
+        quiz_events(f'quiz-{quiz_id}'),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@app.get("/quizes/{quiz_id}/answer-stats",
+         response_model=list[schemas.AnswerStats])
+def get_answer_stats(
+        quiz_id: int,
+        user_id: int = Depends(get_user_id),
+        db: Session = Depends(get_db)
+):
+    db_quiz = crud.get_quiz(db, quiz_id=quiz_id, user_id=user_id)
+    if db_quiz is None:
+        raise HTTPException(status_code=404, detail="Quiz not found")
+    return [
+        {
+            'question_id': question.id,
+            'answer_id': answer.id,
+            'is_correct': answer.is_correct,
+            'selections': answer.selection_count or 0,
+            'selection_rate':
+                (answer.selection_count or 0) / db_quiz.solve_count
+                if db_quiz.solve_count else 0.0
+        }
+        for question in sorted(db_quiz.questions, key=lambda q: q.id)
+        for answer in sorted(question.answers, key=lambda a: a.id)
+    ]
+
+
+# CHANGE STREAM
+# Solves finished, quizes published and quizes deleted, in commit order.
+# Pass the `after` of a response to get the next batch.
+@app.get("/events", response_model=schemas.ChangeBatch)
+def get_change_events(
+        after: int = Query(0, ge=0),
+        limit: int = Query(100, ge=1, le=1000),
+        current_user: schemas.User = Depends(get_current_admin_user),
+        db: Session = Depends(get_db)
+):
+    try:
+        changes.check_cursor(db, after)
+    except ValueError as e:
+        raise HTTPException(status_code=410, detail=str(e)) from e
+    records = [changes.change_record(db_event) for db_event
+               in crud.get_outbox_events(db, after, limit)]
+    return {'events': records,
+            'after': records[-1]['position'] if records else after}
+
+
+# SEARCH
+@app.get("/search", response_model=list[schemas.SearchResult])
+def search(
+        q: str = Query(..., min_length=1),
+        page: int = Query(1, ge=1),
+        per_page: int = Query(20, ge=1, le=100),
+        user_id: int = Depends(get_user_id),
+        db: Session = Depends(get_db)
+):
+    offset = (page - 1) * per_page
+    if db.get_bind().dialect.name == 'postgresql':
+        return crud.search_quizes_and_questions(
+            db, user_id=user_id, text=q, offset=offset, limit=per_page
+        )
+    index = search_indexes.get(
+        user_id, lambda: crud.get_searchable_texts(db, user_id=user_id),
+        version=crud.get_search_version(db, user_id=user_id)
+    )
+    return index.search(q, offset=offset, limit=per_page)
+
+
+# LEADERBOARDS
+def get_leaderboard(db: Session, quiz_id: int, user_id: int):
+    if crud.get_visible_quiz(db, quiz_id=quiz_id, user_id=user_id) is None:
+        raise HTTPException(status_code=404, detail="Quiz not found")
+    return leaderboards.get(
+        quiz_id,
+        lambda: (crud.get_last_outbox_position(db) or 0,
+                 crud.get_leaderboard_solves(db, quiz_id)),
+        lambda after, limit: leaderboard_changes(db, after, limit)
+    )
+
+
+def leaderboard_changes(db: Session, after: int, limit: int):
+    changes.check_cursor(db, after)
+    return [changes.change_record(db_event)
+            for db_event in crud.get_outbox_events(db, after, limit)]
+
+
+@app.get("/quizes/{quiz_id}/leaderboard",
+         response_model=list[schemas.LeaderboardEntry])
+def get_quiz_leaderboard(
+        quiz_id: int,
+        top: int = Query(10, ge=1, le=100),
+        user_id: int = Depends(get_user_id),
+        db: Session = Depends(get_db)
+):
+    return get_leaderboard(db, quiz_id, user_id).top(top)
+
+
+@app.get("/quizes/{quiz_id}/leaderboard/me",
+         response_model=schemas.LeaderboardEntry)
+def get_my_rank(
+        quiz_id: int,
+        user_id: int = Depends(get_user_id),
+        db: Session = Depends(get_db)
+):
+    entry = get_leaderboard(db, quiz_id, user_id).rank_of(user_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="No solve found")
+    return entry
+
+
+# IMPORT / EXPORT
+@app.get("/export/quizes")
+def export_quizes(
+        solves: bool = False,
+        current_user: models.User = Depends(get_current_active_user),
+        db: Session = Depends(get_db)
+):
+    # Solves name their solvers, so only admins get them.
+    if solves and current_user.email not in admin_emails():
+        raise HTTPException(status_code=403, detail="Admins only")
+    records = interchange.export_quizes(db.connection(),
+                                        user_id=current_user.id,
+                                        with_solves=solves)
+    return StreamingResponse(
+        interchange.dump(records),
+        media_type='application/gzip',
+        headers={'Content-Disposition':
+                 'attachment; filename="quizes.ndjson.gz"'}
+    )
+
+
+def import_file(db: Session, source, owner_id: int, with_solves: bool):
+    try:
+        totals = interchange.import_quizes(
+            db.connection(), interchange.load(source), owner_id=owner_id,
+            with_solves=with_solves, scores_storage=QUESTION_SCORES_STORAGE
+        )
+    except (ValueError, OSError, EOFError) as e:
+        db.rollback()
+        raise HTTPException(status_code=422, detail=str(e)) from e
+    # Written through the connection, so the session didn't see it.
+    db.info['wrote'] = True
+    db.commit()
+    return totals
+
+
+@app.post("/import/quizes")
+async def import_quizes(
+        request: Request,
+        current_user: models.User = Depends(get_current_active_user),
+        db: Session = Depends(get_db)
+):
+    # Spooled to disk past 1 MB, so a large upload isn't held in memory.
+    with tempfile.SpooledTemporaryFile(max_size=2 ** 20) as source:
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > IMPORT_MAX_BYTES:
+                raise HTTPException(status_code=413,
+                                    detail="Import too large")
+            source.write(chunk)
+        source.seek(0)
+        totals = await run_in_threadpool(
+            import_file, db, source, current_user.id,
+            current_user.email in admin_emails()
+        )
+    search_indexes.invalidate(current_user.id)
+    return totals
+
+
+# ADMIN
+@app.get("/admin/slow-queries")
+def get_slow_queries(
+        current_user: schemas.User = Depends(get_current_admin_user)
+):
+    return slow_queries.summary()
+
+
+@app.delete("/admin/slow-queries")
+def clear_slow_queries(
+        current_user: schemas.User = Depends(get_current_admin_user)
+):
+    slow_queries.clear()
+    return {"detail": "Slow query log cleared"}
@@ -1,12 +1,61 @@
-from passlib.context import CryptContext
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 
+from decouple import config
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+_hash_pool = None
+_hash_pool_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def get_pwd_context():
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
+
+
+def hash_workers():
+    return config('HASH_WORKERS', default=os.cpu_count() or 1, cast=int)
+
+
+# Started on first use with spawn rather than fork, since the API process
+# already runs threads.
+def get_hash_pool(workers: int):
+    global _hash_pool
+    with _hash_pool_lock:
+        if _hash_pool is None:
+            _hash_pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _hash_pool
+
+
+def shutdown_hash_pool():
+    global _hash_pool
+    with _hash_pool_lock:
+        pool, _hash_pool = _hash_pool, None
+    if pool is not None:
+        pool.shutdown()
+
+
+# bcrypt takes a few hundred milliseconds per password on purpose, so
+# batches of them are hashed on every core.
+def hash_passwords(passwords: list, workers: int = None):
+    workers = workers or hash_workers()
+    if workers <= 1 or len(passwords) < 2:
+        return [get_password_hash(password) for password in passwords]
+    return list(get_hash_pool(workers).map(
+        get_password_hash, passwords,
+        chunksize=max(1, len(passwords) // (workers * 4))
+    ))
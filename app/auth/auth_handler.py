@@ -1,13 +1,11 @@
+import hashlib
+import hmac
 from datetime import datetime, timedelta
+from functools import lru_cache
 from decouple import config
 from fastapi import HTTPException
-from jose import jwt, JWTError
 from starlette import status
 
-JWT_SECRET = config("SECRET_KEY")
-JWT_ALGORITHM = config("ALGORITHM")
-JWT_ACCESS_TOKEN_EXPIRE_MINUTES = config("ACCESS_TOKEN_EXPIRE_MINUTES")
-
 credentials_exception = HTTPException(
     status_code=status.HTTP_401_UNAUTHORIZED,
     detail="Could not validate credentials",
@@ -15,20 +13,63 @@ credentials_exception = HTTPException(
 )
 
 
+@lru_cache(maxsize=None)
+def jwt_settings():
+    return (
+        config("SECRET_KEY"),
+        config("ALGORITHM"),
+        config("ACCESS_TOKEN_EXPIRE_MINUTES", cast=int)
+    )
+
+
+@lru_cache(maxsize=None)
+def admin_emails():
+    return {
+        email.strip()
+        for email in config("ADMIN_EMAILS", default="").split(",")
+        if email.strip()
+    }
+
+
 def create_access_token(data: dict):
+    from jose import jwt
+    secret, algorithm, expire_minutes = jwt_settings()
     to_encode = data.copy()
-    expires_delta = timedelta(minutes=int(JWT_ACCESS_TOKEN_EXPIRE_MINUTES))
+    expires_delta = timedelta(minutes=expire_minutes)
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, JWT_SECRET, algorithm=JWT_ALGORITHM)
+    encoded_jwt = jwt.encode(to_encode, secret, algorithm=algorithm)
     return encoded_jwt
 
 
+# The time a client last wrote, as `<seconds>.<signature>` (see
+# app.db.replicas.WriteTimeMiddleware).
+def sign_write_time(when: float):
+    value = f'{when:.3f}'
+    signature = hmac.new(jwt_settings()[0].encode(), value.encode(),
+                         hashlib.sha256).hexdigest()
+    return f'{value}.{signature}'
+
+
+def verify_write_time(signed: str):
+    value, _, signature = signed.rpartition('.')
+    expected = hmac.new(jwt_settings()[0].encode(), value.encode(),
+                        hashlib.sha256).hexdigest()
+    if not value or not hmac.compare_digest(signature, expected):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
 def decode_jwt(token: str) -> dict:
+    from jose import jwt, JWTError
+    secret, algorithm, _ = jwt_settings()
     try:
-        return jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        return jwt.decode(token, secret, algorithms=[algorithm])
     except JWTError:
         raise credentials_exception
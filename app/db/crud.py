@@ -1,10 +1,21 @@
-from datetime import datetime
+import hashlib
+import json
+from datetime import datetime, timedelta
+from types import SimpleNamespace
 
-from sqlalchemy import exists
-from sqlalchemy.orm import Session
+from sqlalchemy import bindparam, delete, event, exists, func, \
+    lambda_stmt, literal, select, union_all, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, selectinload
 
-from app.auth.auth_bearer import get_password_hash
+from app.auth.auth_bearer import get_password_hash, hash_passwords
+from app.helpers.archive import get_archive
+from app.helpers.banks import draw_ordinals
+from app.helpers.search import tokenize
+from app.tools.bulk import Loader
 from . import models, schemas
+from .partitioning import solves_partitioned
+from .replicas import replica_read
 
 
 # USERS
@@ -19,12 +30,87 @@ def create_user(db: Session, user: schemas.UserCreate):
     return db_user
 
 
+def get_existing_emails(db: Session, emails: list):
+    return set(db.scalars(
+        select(models.User.email).where(models.User.email.in_(emails))
+    ))
+
+
+def insert_ignoring_conflicts(db: Session, table):
+    dialect = db.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return table.insert()
+    return insert(table).on_conflict_do_nothing()
+
+
+# Returns a status per user, in order: created (with its id), exists, or
+# duplicate when the email came up earlier in the list. A user registered
+# by another request while the passwords were being hashed is reported as
+# existing: bcrypt salts every hash, so only the rows written here carry
+# the hash computed here.
+def create_users(db: Session, users: list, batch_size: int = 1000):
+    existing = get_existing_emails(db, [user.email for user in users])
+    statuses, new_users, seen = [], [], set()
+    for user in users:
+        if user.email in existing:
+            statuses.append({'email': user.email, 'status': 'exists'})
+        elif user.email in seen:
+            statuses.append({'email': user.email, 'status': 'duplicate'})
+        else:
+            seen.add(user.email)
+            statuses.append({'email': user.email, 'status': 'created'})
+            new_users.append(user)
+    # Hashing takes a while; don't hold a transaction open meanwhile.
+    db.commit()
+    hashes = hash_passwords([user.password for user in new_users])
+    statement = insert_ignoring_conflicts(db, models.User.__table__)
+    for start in range(0, len(new_users), batch_size):
+        db.execute(statement, [
+            {'email': user.email, 'hashed_password': hashed_password,
+             'is_active': True}
+            for user, hashed_password in zip(
+                new_users[start:start + batch_size],
+                hashes[start:start + batch_size]
+            )
+        ])
+    db.commit()
+    written = {}
+    if new_users:
+        written = {
+            email: (user_id, hashed_password)
+            for email, user_id, hashed_password in db.execute(
+                select(models.User.email, models.User.id,
+                       models.User.hashed_password)
+                .where(models.User.email.in_(seen))
+            )
+        }
+    hashed = dict(zip((user.email for user in new_users), hashes))
+    for status in statuses:
+        if status['status'] != 'created':
+            continue
+        user_id, hashed_password = written.get(status['email'], (None, None))
+        if hashed_password == hashed[status['email']]:
+            status['id'] = user_id
+        else:
+            status['status'] = 'exists'
+    return statuses
+
+
 def get_user(db: Session, user_id: int):
     return db.query(models.User).filter(models.User.id == user_id).first()
 
 
+# The hot lookups are lambda statements: after the first call the statement
+# is found in the cache by the lambda's code, with the values it closes over
+# as bound parameters, instead of being built and compiled again.
 def get_user_by_email(db: Session, email: str):
-    return db.query(models.User).filter(models.User.email == email).first()
+    return db.execute(lambda_stmt(lambda: select(models.User).where(
+        models.User.email == email
+    ).limit(1))).scalars().first()
 
 
 def get_users(db: Session, skip: int = 0, limit: int = 100):
@@ -45,23 +131,87 @@ def create_quiz(db: Session, quiz: schemas.QuizBase, user_id: int):
     return db_quiz
 
 
+# Reads from the primary, like every lookup that guards a write.
 def get_quiz(db: Session, quiz_id: int, user_id: int):
+    return db.execute(lambda_stmt(lambda: select(models.Quiz).where(
+        models.Quiz.id == quiz_id,
+        models.Quiz.user_id == user_id
+    ).limit(1))).scalars().first()
+
+
+@replica_read
+def get_visible_quiz(db: Session, quiz_id: int, user_id: int):
     return db.query(models.Quiz).filter(
         models.Quiz.id == quiz_id
     ).filter(
-        models.Quiz.user_id == user_id
+        (models.Quiz.is_active == True) | (models.Quiz.user_id == user_id)
     ).first()
 
 
+def get_most_solved_quizes(db: Session, limit: int):
+    return db.query(models.Quiz).options(
+        selectinload(models.Quiz.questions).selectinload(
+            models.Question.answers
+        )
+    ).filter(
+        models.Quiz.is_active == True
+    ).order_by(models.Quiz.solve_count.desc()).limit(limit).all()
+
+
+@replica_read
 def get_quizes_by_user(db: Session, user_id: int):
     return db.query(models.Quiz).filter(models.Quiz.user_id == user_id).all()
 
 
+def bump_quiz_version(db: Session, quiz_id):
+    db.query(models.Quiz).filter(models.Quiz.id == quiz_id).update(
+        {'version': models.Quiz.version + 1},
+        synchronize_session=False
+    )
+
+
+def question_quiz_id(question_id: int):
+    return select(models.Question.quiz_id).where(
+        models.Question.id == question_id
+    ).scalar_subquery()
+
+
+def answer_quiz_id(answer_id: int):
+    return select(models.Question.quiz_id).join(
+        models.Answer, models.Answer.question_id == models.Question.id
+    ).where(
+        models.Answer.id == answer_id
+    ).scalar_subquery()
+
+
 def update_quiz(db: Session, quiz: schemas.QuizUpdate, quiz_id: int):
-    db.query(models.Quiz).filter(models.Quiz.id == quiz_id).update(quiz)
+    values = dict(quiz)
+    db.query(models.Quiz).filter(models.Quiz.id == quiz_id).update(
+        dict(values, version=models.Quiz.version + 1)
+    )
+    if values.get('is_active'):
+        number_questions(db, quiz_id)
     db.commit()
 
 
+# Gives the questions of a quiz being published their ordinals, which is
+# what a solve's seed draws from.
+def number_questions(db: Session, quiz_id: int):
+    question_ids = db.scalars(
+        select(models.Question.id).where(
+            models.Question.quiz_id == quiz_id
+        ).order_by(models.Question.id)
+    ).all()
+    if question_ids:
+        db.execute(
+            update(models.Question.__table__).where(
+                models.Question.__table__.c.id == bindparam('question_id')
+            ).values(ordinal=bindparam('position')),
+            [{'question_id': question_id, 'position': position}
+             for position, question_id in enumerate(question_ids)]
+        )
+
+
 def delete_quiz(db: Session, quiz_id: int, user_id: int):
     db.query(models.Quiz).filter(
         models.Quiz.id == quiz_id
@@ -71,34 +221,244 @@ def delete_quiz(db: Session, quiz_id: int, user_id: int):
     db.commit()
 
 
+# Applies a QuizPatch the caller has checked against the quiz's questions,
+# as they were loaded for the check: one statement per kind of change, and
+# a single commit. Bumping the version first also takes SQLite's write
+# lock before new ids are reserved.
+def patch_quiz(db: Session, quiz_id: int, patch: schemas.QuizPatch,
+               questions: list):
+    questions_table = models.Question.__table__
+    answers_table = models.Answer.__table__
+    db.query(models.Quiz).filter(models.Quiz.id == quiz_id).update(
+        dict(patch.dict(include={'title', 'draw_count'}, exclude_unset=True),
+             version=models.Quiz.version + 1),
+        synchronize_session=False
+    )
+    if patch.answers.remove:
+        db.execute(delete(answers_table).where(
+            answers_table.c.id.in_(patch.answers.remove)
+        ))
+    if patch.questions.remove:
+        # Their answers go with them (ON DELETE CASCADE).
+        db.execute(delete(questions_table).where(
+            questions_table.c.id.in_(patch.questions.remove)
+        ))
+    stored_questions = {question.id: question for question in questions}
+    if patch.questions.update:
+        db.execute(
+            update(questions_table).where(
+                questions_table.c.id == bindparam('question_id')
+            ).values(
+                description=bindparam('new_description'),
+                single_correct_answer=bindparam('new_single_correct_answer')
+            ),
+            [
+                {'question_id': change.id,
+                 'new_description': change.description
+                 if 'description' in change.__fields_set__
+                 else stored_questions[change.id].description,
+                 'new_single_correct_answer': change.single_correct_answer
+                 if 'single_correct_answer' in change.__fields_set__
+                 else stored_questions[change.id].single_correct_answer}
+                for change in patch.questions.update
+            ]
+        )
+    stored_answers = {answer.id: answer for question in questions
+                      for answer in question.answers}
+    if patch.answers.update:
+        db.execute(
+            update(answers_table).where(
+                answers_table.c.id == bindparam('answer_id')
+            ).values(
+                description=bindparam('new_description'),
+                is_correct=bindparam('new_is_correct')
+            ),
+            [
+                {'answer_id': change.id,
+                 'new_description': change.description
+                 if 'description' in change.__fields_set__
+                 else stored_answers[change.id].description,
+                 'new_is_correct': change.is_correct
+                 if 'is_correct' in change.__fields_set__
+                 else stored_answers[change.id].is_correct}
+                for change in patch.answers.update
+            ]
+        )
+    loader = Loader(db.connection())
+    question_ids = loader.reserve_ids(questions_table,
+                                      len(patch.questions.add))
+    new_answers = [
+        (question_id, answer)
+        for question_id, question in zip(question_ids, patch.questions.add)
+        for answer in question.answers
+    ] + [(answer.question_id, answer) for answer in patch.answers.add]
+    answer_ids = loader.reserve_ids(answers_table, len(new_answers))
+    loader.insert(
+        questions_table,
+        ['id', 'description', 'single_correct_answer', 'quiz_id'],
+        [(question_id, question.description,
+          question.single_correct_answer, quiz_id)
+         for question_id, question in zip(question_ids,
+                                          patch.questions.add)]
+    )
+    loader.insert(
+        answers_table,
+        ['id', 'description', 'is_correct', 'selection_count',
+         'question_id'],
+        [(answer_id, answer.description, answer.is_correct, 0, question_id)
+         for answer_id, (question_id, answer) in zip(answer_ids, new_answers)]
+    )
+    db.commit()
+
+
+# Tells this database apart from any other one, and from itself before it
+# was created again, where ids and versions start over.
+def get_database_namespace(db: Session):
+    token = db.scalar(select(models.Instance.token)) or ''
+    key = f'{db.bind.url.render_as_string()} {token}'
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+# Changes whenever the user's quizes or questions do: every edit bumps its
+# quiz's version, and creating or deleting a quiz changes the count and
+# usually the highest id.
+def get_search_version(db: Session, user_id: int):
+    return tuple(db.execute(select(
+        func.count(models.Quiz.id),
+        func.coalesce(func.sum(models.Quiz.version), 0),
+        func.coalesce(func.max(models.Quiz.id), 0)
+    ).where(
+        models.Quiz.user_id == user_id
+    )).one())
+
+
+def get_searchable_texts(db: Session, user_id: int):
+    quizes = select(
+        literal('quiz').label('kind'),
+        models.Quiz.id,
+        models.Quiz.id.label('quiz_id'),
+        models.Quiz.title.label('text')
+    ).where(
+        models.Quiz.user_id == user_id
+    )
+    questions = select(
+        literal('question').label('kind'),
+        models.Question.id,
+        models.Question.quiz_id,
+        models.Question.description.label('text')
+    ).join(
+        models.Quiz, models.Quiz.id == models.Question.quiz_id
+    ).where(
+        models.Quiz.user_id == user_id
+    )
+    return db.execute(union_all(quizes, questions)).all()
+
+
+# Full text search on PostgreSQL; the expressions match the GIN indexes
+# created by app.db.schema.
+@replica_read
+def search_quizes_and_questions(db: Session,
+                                user_id: int,
+                                text: str,
+                                offset: int,
+                                limit: int):
+    terms = tokenize(text)
+    if not terms:
+        return []
+    query = func.to_tsquery('simple', ' & '.join(f'{t}:*' for t in terms))
+    quiz_vector = func.to_tsvector('simple', models.Quiz.title)
+    question_vector = func.to_tsvector('simple', models.Question.description)
+    quizes = select(
+        literal('quiz').label('kind'),
+        models.Quiz.id,
+        models.Quiz.id.label('quiz_id'),
+        models.Quiz.title.label('text'),
+        func.ts_rank(quiz_vector, query).label('rank')
+    ).where(
+        models.Quiz.user_id == user_id
+    ).where(
+        quiz_vector.op('@@')(query)
+    )
+    questions = select(
+        literal('question').label('kind'),
+        models.Question.id,
+        models.Question.quiz_id,
+        models.Question.description.label('text'),
+        func.ts_rank(question_vector, query).label('rank')
+    ).join(
+        models.Quiz, models.Quiz.id == models.Question.quiz_id
+    ).where(
+        models.Quiz.user_id == user_id
+    ).where(
+        question_vector.op('@@')(query)
+    )
+    results = union_all(quizes, questions).subquery()
+    return db.execute(
+        select(results).order_by(
+            results.c.rank.desc(), results.c.kind, results.c.id
+        ).offset(offset).limit(limit)
+    ).all()
+
+
 # QUESTION
+def count_questions(db: Session, quiz_id: int):
+    return db.scalar(
+        select(func.count(models.Question.id)).where(
+            models.Question.quiz_id == quiz_id
+        )
+    )
+
+
+def get_quiz_questions(db: Session, quiz_id: int):
+    return db.query(models.Question).options(
+        selectinload(models.Question.answers)
+    ).filter(
+        models.Question.quiz_id == quiz_id
+    ).order_by(models.Question.id).all()
+
+
+# Only the questions a solve of a bank drew, found by ordinal.
+def get_drawn_questions(db: Session, db_quiz: models.Quiz, seed: int):
+    size = db.scalar(
+        select(func.max(models.Question.ordinal) + 1).where(
+            models.Question.quiz_id == db_quiz.id
+        )
+    ) or 0
+    return db.query(models.Question).options(
+        selectinload(models.Question.answers)
+    ).filter(
+        models.Question.quiz_id == db_quiz.id
+    ).filter(
+        models.Question.ordinal.in_(
+            draw_ordinals(seed, size, db_quiz.draw_count)
+        )
+    ).order_by(models.Question.ordinal).all()
+
+
 def create_question(db: Session,
                     question: schemas.QuestionBase,
                     quiz_id: int):
     db_quiz = models.Question(**question.dict(), quiz_id=quiz_id)
     db.add(db_quiz)
+    bump_quiz_version(db, quiz_id)
     db.commit()
     db.refresh(db_quiz)
     return db_quiz
 
 
 def get_question(db: Session, question_id: int, user_id: int):
-    return db.query(
-        models.Question
-    ).join(
+    return db.execute(lambda_stmt(lambda: select(models.Question).join(
         models.Quiz, models.Quiz.id == models.Question.quiz_id
-    ).join(
-        models.User, models.User.id == models.Quiz.user_id
-    ).filter(
-        models.Question.id == question_id
-    ).filter(
-        models.User.id == user_id
-    ).first()
+    ).where(
+        models.Question.id == question_id,
+        models.Quiz.user_id == user_id
+    ).limit(1))).scalars().first()
 
 
 def update_question(db: Session,
                     question: schemas.QuestionBase,
                     question_id: int):
+    bump_quiz_version(db, question_quiz_id(question_id))
     db.query(models.Question).filter(
         models.Question.id == question_id
     ).update(question)
@@ -106,6 +466,7 @@ def update_question(db: Session,
 
 
 def delete_question(db: Session, question_id: int):
+    bump_quiz_version(db, question_quiz_id(question_id))
     db.query(models.Question).filter(
         models.Question.id == question_id
     ).delete()
@@ -116,28 +477,25 @@ def delete_question(db: Session, question_id: int):
 def create_answer(db: Session, answer: schemas.AnswerCreate, question_id: int):
     db_quiz = models.Answer(**answer.dict(), question_id=question_id)
     db.add(db_quiz)
+    bump_quiz_version(db, question_quiz_id(question_id))
     db.commit()
     db.refresh(db_quiz)
     return db_quiz
 
 
 def get_answer(db: Session, answer_id: int, user_id):
-    return db.query(
-        models.Answer
-    ).join(
+    return db.execute(lambda_stmt(lambda: select(models.Answer).join(
         models.Question, models.Question.id == models.Answer.question_id
     ).join(
         models.Quiz, models.Quiz.id == models.Question.quiz_id
-    ).join(
-        models.User, models.User.id == models.Quiz.user_id
-    ).filter(
-        models.Answer.id == answer_id
-    ).filter(
-        models.User.id == user_id
-    ).first()
+    ).where(
+        models.Answer.id == answer_id,
+        models.Quiz.user_id == user_id
+    ).limit(1))).scalars().first()
 
 
 def update_answer(db: Session, answer: schemas.AnswerCreate, answer_id: int):
+    bump_quiz_version(db, answer_quiz_id(answer_id))
     db.query(models.Answer).filter(
         models.Answer.id == answer_id
     ).update(answer)
@@ -145,23 +503,134 @@ def update_answer(db: Session, answer: schemas.AnswerCreate, answer_id: int):
 
 
 def delete_answer(db: Session, answer_id: int):
+    bump_quiz_version(db, answer_quiz_id(answer_id))
     db.query(models.Answer).filter(models.Answer.id == answer_id).delete()
     db.commit()
 
 
+# OWNERSHIP
+# A question or answer with everything above it up to its quiz, in one
+# query by primary keys, or None when user_id doesn't own the quiz. The
+# result is kept in the session until it commits, so checking again within
+# a request costs nothing.
+def get_owned_question(db: Session, question_id: int, user_id: int):
+    answer_count = select(func.count(models.Answer.id)).where(
+        models.Answer.question_id == models.Question.id
+    ).scalar_subquery()
+    return cached_in_session(
+        db, ('question', question_id, user_id),
+        lambda: db.query(
+            models.Question, models.Quiz, answer_count.label('answer_count')
+        ).join(
+            models.Quiz, models.Quiz.id == models.Question.quiz_id
+        ).filter(
+            models.Question.id == question_id
+        ).filter(
+            models.Quiz.user_id == user_id
+        ).first()
+    )
+
+
+def get_owned_answer(db: Session, answer_id: int, user_id: int):
+    return cached_in_session(
+        db, ('answer', answer_id, user_id),
+        lambda: db.query(
+            models.Answer, models.Question, models.Quiz
+        ).join(
+            models.Question, models.Question.id == models.Answer.question_id
+        ).join(
+            models.Quiz, models.Quiz.id == models.Question.quiz_id
+        ).filter(
+            models.Answer.id == answer_id
+        ).filter(
+            models.Quiz.user_id == user_id
+        ).first()
+    )
+
+
+# Many at once, for POST /batch/get: one query per kind of entity, with
+# ownership checked for the whole set by the join.
+def get_owned_quizes(db: Session, quiz_ids: list, user_id: int):
+    return db.query(models.Quiz).options(
+        selectinload(models.Quiz.questions).selectinload(
+            models.Question.answers
+        )
+    ).filter(
+        models.Quiz.id.in_(quiz_ids)
+    ).filter(
+        models.Quiz.user_id == user_id
+    ).all()
+
+
+def get_owned_questions(db: Session, question_ids: list, user_id: int):
+    return db.query(models.Question).options(
+        selectinload(models.Question.answers)
+    ).join(
+        models.Quiz, models.Quiz.id == models.Question.quiz_id
+    ).filter(
+        models.Question.id.in_(question_ids)
+    ).filter(
+        models.Quiz.user_id == user_id
+    ).all()
+
+
+def get_owned_answers(db: Session, answer_ids: list, user_id: int):
+    return db.query(models.Answer).join(
+        models.Question, models.Question.id == models.Answer.question_id
+    ).join(
+        models.Quiz, models.Quiz.id == models.Question.quiz_id
+    ).filter(
+        models.Answer.id.in_(answer_ids)
+    ).filter(
+        models.Quiz.user_id == user_id
+    ).all()
+
+
+def cached_in_session(db: Session, key, load):
+    owned = db.info.setdefault('owned', {})
+    if key not in owned:
+        owned[key] = load()
+    return owned[key]
+
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def forget_owned(session):
+    session.info.pop('owned', None)
+
+
 # SOLVES
+OPEN_SOLVES_LOCK = 4001
+
+
+# ix_solves_open_user_id can't be unique once solves is partitioned, so
+# opening a solve then takes a lock per user instead, for the rest of the
+# transaction.
+def lock_open_solves(db: Session, user_id: int):
+    if solves_partitioned(db.get_bind()):
+        db.execute(select(func.pg_advisory_xact_lock(OPEN_SOLVES_LOCK,
+                                                     user_id)))
+
+
 def create_solve(db: Session, solve: schemas.SolveCreate):
     db_solve = models.Solve(
         user_id=solve.user_id,
         quiz_id=solve.quiz_id,
+        seed=solve.seed,
         start_datetime=datetime.utcnow().isoformat(),
     )
     db.add(db_solve)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another request opened a solve for this user first.
+        db.rollback()
+        return None
     db.refresh(db_solve)
     return db_solve
 
 
+# On the primary, so that a quiz just solved is never handed out again.
 def get_next_quiz_to_solve(db: Session, user_id: int):
     return db.query(
         models.Quiz
@@ -174,9 +643,15 @@ def get_next_quiz_to_solve(db: Session, user_id: int):
             (models.Quiz.id == models.Solve.quiz_id) &
             (models.Solve.user_id == user_id)
         )
+    ).filter(
+        ~ exists().where(
+            (models.Quiz.id == models.SolvedQuiz.quiz_id) &
+            (models.SolvedQuiz.user_id == user_id)
+        )
     ).first()
 
 
+@replica_read
 def get_finished_solves(db: Session, user_id: int):
     return db.query(models.Solve).filter(
         models.Solve.user_id == user_id
@@ -185,6 +660,7 @@ def get_finished_solves(db: Session, user_id: int):
     ).first()
 
 
+@replica_read
 def get_finished_solves_by_quiz(db: Session, quiz_id: int):
     return db.query(models.Solve).filter(
         models.Solve.quiz_id == quiz_id
@@ -193,6 +669,27 @@ def get_finished_solves_by_quiz(db: Session, quiz_id: int):
     ).all()
 
 
+# The finished solves of a quiz a leaderboard is built from, archived ones
+# included.
+def get_leaderboard_solves(db: Session, quiz_id: int):
+    solves = db.query(
+        models.Solve.id,
+        models.Solve.user_id,
+        models.Solve.quiz_score,
+        models.Solve.finish_datetime
+    ).filter(
+        models.Solve.quiz_id == quiz_id
+    ).filter(
+        (models.Solve.is_finished == True)
+    ).all()
+    return [
+        SimpleNamespace(id=record['id'], user_id=record['user_id'],
+                        quiz_score=record['quiz_score'],
+                        finish_datetime=record['finish_datetime'])
+        for record in get_archived_solves(db, quiz_id)
+    ] + solves
+
+
 def get_unfinished_solves(db: Session, user_id: int):
     return db.query(models.Solve).filter(
         models.Solve.user_id == user_id
@@ -202,29 +699,344 @@ def get_unfinished_solves(db: Session, user_id: int):
 
 
 def get_unfinished_solve(db: Session, solve_id: int, user_id: int):
-    return db.query(models.Solve).filter(
+    return db.execute(lambda_stmt(lambda: select(models.Solve).where(
+        models.Solve.id == solve_id,
+        models.Solve.user_id == user_id,
+        models.Solve.is_finished == False
+    ).limit(1))).scalars().first()
+
+
+def update_solve(db: Session, solve: schemas.Solve, solve_id: int,
+                 quiz_id: int):
+    updated = db.query(models.Solve).filter(
         models.Solve.id == solve_id
     ).filter(
-        models.Solve.user_id == user_id
+        models.Solve.quiz_id == quiz_id
     ).filter(
         models.Solve.is_finished == False
-    ).first()
+    ).update(solve)
+    if not updated:
+        # Finished by another request, or expired, in the meantime.
+        db.rollback()
+        return False
+    db.commit()
+    return True
 
 
-def update_solve(db: Session, solve: schemas.Solve, solve_id: int):
-    db.query(models.Solve).filter(models.Solve.id == solve_id).update(solve)
+def expire_open_solves(db: Session, started_before: str, limit: int):
+    expired = select(models.Solve.id).where(
+        models.Solve.is_finished == False
+    ).where(
+        models.Solve.start_datetime < started_before
+    ).limit(limit).with_for_update(skip_locked=True)
+    count = db.query(models.Solve).filter(
+        models.Solve.id.in_(expired)
+    ).delete(synchronize_session=False)
     db.commit()
+    return count
+
+
+# Unlike the functions above, these two do not commit: they run inside a
+# job, and the job row is deleted in the same transaction.
+def create_question_scores(db: Session, solve_id: int, quiz_id: int,
+                           question_scores: list):
+    db.bulk_insert_mappings(models.QuestionScore, [
+        {'solve_id': solve_id,
+         'quiz_id': quiz_id,
+         'question_id': qs['question_id'],
+         'score': qs['score']}
+        for qs in question_scores
+    ])
+
+
+def record_answer_selections(db: Session, quiz_id: int, answer_ids: list):
+    db.query(models.Quiz).filter(models.Quiz.id == quiz_id).update(
+        {'solve_count': models.Quiz.solve_count + 1},
+        synchronize_session=False
+    )
+    if answer_ids:
+        db.query(models.Answer).filter(models.Answer.id.in_(answer_ids)).update(
+            {'selection_count': models.Answer.selection_count + 1},
+            synchronize_session=False
+        )
 
 
 def create_question_score(db: Session,
                           question_id: int,
                           score: int,
-                          solve_id: int):
+                          solve_id: int,
+                          quiz_id: int):
     db_question_score = models.QuestionScore(
-        question_id=question_id, score=score, solve_id=solve_id
+        question_id=question_id, score=score, solve_id=solve_id,
+        quiz_id=quiz_id
     )
     db.add(db_question_score)
     db.commit()
     db.refresh(db_question_score)
     return db_question_score
 
+
+# ARCHIVE
+def get_archivable_solves(db: Session, finished_before: str, limit: int):
+    return db.query(models.Solve).options(
+        selectinload(models.Solve.question_score_rows),
+        selectinload(models.Solve.quiz).selectinload(models.Quiz.questions)
+    ).filter(
+        models.Solve.is_finished == True
+    ).filter(
+        models.Solve.finish_datetime < finished_before
+    ).order_by(
+        models.Solve.quiz_id, models.Solve.id
+    ).limit(limit).with_for_update(skip_locked=True).all()
+
+
+# Does not commit either: the archiver commits once the segment holding
+# these solves is on disk, and removes the segment if that fails. Blocks
+# are (quiz_id, offset, length, solves) tuples.
+def archive_solves(db: Session, segment: str, blocks: list):
+    db_blocks = [
+        models.ArchivedBlock(
+            quiz_id=quiz_id, segment=segment, offset=offset, length=length,
+            solve_count=len(solves),
+            last_finish_datetime=max(solve.finish_datetime
+                                     for solve in solves)
+        )
+        for quiz_id, offset, length, solves in blocks
+    ]
+    db.add_all(db_blocks)
+    db.flush()
+    solve_ids = [solve.id for _, _, _, solves in blocks for solve in solves]
+    db.execute(insert_ignoring_conflicts(db, models.SolvedQuiz.__table__), [
+        {'user_id': user_id, 'quiz_id': quiz_id, 'block_id': block_id}
+        for quiz_id, user_id, block_id in {
+            (db_block.quiz_id, solve.user_id, db_block.id)
+            for db_block, (_, _, _, solves) in zip(db_blocks, blocks)
+            for solve in solves
+        }
+    ])
+    db.query(models.QuestionScore).filter(
+        models.QuestionScore.solve_id.in_(solve_ids)
+    ).delete(synchronize_session=False)
+    db.query(models.Solve).filter(
+        models.Solve.id.in_(solve_ids)
+    ).delete(synchronize_session=False)
+
+
+# The archived solves of a quiz as dicts shaped like schemas.GetSolve, of
+# users that still exist.
+def get_archived_solves(db: Session, quiz_id: int):
+    blocks = db.query(models.ArchivedBlock).filter(
+        models.ArchivedBlock.quiz_id == quiz_id
+    ).order_by(models.ArchivedBlock.id).all()
+    if not blocks:
+        return []
+    user_ids = set(db.scalars(
+        select(models.SolvedQuiz.user_id).where(
+            models.SolvedQuiz.quiz_id == quiz_id
+        )
+    ))
+    archive = get_archive()
+    return [
+        record
+        for block in blocks
+        for record in archive.read(block.segment, block.offset,
+                                   block.length)
+        if record['user_id'] in user_ids
+    ]
+
+
+# The user's most recently archived solve, read from the one block that
+# holds it; solves archived before blocks were recorded search their quiz.
+def get_archived_solve(db: Session, user_id: int):
+    solved = db.query(models.SolvedQuiz).filter(
+        models.SolvedQuiz.user_id == user_id
+    ).order_by(
+        models.SolvedQuiz.block_id.is_(None),
+        models.SolvedQuiz.block_id.desc(),
+        models.SolvedQuiz.quiz_id.desc()
+    ).first()
+    if solved is None:
+        return None
+    if solved.block_id is None:
+        records = get_archived_solves(db, solved.quiz_id)
+    else:
+        block = db.get(models.ArchivedBlock, solved.block_id)
+        records = get_archive().read(block.segment, block.offset,
+                                     block.length)
+    for record in records:
+        if record['user_id'] == user_id:
+            return record
+    return None
+
+
+# OUTBOX
+OUTBOX_LOCK = 4002
+
+
+# Doesn't commit: the event belongs to the caller's transaction.
+# Flushed, so that its id can be referred to in the same transaction.
+def add_outbox_event(db: Session, kind: str, payload: dict):
+    db_event = models.OutboxEvent(
+        kind=kind,
+        payload=json.dumps(payload),
+        created_datetime=datetime.utcnow().isoformat()
+    )
+    db.add(db_event)
+    db.flush()
+    return db_event
+
+
+# Numbers the committed events that have no position yet, after the last
+# one numbered. Only one transaction numbers at a time, and it holds the
+# lock until it commits, so positions become visible in order.
+def relay_outbox_events(db: Session, limit: int):
+    if db.get_bind().dialect.name == 'postgresql':
+        if not db.scalar(select(func.pg_try_advisory_xact_lock(OUTBOX_LOCK))):
+            db.rollback()
+            return 0
+    event_ids = db.scalars(
+        select(models.OutboxEvent.id).where(
+            models.OutboxEvent.position == None
+        ).order_by(models.OutboxEvent.id).limit(limit)
+    ).all()
+    if event_ids:
+        last = db.scalar(select(func.max(models.OutboxEvent.position))) or 0
+        db.execute(
+            update(models.OutboxEvent.__table__).where(
+                models.OutboxEvent.__table__.c.id == bindparam('event_id')
+            ).values(position=bindparam('event_position')),
+            [{'event_id': event_id, 'event_position': last + number}
+             for number, event_id in enumerate(event_ids, 1)]
+        )
+    db.commit()
+    return len(event_ids)
+
+
+def get_outbox_events(db: Session, after: int, limit: int):
+    return db.query(models.OutboxEvent).filter(
+        models.OutboxEvent.position > after
+    ).order_by(models.OutboxEvent.position).limit(limit).all()
+
+
+def get_outbox_event(db: Session, event_id: int):
+    return db.query(models.OutboxEvent).filter(
+        models.OutboxEvent.id == event_id
+    ).first()
+
+
+def get_first_outbox_position(db: Session):
+    return db.scalar(select(func.min(models.OutboxEvent.position)))
+
+
+def get_last_outbox_position(db: Session):
+    return db.scalar(select(func.max(models.OutboxEvent.position)))
+
+
+# Deletes the oldest events, up to the first one created on or after
+# created_before, so the positions left are still contiguous.
+def delete_outbox_events(db: Session, created_before: str, limit: int):
+    rows = db.query(
+        models.OutboxEvent.position, models.OutboxEvent.created_datetime
+    ).filter(
+        models.OutboxEvent.position != None
+    ).order_by(models.OutboxEvent.position).limit(limit).all()
+    up_to = None
+    for row in rows:
+        if row.created_datetime >= created_before:
+            break
+        up_to = row.position
+    if up_to is None:
+        return 0
+    count = db.query(models.OutboxEvent).filter(
+        models.OutboxEvent.position <= up_to
+    ).delete(synchronize_session=False)
+    db.commit()
+    return count
+
+
+# JOBS
+def create_job(db: Session, kind: str, payload: dict):
+    now = datetime.utcnow().isoformat()
+    db_job = models.Job(
+        kind=kind,
+        payload=json.dumps(payload),
+        status='pending',
+        attempts=0,
+        created_datetime=now,
+        run_after=now
+    )
+    db.add(db_job)
+    db.flush()
+    return db_job
+
+
+def get_due_job_ids(db: Session, limit: int):
+    now = datetime.utcnow().isoformat()
+    rows = db.query(models.Job.id).filter(
+        models.Job.status != 'failed'
+    ).filter(
+        models.Job.run_after <= now
+    ).order_by(models.Job.run_after).limit(limit).all()
+    return [row.id for row in rows]
+
+
+def claim_job(db: Session, job_id: int, lease_seconds: float):
+    now = datetime.utcnow()
+    claimed = db.query(models.Job).filter(
+        models.Job.id == job_id
+    ).filter(
+        models.Job.status != 'failed'
+    ).filter(
+        models.Job.run_after <= now.isoformat()
+    ).update({
+        'status': 'running',
+        'attempts': models.Job.attempts + 1,
+        'run_after': (now + timedelta(seconds=lease_seconds)).isoformat()
+    }, synchronize_session=False)
+    db.commit()
+    if not claimed:
+        return None
+    return db.query(models.Job).filter(models.Job.id == job_id).first()
+
+
+# A run only finishes the job while it still holds its claim: once the lease
+# runs out the job can be claimed again, which bumps its attempts. Returns
+# False, and rolls back the run's work, when the claim was lost.
+def delete_job(db: Session, job_id: int, attempts: int):
+    deleted = db.query(models.Job).filter(
+        models.Job.id == job_id
+    ).filter(
+        models.Job.attempts == attempts
+    ).delete(synchronize_session=False)
+    if not deleted:
+        db.rollback()
+        return False
+    db.commit()
+    return True
+
+
+def retry_job(db: Session, job_id: int, attempts: int, error: str,
+              delay_seconds: float):
+    run_after = datetime.utcnow() + timedelta(seconds=delay_seconds)
+    db.query(models.Job).filter(
+        models.Job.id == job_id
+    ).filter(
+        models.Job.attempts == attempts
+    ).update({
+        'status': 'pending',
+        'last_error': error,
+        'run_after': run_after.isoformat()
+    }, synchronize_session=False)
+    db.commit()
+
+
+def fail_job(db: Session, job_id: int, attempts: int, error: str):
+    db.query(models.Job).filter(
+        models.Job.id == job_id
+    ).filter(
+        models.Job.attempts == attempts
+    ).update({
+        'status': 'failed',
+        'last_error': error
+    }, synchronize_session=False)
+    db.commit()
@@ -1,6 +1,9 @@
 from sqlalchemy.orm import relationship
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String
+from sqlalchemy import Boolean, Column, ForeignKey, Index, Integer, \
+    LargeBinary, String
 
+from app.helpers.banks import draw_ordinals
+from app.helpers.packing import unpack_scores
 from .database import Base
 
 
@@ -17,9 +20,15 @@ class User(Base):
 class Quiz(Base):
     __tablename__ = "quizes"
     id = Column(Integer, primary_key=True, index=True)
-    title = Column(String, index=True)
+    title = Column(String)
     is_active = Column(Boolean, default=False)
+    solve_count = Column(Integer, default=0, server_default='0')
+    # Bumped by every change to the quiz, its questions or its answers.
+    version = Column(Integer, default=1, server_default='1')
     user_id = Column(Integer, ForeignKey("users.id", ondelete='CASCADE'))
+    # Set for a question bank: each solve gets this many of its questions,
+    # drawn at random (see app.helpers.banks).
+    draw_count = Column(Integer, nullable=True)
     questions = relationship("Question", cascade="all, delete", backref="quiz")
     solves = relationship("Solve", cascade="all, delete", backref="quiz")
 
@@ -27,18 +36,26 @@ class Quiz(Base):
 class Question(Base):
     __tablename__ = "questions"
     id = Column(Integer, primary_key=True, index=True)
-    description = Column(String, index=True)
+    description = Column(String)
     single_correct_answer = Column(Boolean, default=True)
-    quiz_id = Column(Integer, ForeignKey("quizes.id", ondelete='CASCADE'))
+    quiz_id = Column(Integer, ForeignKey("quizes.id", ondelete='CASCADE'),
+                     index=True)
+    # 0, 1, 2... in id order within the quiz, set when it is published.
+    ordinal = Column(Integer, nullable=True)
     answers = relationship("Answer", cascade="all, delete", backref="question")
+    __table_args__ = (
+        Index('ix_questions_quiz_id_ordinal', quiz_id, ordinal),
+    )
 
 
 class Answer(Base):
     __tablename__ = "answers"
     id = Column(Integer, primary_key=True, index=True)
-    description = Column(String, index=True)
+    description = Column(String)
     is_correct = Column(Boolean, default=False)
-    question_id = Column(Integer, ForeignKey("questions.id", ondelete='CASCADE'))
+    selection_count = Column(Integer, default=0, server_default='0')
+    question_id = Column(Integer, ForeignKey("questions.id", ondelete='CASCADE'),
+                         index=True)
 
 
 class Solve(Base):
@@ -50,12 +67,126 @@ class Solve(Base):
     finish_datetime = Column(String, default='')
     is_finished = Column(Boolean, default=False)
     quiz_score = Column(Integer, default=0)
-    question_scores = relationship("QuestionScore", cascade="all, delete", backref="solve")
+    # One byte per question, in question id order (see app.helpers.packing).
+    packed_question_scores = Column(LargeBinary, nullable=True)
+    # The selected answers, one bit each (see app.helpers.packing).
+    packed_answers = Column(LargeBinary, nullable=True)
+    # Picks the questions of a bank this solve got; packed scores and
+    # selections cover only those.
+    seed = Column(Integer, nullable=True)
+    # Joined on quiz_id too, so it only reads one partition of the
+    # questionscores table when that is partitioned.
+    question_score_rows = relationship(
+        "QuestionScore", cascade="all, delete", backref="solve",
+        primaryjoin="and_(Solve.id == QuestionScore.solve_id, "
+                    "Solve.quiz_id == foreign(QuestionScore.quiz_id))"
+    )
+    __table_args__ = (
+        Index('ix_solves_quiz_id_finish_datetime', quiz_id, finish_datetime),
+        # A user has at most one open solve; the sweeper deletes the ones
+        # left open too long, so both indexes stay small.
+        Index('ix_solves_open_user_id', user_id, unique=True,
+              postgresql_where=is_finished == False,
+              sqlite_where=is_finished == False),
+        Index('ix_solves_open_start_datetime', start_datetime,
+              postgresql_where=is_finished == False,
+              sqlite_where=is_finished == False),
+    )
+
+    @property
+    def drawn_questions(self):
+        questions = self.quiz.questions
+        if self.seed is None:
+            return questions
+        drawn = set(draw_ordinals(self.seed, len(questions),
+                                  self.quiz.draw_count))
+        return [question for question in questions
+                if question.ordinal in drawn]
+
+    @property
+    def question_scores(self):
+        if self.packed_question_scores is None:
+            return self.question_score_rows
+        question_ids = sorted(question.id
+                              for question in self.drawn_questions)
+        return [
+            QuestionScore(id=0, solve_id=self.id, quiz_id=self.quiz_id,
+                          question_id=question_id, score=score)
+            for question_id, score in zip(
+                question_ids, unpack_scores(self.packed_question_scores)
+            )
+        ]
 
 
 class QuestionScore(Base):
     __tablename__ = "questionscores"
     id = Column(Integer, primary_key=True, index=True)
-    solve_id = Column(Integer, ForeignKey("solves.id", ondelete='CASCADE'))
+    solve_id = Column(Integer, ForeignKey("solves.id", ondelete='CASCADE'),
+                      index=True)
+    quiz_id = Column(Integer, nullable=True)
     question_id = Column(Integer)
     score = Column(Integer)
+
+
+# Quizes a user has solved whose solves were archived; dispatch checks it
+# along with the solves table.
+class SolvedQuiz(Base):
+    __tablename__ = "solvedquizes"
+    user_id = Column(Integer, ForeignKey("users.id", ondelete='CASCADE'),
+                     primary_key=True)
+    quiz_id = Column(Integer, ForeignKey("quizes.id", ondelete='CASCADE'),
+                     primary_key=True)
+    # The archived block holding the user's solve of the quiz.
+    block_id = Column(Integer, nullable=True)
+
+
+# Where the archived solves of a quiz are: a gzip member of `length` bytes
+# at `offset` in a segment file (see app.helpers.archive).
+class ArchivedBlock(Base):
+    __tablename__ = "archivedblocks"
+    id = Column(Integer, primary_key=True, index=True)
+    quiz_id = Column(Integer, ForeignKey("quizes.id", ondelete='CASCADE'),
+                     index=True)
+    segment = Column(String)
+    offset = Column(Integer)
+    length = Column(Integer)
+    solve_count = Column(Integer)
+    last_finish_datetime = Column(String)
+
+
+# Changes for consumers outside the app, written in the transaction that
+# makes them. The relay numbers them in commit order, so `position` only
+# ever grows as consumers read (see app.jobs.relay).
+class OutboxEvent(Base):
+    __tablename__ = "outboxevents"
+    id = Column(Integer, primary_key=True, index=True)
+    position = Column(Integer, nullable=True, unique=True)
+    kind = Column(String)
+    payload = Column(String, default='{}')
+    created_datetime = Column(String, default='')
+    __table_args__ = (
+        Index('ix_outboxevents_unrelayed', id,
+              postgresql_where=position == None,
+              sqlite_where=position == None),
+    )
+
+
+# A single row, written when the schema is created, so that what is kept
+# outside the database (such as the shared quiz cache) can tell it apart
+# from any other database, and from itself before it was created again.
+class Instance(Base):
+    __tablename__ = "instance"
+    id = Column(Integer, primary_key=True)
+    token = Column(String)
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String)
+    payload = Column(String, default='{}')
+    status = Column(String, default='pending')
+    attempts = Column(Integer, default=0)
+    last_error = Column(String, default='')
+    created_datetime = Column(String, default='')
+    run_after = Column(String, default='', index=True)
@@ -0,0 +1,83 @@
+from functools import lru_cache
+
+from sqlalchemy import text
+from sqlalchemy.schema import AddConstraint, CreateIndex
+
+from app.db import models
+from app.db.schema import BACKFILL_QUESTION_SCORES_QUIZ_ID
+
+PARTITIONED_TABLES = [models.Solve.__table__, models.QuestionScore.__table__]
+
+
+def is_partitioned(connection, table: str):
+    return connection.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table "
+        "WHERE partrelid = to_regclass(:table))"
+    ), {'table': table}).scalar()
+
+
+# Turns solves and questionscores into tables hash partitioned on quiz_id,
+# copying the rows over in one transaction. The primary keys become
+# (id, quiz_id), since PostgreSQL needs the partition key in every unique
+# constraint, and questionscores points at its solve through both columns.
+def partition_solves(bind, partitions: int = 16):
+    if bind.dialect.name != 'postgresql':
+        raise ValueError("Partitioned tables need PostgreSQL")
+    with bind.begin() as connection:
+        if is_partitioned(connection, 'solves'):
+            return False
+
+        def execute(statement):
+            connection.execute(text(statement))
+
+        execute("LOCK TABLE solves, questionscores IN ACCESS EXCLUSIVE MODE")
+        execute(BACKFILL_QUESTION_SCORES_QUIZ_ID)
+        for table in PARTITIONED_TABLES:
+            name = table.name
+            execute(f"CREATE TABLE {name}_partitioned "
+                    f"(LIKE {name} INCLUDING DEFAULTS) "
+                    f"PARTITION BY HASH (quiz_id)")
+            for remainder in range(partitions):
+                execute(f"CREATE TABLE {name}_p{remainder} "
+                        f"PARTITION OF {name}_partitioned FOR VALUES WITH "
+                        f"(MODULUS {partitions}, REMAINDER {remainder})")
+            execute(f"INSERT INTO {name}_partitioned SELECT * FROM {name}")
+            sequence = connection.execute(text(
+                f"SELECT pg_get_serial_sequence('{name}', 'id')"
+            )).scalar()
+            execute(f"ALTER SEQUENCE {sequence} "
+                    f"OWNED BY {name}_partitioned.id")
+        for table in reversed(PARTITIONED_TABLES):
+            execute(f"DROP TABLE {table.name}")
+        for table in PARTITIONED_TABLES:
+            execute(f"ALTER TABLE {table.name}_partitioned "
+                    f"RENAME TO {table.name}")
+            execute(f"ALTER TABLE {table.name} ADD CONSTRAINT "
+                    f"{table.name}_pkey PRIMARY KEY (id, quiz_id)")
+            for index in table.indexes:
+                statement = str(CreateIndex(index).compile(
+                    dialect=connection.dialect
+                ))
+                # A unique index on a partitioned table must include the
+                # partition key; per-user uniqueness of open solves is
+                # then kept by lock_open_solves in crud instead.
+                if index.unique and 'quiz_id' not in index.columns:
+                    statement = statement.replace('CREATE UNIQUE INDEX',
+                                                  'CREATE INDEX', 1)
+                execute(statement)
+            for constraint in table.foreign_key_constraints:
+                if constraint.referred_table is not models.Solve.__table__:
+                    connection.execute(AddConstraint(constraint))
+        execute("ALTER TABLE questionscores "
+                "ADD CONSTRAINT questionscores_solve_id_fkey "
+                "FOREIGN KEY (solve_id, quiz_id) "
+                "REFERENCES solves (id, quiz_id) ON DELETE CASCADE")
+    return True
+
+
+@lru_cache(maxsize=None)
+def solves_partitioned(bind):
+    if bind.dialect.name != 'postgresql':
+        return False
+    with bind.connect() as connection:
+        return is_partitioned(connection, 'solves')
@@ -0,0 +1,183 @@
+import functools
+import itertools
+import threading
+import time
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.sql.lambdas import StatementLambdaElement
+
+
+# Read replicas, picked round-robin. A replica is checked with a SELECT 1
+# at most every check_seconds and skipped for as long after a failed check
+# or a dropped connection.
+class ReplicaSet:
+    def __init__(self, engines: list, check_seconds: float = 5.0,
+                 sticky_seconds: float = 5.0):
+        self.engines = list(engines)
+        self.check_seconds = check_seconds
+        self.sticky_seconds = sticky_seconds
+        self._next = itertools.count()
+        self._checked = {}
+        self._down_until = {}
+        self._sticky = {}
+        self._lock = threading.Lock()
+        for engine in self.engines:
+            event.listen(engine, 'handle_error', self._on_error)
+
+    def _on_error(self, context):
+        if context.is_disconnect and context.engine in self.engines:
+            self.mark_down(context.engine)
+
+    def mark_down(self, engine):
+        with self._lock:
+            self._down_until[engine] = time.monotonic() + self.check_seconds
+
+    def is_healthy(self, engine):
+        now = time.monotonic()
+        with self._lock:
+            if self._down_until.get(engine, 0) > now:
+                return False
+            if now - self._checked.get(engine, -self.check_seconds) < \
+                    self.check_seconds:
+                return True
+            self._checked[engine] = now
+        try:
+            with engine.connect() as connection:
+                connection.execute(text('SELECT 1'))
+        except Exception:
+            self.mark_down(engine)
+            return False
+        return True
+
+    def choose(self):
+        for _ in self.engines:
+            engine = self.engines[next(self._next) % len(self.engines)]
+            if self.is_healthy(engine):
+                return engine
+        return None
+
+    # Users who just wrote read from the primary for sticky_seconds, so
+    # they see their own writes whatever the replication lag.
+    def stick(self, user_id: int):
+        now = time.monotonic()
+        with self._lock:
+            if len(self._sticky) > 10000:
+                self._sticky = {key: until
+                                for key, until in self._sticky.items()
+                                if until > now}
+            self._sticky[user_id] = now + self.sticky_seconds
+
+    def is_sticky(self, user_id):
+        with self._lock:
+            return self._sticky.get(user_id, 0) > time.monotonic()
+
+
+# Sends the SELECTs run inside a replica_read crud function to a replica.
+# Everything else, and every read once the session has written or while
+# its user or client is sticky, goes to the primary the session is bound
+# to. Lambda statements are routed by the statement they resolve to.
+class RoutingSession(Session):
+    def __init__(self, replicas: ReplicaSet = None, **kw):
+        super().__init__(**kw)
+        self.replicas = replicas
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        # _resolved is SQLAlchemy 1.4's (private) statement a lambda
+        # statement stands for; requirements.txt pins sqlalchemy~=1.4.
+        if isinstance(clause, StatementLambdaElement):
+            clause = clause._resolved
+        if self._flushing or isinstance(clause, UpdateBase):
+            self.info['wrote'] = True
+        elif self.reads_from_replica(clause):
+            replica = self.replicas.choose()
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, **kw)
+
+    def reads_from_replica(self, clause):
+        return (
+            self.replicas is not None and
+            self.info.get('replica_reads', 0) > 0 and
+            not self.info.get('wrote') and
+            isinstance(clause, Select) and
+            clause._for_update_arg is None and
+            not self.replicas.is_sticky(self.info.get('user_id')) and
+            not self.client_wrote_recently()
+        )
+
+    # The request's state, when there is one, carries the time its client
+    # last wrote through any worker (see WriteTimeMiddleware).
+    def client_wrote_recently(self):
+        state = self.info.get('request_state') or {}
+        last_write = state.get('last_write')
+        return last_write is not None and \
+            time.time() - last_write < self.replicas.sticky_seconds
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def stick_after_write(session):
+    if not session.info.get('wrote') or not session.replicas:
+        return
+    user_id = session.info.get('user_id')
+    if user_id:
+        session.replicas.stick(user_id)
+    state = session.info.get('request_state')
+    if state is not None:
+        state['wrote_at'] = time.time()
+
+
+# Carries the time a client last wrote between workers, in a signed
+# cookie: it is read into the request's state before the endpoint runs,
+# and set again on a response whose request wrote. `sign(when)` and
+# `verify(value)` (None when the signature is wrong) do the signing.
+class WriteTimeMiddleware:
+    def __init__(self, app, sign, verify, cookie: str = 'last_write',
+                 max_age: int = 60):
+        self.app = app
+        self.sign = sign
+        self.verify = verify
+        self.cookie = cookie
+        self.max_age = max_age
+
+    def last_write(self, scope):
+        for name, value in scope['headers']:
+            if name != b'cookie':
+                continue
+            for morsel in value.decode('latin-1').split(';'):
+                key, _, value = morsel.strip().partition('=')
+                if key == self.cookie:
+                    return self.verify(value)
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        state = scope.setdefault('state', {})
+        state['last_write'] = self.last_write(scope)
+
+        async def send_with_cookie(message):
+            if message['type'] == 'http.response.start' and \
+                    state.get('wrote_at') is not None:
+                cookie = f'{self.cookie}={self.sign(state["wrote_at"])}; ' \
+                         f'Max-Age={self.max_age}; Path=/; HttpOnly; ' \
+                         f'SameSite=Lax'
+                message['headers'] = list(message.get('headers', [])) + \
+                    [(b'set-cookie', cookie.encode('latin-1'))]
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
+
+
+def replica_read(function):
+    @functools.wraps(function)
+    def wrapper(db, *args, **kwargs):
+        depth = db.info.get('replica_reads', 0)
+        db.info['replica_reads'] = depth + 1
+        try:
+            return function(db, *args, **kwargs)
+        finally:
+            db.info['replica_reads'] = depth
+    return wrapper
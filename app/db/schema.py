@@ -0,0 +1,109 @@
+import secrets
+import warnings
+
+from sqlalchemy import exc, inspect, text
+
+from app.db import models
+
+# Question scores carry the quiz_id of their solve, so that both tables can
+# be partitioned on it (see app.db.partitioning).
+BACKFILL_QUESTION_SCORES_QUIZ_ID = (
+    "UPDATE questionscores SET quiz_id = ("
+    "SELECT solves.quiz_id FROM solves "
+    "WHERE solves.id = questionscores.solve_id"
+    ") WHERE quiz_id IS NULL"
+)
+
+# Run after create_all, so they also bring existing databases up to date.
+# Each one must be safe to run again.
+UPGRADES = [
+    # B-tree indexes on long free text, replaced by the search indexes.
+    "DROP INDEX IF EXISTS ix_quizes_title",
+    "DROP INDEX IF EXISTS ix_questions_description",
+    "DROP INDEX IF EXISTS ix_answers_description",
+    BACKFILL_QUESTION_SCORES_QUIZ_ID,
+]
+
+# Before ix_solves_open_user_id exists, a user can have several open
+# solves. Only the latest is kept, as if the sweeper had expired the others.
+EXPIRE_DUPLICATE_OPEN_SOLVES = (
+    "DELETE FROM solves WHERE NOT is_finished AND id NOT IN "
+    "(SELECT max(id) FROM solves WHERE NOT is_finished GROUP BY user_id)"
+)
+
+INSERT_INSTANCE_TOKEN = (
+    "INSERT INTO instance (token) SELECT :token "
+    "WHERE NOT EXISTS (SELECT 1 FROM instance)"
+)
+
+POSTGRES_UPGRADES = [
+    "CREATE INDEX IF NOT EXISTS ix_quizes_title_search ON quizes "
+    "USING gin (to_tsvector('simple', title))",
+    "CREATE INDEX IF NOT EXISTS ix_questions_description_search "
+    "ON questions USING gin (to_tsvector('simple', description))",
+]
+
+
+# Columns added to a model after its table was created. They must be
+# nullable (or have a server default) to be added to existing rows.
+def missing_column_statements(bind):
+    inspector = inspect(bind)
+    statements = []
+    for table in models.Base.metadata.sorted_tables:
+        existing = {column['name'] for column in inspector.get_columns(
+            table.name
+        )}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            statement = f'ALTER TABLE {table.name} ' \
+                        f'ADD COLUMN {column.name} ' \
+                        f'{column.type.compile(dialect=bind.dialect)}'
+            if column.server_default is not None:
+                statement += f" DEFAULT {column.server_default.arg}"
+            statements.append(statement)
+    return statements
+
+
+# Indexes added to a model after its table was created; create_all only
+# creates the indexes of new tables.
+def missing_indexes(bind):
+    inspector = inspect(bind)
+    with warnings.catch_warnings():
+        # The expression indexes used by search can't be reflected.
+        warnings.simplefilter('ignore', exc.SAWarning)
+        existing = {
+            index['name']
+            for table in models.Base.metadata.sorted_tables
+            for index in inspector.get_indexes(table.name)
+        }
+    return [index
+            for table in models.Base.metadata.sorted_tables
+            for index in table.indexes
+            if index.name not in existing]
+
+
+# Returns the number of open solves expired to create
+# ix_solves_open_user_id, which is only ever done once.
+def create_schema(bind):
+    models.Base.metadata.create_all(bind=bind)
+    statements = missing_column_statements(bind) + UPGRADES
+    if bind.dialect.name == 'postgresql':
+        statements += POSTGRES_UPGRADES
+    expired = 0
+    with bind.begin() as connection:
+        for statement in statements:
+            connection.execute(text(statement))
+        for index in missing_indexes(bind):
+            if index.name == 'ix_solves_open_user_id':
+                expired = connection.execute(
+                    text(EXPIRE_DUPLICATE_OPEN_SOLVES)
+                ).rowcount
+            index.create(connection)
+        connection.execute(text(INSERT_INSTANCE_TOKEN),
+                           {'token': secrets.token_hex(16)})
+    return expired
+
+
+def drop_schema(bind):
+    models.Base.metadata.drop_all(bind=bind)
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, validator
 
 
 class Token(BaseModel):
@@ -54,6 +54,7 @@ class Question(QuestionBase):
 
 class QuizBase(BaseModel):
     title: str
+    draw_count: int = Field(None, ge=1)
 
     class Config:
         orm_mode = True
@@ -69,6 +70,89 @@ class Quiz(QuizUpdate):
     questions: list[Question] = []
 
 
+class BatchGet(BaseModel):
+    quiz_ids: list[int] = []
+    question_ids: list[int] = []
+    answer_ids: list[int] = []
+
+
+class BatchResult(BaseModel):
+    quizes: list[Quiz] = []
+    questions: list[Question] = []
+    answers: list[Answer] = []
+    # Ids not found, or not owned by the user.
+    missing: BatchGet
+
+
+class ChangeEvent(BaseModel):
+    position: int
+    kind: str
+    created_datetime: str
+    data: dict
+
+
+class ChangeBatch(BaseModel):
+    events: list[ChangeEvent]
+    # The cursor for the next batch.
+    after: int
+
+
+# PATCH /quizes/{quiz_id}: everything a draft quiz editor changed, applied
+# at once. Fields left out of an update keep their value; the ones that
+# can't be NULL can't be sent as null either.
+def not_null(value):
+    if value is None:
+        raise ValueError("can be left out, but not null")
+    return value
+
+
+class QuestionAdd(QuestionBase):
+    answers: list[AnswerCreate] = []
+
+
+class QuestionPatch(BaseModel):
+    id: int
+    description: str = None
+    single_correct_answer: bool = None
+
+    _not_null = validator('description', 'single_correct_answer', pre=True,
+                          allow_reuse=True)(not_null)
+
+
+class AnswerAdd(AnswerCreate):
+    question_id: int
+
+
+class AnswerPatch(BaseModel):
+    id: int
+    description: str = None
+    is_correct: bool = None
+
+    _not_null = validator('description', 'is_correct', pre=True,
+                          allow_reuse=True)(not_null)
+
+
+class QuestionChanges(BaseModel):
+    add: list[QuestionAdd] = []
+    update: list[QuestionPatch] = []
+    remove: list[int] = []
+
+
+class AnswerChanges(BaseModel):
+    add: list[AnswerAdd] = []
+    update: list[AnswerPatch] = []
+    remove: list[int] = []
+
+
+class QuizPatch(BaseModel):
+    title: str = None
+    draw_count: int = Field(None, ge=1)
+    questions: QuestionChanges = QuestionChanges()
+    answers: AnswerChanges = AnswerChanges()
+
+    _not_null = validator('title', pre=True, allow_reuse=True)(not_null)
+
+
 class UserBase(BaseModel):
     email: str
 
@@ -152,3 +236,37 @@ class GetSolve(BaseModel):
     class Config:
         orm_mode = True
 
+
+class LeaderboardEntry(BaseModel):
+    rank: int
+    solve_id: int
+    user_id: int
+    quiz_score: int
+    finish_datetime: str
+
+
+class SearchResult(BaseModel):
+    kind: str
+    id: int
+    quiz_id: int
+    text: str
+    rank: float
+
+    class Config:
+        orm_mode = True
+
+
+class AnswerStats(BaseModel):
+    question_id: int
+    answer_id: int
+    is_correct: bool
+    selections: int
+    selection_rate: float
+
+
+class UserStatus(BaseModel):
+    row: int
+    email: str
+    status: str
+    id: int = None
+    detail: str = None
@@ -0,0 +1,144 @@
+import asyncio
+import contextvars
+import cProfile
+import functools
+import json
+import os
+import random
+import re
+import time
+import uuid
+
+from fastapi import HTTPException
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.auth.auth_handler import admin_emails, decode_jwt
+
+current_profile = contextvars.ContextVar('current_profile', default=None)
+
+
+class RequestProfile:
+    def __init__(self, reason: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.reason = reason
+        self.route = None
+        self.queries = 0
+        self.profiler = None
+        self.handler_seconds = 0.0
+
+
+def count_query(conn, cursor, statement, parameters, context, executemany):
+    profile = current_profile.get()
+    if profile is not None:
+        profile.queries += 1
+
+
+def profiled(call, path: str):
+    @functools.wraps(call)
+    def wrapper(**kwargs):
+        profile = current_profile.get()
+        if profile is None:
+            return call(**kwargs)
+        profile.route = path
+        profile.profiler = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            return profile.profiler.runcall(call, **kwargs)
+        finally:
+            profile.handler_seconds = time.perf_counter() - start
+    return wrapper
+
+
+# Route class that lets a profiled request run its handler under cProfile.
+# Sync handlers run in a worker thread, so the profiler has to be started
+# there rather than in the middleware.
+class ProfiledRoute(APIRoute):
+    def get_route_handler(self):
+        call = self.dependant.call
+        if not asyncio.iscoroutinefunction(call) and \
+                not hasattr(call, '__wrapped__'):
+            self.dependant.call = profiled(call, self.path)
+        return super().get_route_handler()
+
+
+def is_admin_request(headers: dict):
+    scheme, _, token = headers.get(b'authorization', b'').decode() \
+        .partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        return False
+    try:
+        return decode_jwt(token).get('sub') in admin_emails()
+    except HTTPException:
+        return False
+
+
+class ProfilingMiddleware:
+    def __init__(self, app, directory: str, sample_rate: float = 0.0,
+                 header: str = 'x-profile'):
+        self.app = app
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.header = header.encode()
+        if not event.contains(Engine, 'before_cursor_execute', count_query):
+            event.listen(Engine, 'before_cursor_execute', count_query)
+
+    def reason(self, scope):
+        headers = dict(scope['headers'])
+        if headers.get(self.header) and is_admin_request(headers):
+            return 'requested'
+        if self.sample_rate and random.random() < self.sample_rate:
+            return 'sampled'
+        return None
+
+    async def __call__(self, scope, receive, send):
+        reason = self.reason(scope) if scope['type'] == 'http' else None
+        if reason is None:
+            return await self.app(scope, receive, send)
+
+        profile = RequestProfile(reason)
+        status = []
+
+        async def send_with_profile_id(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+                message['headers'] = list(message.get('headers', [])) + \
+                    [(b'x-profile-id', profile.id.encode())]
+            await send(message)
+
+        token = current_profile.set(profile)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            current_profile.reset(token)
+            self.save(profile, scope, status[0] if status else 500,
+                      time.perf_counter() - start)
+
+    def save(self, profile: RequestProfile, scope, status: int,
+             seconds: float):
+        os.makedirs(self.directory, exist_ok=True)
+        route = profile.route or scope['path']
+        name = '{}-{}-{}-{}'.format(
+            time.strftime('%Y%m%dT%H%M%S'),
+            scope['method'],
+            re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root',
+            profile.id
+        )
+        path = os.path.join(self.directory, name)
+        if profile.profiler is not None:
+            profile.profiler.dump_stats(path + '.prof')
+        with open(path + '.json', 'w') as f:
+            json.dump({
+                'id': profile.id,
+                'reason': profile.reason,
+                'method': scope['method'],
+                'route': route,
+                'path': scope['path'],
+                'status': status,
+                'queries': profile.queries,
+                'total_ms': round(seconds * 1000, 3),
+                'handler_ms': round(profile.handler_seconds * 1000, 3),
+                'stats': name + '.prof' if profile.profiler else None,
+            }, f, indent=2)
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import logging
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+CRUD_MODULE = 'app.db.crud'
+
+
+def normalize(statement: str):
+    statement = re.sub(r"'(?:[^']|'')*'", '?', statement)
+    statement = re.sub(r'%\(\w+\)s', '?', statement)
+    statement = re.sub(r'\b\d+(?:\.\d+)?\b', '?', statement)
+    statement = re.sub(r'\(\s*\?(?:\s*,\s*\?)+\s*\)', '(?, ...)', statement)
+    return re.sub(r'\s+', ' ', statement).strip()
+
+
+def parameters_shape(parameters, executemany: bool):
+    if executemany:
+        return {'rows': len(parameters),
+                'row': parameters_shape(parameters[0], False)
+                if parameters else None}
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__
+                for key, value in sorted(parameters.items())}
+    return [type(value).__name__ for value in parameters or ()]
+
+
+def calling_crud_function():
+    frame = sys._getframe(1)
+    while frame is not None:
+        if frame.f_globals.get('__name__') == CRUD_MODULE:
+            return frame.f_code.co_name
+        frame = frame.f_back
+    return None
+
+
+def explain(cursor, dialect: str, statement: str, parameters):
+    if dialect == 'postgresql':
+        sql = 'EXPLAIN (ANALYZE off) ' + statement
+    elif dialect == 'sqlite':
+        sql = 'EXPLAIN QUERY PLAN ' + statement
+    else:
+        return None
+    connection = cursor.connection
+    explain_cursor = connection.cursor()
+    try:
+        # A failed statement aborts the whole transaction on Postgres, so
+        # the EXPLAIN runs in a savepoint that is rolled back either way.
+        if dialect == 'postgresql':
+            explain_cursor.execute('SAVEPOINT slow_query_explain')
+        try:
+            explain_cursor.execute(sql, parameters)
+            rows = explain_cursor.fetchall()
+        finally:
+            if dialect == 'postgresql':
+                explain_cursor.execute(
+                    'ROLLBACK TO SAVEPOINT slow_query_explain'
+                )
+                explain_cursor.execute('RELEASE SAVEPOINT slow_query_explain')
+    except Exception as error:
+        return [f'EXPLAIN failed: {error}']
+    finally:
+        explain_cursor.close()
+    return [' '.join(str(column) for column in row) if len(row) > 1
+            else str(row[0]) for row in rows]
+
+
+# Statements slower than the threshold are logged as one JSON line each and
+# summarized by shape: literals and bound parameters are replaced with ?, so
+# the same crud query with other ids counts as the same statement.
+class SlowQueryLog:
+    def __init__(self, threshold_ms: float = 100.0, explain: bool = True,
+                 maxsize: int = 200):
+        self.threshold_ms = threshold_ms
+        self.explain = explain
+        self.maxsize = maxsize
+        self._statements = OrderedDict()
+        self._lock = threading.Lock()
+        if threshold_ms >= 0:
+            event.listen(Engine, 'before_cursor_execute', self.before_execute)
+            event.listen(Engine, 'after_cursor_execute', self.after_execute)
+
+    @staticmethod
+    def before_execute(conn, cursor, statement, parameters, context,
+                       executemany):
+        context._slow_query_start = time.perf_counter()
+
+    def after_execute(self, conn, cursor, statement, parameters, context,
+                      executemany):
+        start = getattr(context, '_slow_query_start', None)
+        if start is None:
+            return
+        duration_ms = (time.perf_counter() - start) * 1000
+        if duration_ms < self.threshold_ms:
+            return
+        sql = normalize(statement)
+        fingerprint = hashlib.sha1(sql.encode()).hexdigest()[:12]
+        record = {
+            'fingerprint': fingerprint,
+            'statement': sql,
+            'parameters': parameters_shape(parameters, executemany),
+            'duration_ms': round(duration_ms, 3),
+            'function': calling_crud_function(),
+        }
+        with self._lock:
+            summary = self._statements.get(fingerprint)
+            first = summary is None
+            if first:
+                summary = self._statements[fingerprint] = {
+                    'fingerprint': fingerprint,
+                    'statement': sql,
+                    'functions': [],
+                    'count': 0,
+                    'total_ms': 0.0,
+                    'max_ms': 0.0,
+                    'parameters': record['parameters'],
+                    'plan': None,
+                }
+                if len(self._statements) > self.maxsize:
+                    self._statements.popitem(last=False)
+            self._statements.move_to_end(fingerprint)
+            summary['count'] += 1
+            summary['total_ms'] += duration_ms
+            summary['max_ms'] = max(summary['max_ms'], duration_ms)
+            if record['function'] and \
+                    record['function'] not in summary['functions']:
+                summary['functions'].append(record['function'])
+        if first and self.explain and not executemany and \
+                re.match(r'\s*(SELECT|WITH)\b', statement, re.IGNORECASE):
+            summary['plan'] = record['plan'] = explain(
+                cursor, conn.dialect.name, statement, parameters
+            )
+        logger.warning(json.dumps(record, default=str))
+
+    def close(self):
+        if event.contains(Engine, 'after_cursor_execute', self.after_execute):
+            event.remove(Engine, 'before_cursor_execute', self.before_execute)
+            event.remove(Engine, 'after_cursor_execute', self.after_execute)
+
+    def summary(self):
+        with self._lock:
+            statements = [dict(item, functions=list(item['functions']))
+                          for item in self._statements.values()]
+        for item in statements:
+            item['mean_ms'] = round(item['total_ms'] / item['count'], 3)
+            item['total_ms'] = round(item['total_ms'], 3)
+            item['max_ms'] = round(item['max_ms'], 3)
+        return sorted(statements, key=lambda item: -item['total_ms'])
+
+    def clear(self):
+        with self._lock:
+            self._statements.clear()
@@ -0,0 +1,195 @@
+import asyncio
+import json
+import logging
+import select
+import threading
+from collections import defaultdict
+
+from sqlalchemy import event, func
+from sqlalchemy import select as sql_select
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'quiz_events'
+# PostgreSQL rejects NOTIFY payloads of 8000 bytes or more.
+MAX_NOTIFY_PAYLOAD = 7999
+
+
+class Subscription:
+    def __init__(self, topic: str, maxsize: int):
+        self.topic = topic
+        self.dropped = 0
+        self._loop = asyncio.get_running_loop()
+        self._events = asyncio.Queue(maxsize)
+
+    # Called from any thread. A slow reader loses its oldest events rather
+    # than holding up the others; it is told how many it missed.
+    def put(self, data):
+        self._loop.call_soon_threadsafe(self._put, data)
+
+    def _put(self, data):
+        if self._events.full():
+            self._events.get_nowait()
+            self.dropped += 1
+        self._events.put_nowait(data)
+
+    async def get(self, timeout: float = None):
+        return await asyncio.wait_for(self._events.get(), timeout)
+
+
+# Fans events out to the streams open in this process. On PostgreSQL,
+# events are sent with NOTIFY in the publishing transaction instead, and a
+# LISTEN thread per worker delivers them, so every worker's subscribers get
+# them once the transaction commits. An event too large for NOTIFY is sent
+# as the reference it was published with, and each listener loads it with
+# fetch(bind, reference); without one it only reaches this process, which
+# is logged and counted in local_only.
+class EventHub:
+    def __init__(self, buffer_size: int = 100, notify: bool = True,
+                 fetch=None):
+        self.buffer_size = buffer_size
+        self.notify = notify
+        self.fetch = fetch
+        self.local_only = 0
+        self._subscriptions = defaultdict(set)
+        self._listeners = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def subscribe(self, topic: str):
+        subscription = Subscription(topic, self.buffer_size)
+        with self._lock:
+            self._subscriptions[topic].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.topic)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.topic]
+
+    def subscribers(self, topic: str):
+        with self._lock:
+            return len(self._subscriptions.get(topic, ()))
+
+    def deliver(self, topic: str, data):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(topic, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.put(data)
+            except RuntimeError:
+                # Its event loop has already closed.
+                self.unsubscribe(subscription)
+
+    def publish(self, db: Session, topic: str, event_data: dict,
+                reference=None):
+        data = json.dumps(event_data)
+        if self.uses_notify(db.get_bind()):
+            message = json.dumps({'topic': topic, 'data': data})
+            if len(message.encode()) > MAX_NOTIFY_PAYLOAD and \
+                    reference is not None and self.fetch is not None:
+                message = json.dumps({'topic': topic,
+                                      'reference': reference})
+            if len(message.encode()) <= MAX_NOTIFY_PAYLOAD:
+                db.execute(sql_select(func.pg_notify(CHANNEL, message)))
+                return
+            self.local_only += 1
+            logger.warning("Event on %s is too large for NOTIFY (%d bytes); "
+                           "only streams in this worker get it",
+                           topic, len(message.encode()))
+        if 'pending_events' not in db.info:
+            db.info['pending_events'] = []
+            event.listen(db, 'after_commit', self._after_commit)
+            event.listen(db, 'after_rollback', self._after_rollback)
+        db.info['pending_events'].append((topic, data))
+
+    def _after_commit(self, db: Session):
+        events, db.info['pending_events'] = db.info['pending_events'], []
+        for topic, data in events:
+            self.deliver(topic, data)
+
+    @staticmethod
+    def _after_rollback(db: Session):
+        db.info['pending_events'] = []
+
+    def uses_notify(self, bind):
+        return self.notify and bind.dialect.name == 'postgresql'
+
+    def listen(self, bind):
+        if not self.uses_notify(bind):
+            return
+        with self._lock:
+            if bind in self._listeners:
+                return
+            self._stopping.clear()
+            # LISTEN before returning, so nothing published after a
+            # subscribe is missed.
+            connection = self._connect(bind)
+            thread = threading.Thread(target=self._listen,
+                                      args=(bind, connection),
+                                      name='event-listener',
+                                      daemon=True)
+            self._listeners[bind] = thread
+            thread.start()
+
+    @staticmethod
+    def _connect(bind):
+        pooled = bind.raw_connection()
+        pooled.detach()
+        connection = pooled.connection
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            cursor.execute(f'LISTEN {CHANNEL}')
+        return connection
+
+    def _listen(self, bind, connection):
+        while not self._stopping.is_set():
+            try:
+                if connection is None:
+                    connection = self._connect(bind)
+                if select.select([connection], [], [], 1.0) == ([], [], []):
+                    continue
+                connection.poll()
+                while connection.notifies:
+                    message = json.loads(connection.notifies.pop(0).payload)
+                    self._deliver_message(bind, message)
+            except Exception:
+                logger.exception("Event listener lost its connection")
+                if connection is not None:
+                    connection.close()
+                connection = None
+                self._stopping.wait(1.0)
+        if connection is not None:
+            connection.close()
+
+    def _deliver_message(self, bind, message: dict):
+        if 'reference' not in message:
+            self.deliver(message['topic'], message['data'])
+            return
+        try:
+            data = json.dumps(self.fetch(bind, message['reference']))
+        except Exception:
+            logger.exception("Could not load event %s on %s",
+                             message['reference'], message['topic'])
+            return
+        self.deliver(message['topic'], data)
+
+    # Ends every open stream, e.g. on shutdown.
+    def close(self):
+        with self._lock:
+            subscriptions = [subscription
+                             for topic in self._subscriptions.values()
+                             for subscription in topic]
+            listeners, self._listeners = list(self._listeners.values()), {}
+        self._stopping.set()
+        for subscription in subscriptions:
+            try:
+                subscription.put(None)
+            except RuntimeError:
+                pass
+        for thread in listeners:
+            thread.join(5.0)
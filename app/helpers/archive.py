@@ -0,0 +1,80 @@
+import gzip
+import json
+import mmap
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import lru_cache
+
+from decouple import config
+
+
+# Archived solves, in segment files written once and never changed. Each
+# block (the solves of one quiz) is a gzip member of its own, so a block is
+# read on its own from its offset while `zcat` still reads whole segments
+# as NDJSON. Segments are memory-mapped, and the most recently used ones
+# stay mapped.
+class SegmentStore:
+    def __init__(self, directory: str, max_open: int = 64):
+        self.directory = directory
+        self.max_open = max_open
+        self._maps = OrderedDict()
+        self._lock = threading.Lock()
+
+    def path(self, name: str):
+        return os.path.join(self.directory, name)
+
+    # Blocks are (key, records) pairs; returns the segment name and the
+    # (key, offset, length) of each block.
+    def write(self, blocks: list):
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}" \
+               f".ndjson.gz"
+        tmp_path = self.path(name + '.tmp')
+        index = []
+        with open(tmp_path, 'wb') as f:
+            for key, records in blocks:
+                data = gzip.compress(b''.join(
+                    json.dumps(record, separators=(',', ':')).encode() +
+                    b'\n' for record in records
+                ))
+                index.append((key, f.tell(), len(data)))
+                f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path(name))
+        return name, index
+
+    def read(self, name: str, offset: int, length: int):
+        data = gzip.decompress(self._map(name)[offset:offset + length])
+        return [json.loads(line) for line in data.splitlines()]
+
+    def _map(self, name: str):
+        with self._lock:
+            mapped = self._maps.get(name)
+            if mapped is not None:
+                self._maps.move_to_end(name)
+                return mapped
+            with open(self.path(name), 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[name] = mapped
+            if len(self._maps) > self.max_open:
+                self._maps.popitem(last=False)[1].close()
+            return mapped
+
+    def remove(self, name: str):
+        with self._lock:
+            mapped = self._maps.pop(name, None)
+            if mapped is not None:
+                mapped.close()
+        try:
+            os.remove(self.path(name))
+        except FileNotFoundError:
+            pass
+
+
+@lru_cache(maxsize=None)
+def get_archive():
+    return SegmentStore(config('ARCHIVE_DIR', default='archive'))
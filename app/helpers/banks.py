@@ -0,0 +1,63 @@
+import random
+from types import SimpleNamespace
+
+from decouple import config
+
+from app.db import schemas
+
+# A quiz without draw_count has at most 10 questions.
+MAX_QUESTIONS = config('BANK_MAX_QUESTIONS', default=5000, cast=int)
+
+
+def draw_seed():
+    return random.getrandbits(31)
+
+
+# The ordinals of the questions a solve gets, from its seed. From a bank
+# much bigger than the draw, random.sample picks positions without copying
+# the range, so this is O(count) however big the bank is.
+def draw_ordinals(seed: int, size: int, count: int):
+    return sorted(random.Random(seed).sample(range(size), min(count, size)))
+
+
+# A published bank, built once per quiz version: each question serialized
+# as the solver sees it, and its answer key, both indexed by ordinal.
+# Serving or scoring a solve then only touches its own questions.
+class CompiledBank:
+    def __init__(self, db_quiz, questions: list):
+        self.draw_count = db_quiz.draw_count
+        header = schemas.Quiz(
+            id=db_quiz.id, title=db_quiz.title, is_active=db_quiz.is_active,
+            draw_count=db_quiz.draw_count, user_id=db_quiz.user_id,
+            questions=[]
+        ).json().encode()
+        # questions is the last field; its [] is filled in per solve.
+        self.header = header[:-len(b'[]}')]
+        self.fragments = []
+        self.keys = []
+        for ordinal, question in enumerate(questions):
+            if question.ordinal != ordinal:
+                raise ValueError(f"Quiz {db_quiz.id}: ordinals aren't dense")
+            self.fragments.append(
+                schemas.Question.from_orm(question).json().encode()
+            )
+            self.keys.append(SimpleNamespace(
+                id=question.id,
+                single_correct_answer=question.single_correct_answer,
+                answers=[
+                    SimpleNamespace(id=answer.id, is_correct=answer.is_correct)
+                    for answer in sorted(question.answers,
+                                         key=lambda a: a.id)
+                ]
+            ))
+
+    def draw(self, seed: int):
+        return draw_ordinals(seed, len(self.keys), self.draw_count)
+
+    def questions(self, seed: int):
+        return [self.keys[ordinal] for ordinal in self.draw(seed)]
+
+    def payload(self, seed: int):
+        return self.header + b'[' + b','.join(
+            self.fragments[ordinal] for ordinal in self.draw(seed)
+        ) + b']}'
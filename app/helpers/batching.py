@@ -0,0 +1,29 @@
+# Collects the ids asked for of one kind of entity and loads them in one
+# call, DataLoader style: each id is loaded once however often it is asked
+# for, entities another loader already brought in are primed instead of
+# loaded again, and results come back in the order they were asked for.
+class BatchLoader:
+    def __init__(self, load):
+        self.load = load
+        self._ids = []
+        self._found = {}
+
+    def want(self, ids: list):
+        self._ids.extend(ids)
+
+    def prime(self, entity):
+        self._found.setdefault(entity.id, entity)
+
+    # Returns the entities found and the ids that weren't.
+    def resolve(self):
+        pending = sorted(set(self._ids) - self._found.keys())
+        if pending:
+            for entity in self.load(pending):
+                self._found[entity.id] = entity
+        found, missing = [], []
+        for entity_id in dict.fromkeys(self._ids):
+            if entity_id in self._found:
+                found.append(self._found[entity_id])
+            else:
+                missing.append(entity_id)
+        return found, missing
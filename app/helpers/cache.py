@@ -0,0 +1,110 @@
+import glob
+import mmap
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    def __init__(self, maxsize: int = 1000):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            if len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def discard(self, prefix):
+        with self._lock:
+            for key in [k for k in self._items if k[0] == prefix]:
+                del self._items[key]
+
+
+# Files shared by every worker on the host; put in /dev/shm they never touch
+# the disk. Writes go through a rename so readers never see half a payload.
+class SharedDirectoryStore:
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _path(self, name, version):
+        return os.path.join(self.directory, f'{name}-{version}')
+
+    def get(self, name, version):
+        try:
+            with open(self._path(name, version), 'rb') as f, \
+                    mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                return m[:]
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def put(self, name, version, value: bytes):
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(value)
+        os.replace(tmp_path, self._path(name, version))
+        for path in glob.glob(self._path(name, '*')):
+            if int(path.rsplit('-', 1)[1]) < version:
+                self.remove(path)
+
+    def discard(self, name):
+        for path in glob.glob(self._path(name, '*')):
+            self.remove(path)
+
+    @staticmethod
+    def remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def default_shared_directory():
+    root = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(root, 'quiz-builder-cache')
+
+
+# Keys are (name, version) pairs; bumping the version in the database is
+# what invalidates an entry, in this worker and in every other one. Names
+# and versions only mean something within one database, so the shared
+# files are kept in a subdirectory per database, opened once it is known.
+class TwoTierCache:
+    def __init__(self, maxsize: int = 1000, directory: str = ''):
+        self.local = LRUCache(maxsize)
+        self.directory = directory
+        self.shared = None
+
+    def open(self, namespace: str):
+        self.shared = SharedDirectoryStore(
+            os.path.join(self.directory, namespace)
+        )
+
+    def get(self, name, version):
+        value = self.local.get((name, version))
+        if value is None and self.shared is not None:
+            value = self.shared.get(name, version)
+            if value is not None:
+                self.local.put((name, version), value)
+        return value
+
+    def put(self, name, version, value: bytes):
+        self.local.put((name, version), value)
+        if self.shared is not None:
+            self.shared.put(name, version, value)
+
+    def discard(self, name):
+        self.local.discard(name)
+        if self.shared is not None:
+            self.shared.discard(name)
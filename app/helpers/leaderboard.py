@@ -0,0 +1,186 @@
+import bisect
+import threading
+import time
+from collections import OrderedDict
+
+
+# Scores live in a small bounded range, so the order-statistics structure is
+# a Fenwick tree of counts per score plus, for each score, the entries
+# sorted by finish time. Rank lookups are O(log scores + log ties) and top-N
+# walks only the buckets it returns.
+class Leaderboard:
+    def __init__(self, min_score: int = -100, max_score: int = 100):
+        self.min_score = min_score
+        self.max_score = max_score
+        size = max_score - min_score + 1
+        self._tree = [0] * (size + 1)
+        self._buckets = [[] for _ in range(size)]
+        self._by_user = {}
+        self._solve_ids = set()
+
+    def __len__(self):
+        return len(self._solve_ids)
+
+    def _slot(self, score: int):
+        return self.max_score - min(max(score, self.min_score),
+                                    self.max_score)
+
+    def _count_before(self, slot: int):
+        total = 0
+        while slot > 0:
+            total += self._tree[slot]
+            slot -= slot & -slot
+        return total
+
+    def add(self, solve_id: int, user_id: int, score: int,
+            finish_datetime: str):
+        if solve_id in self._solve_ids:
+            return
+        self._solve_ids.add(solve_id)
+        slot = self._slot(score)
+        entry = (finish_datetime, solve_id, user_id, score)
+        bisect.insort(self._buckets[slot], entry)
+        i = slot + 1
+        while i < len(self._tree):
+            self._tree[i] += 1
+            i += i & -i
+        self._by_user[user_id] = entry
+
+    def top(self, n: int):
+        entries = []
+        for bucket in self._buckets:
+            for entry in bucket:
+                if len(entries) == n:
+                    return entries
+                entries.append(_as_dict(len(entries) + 1, entry))
+        return entries
+
+    def rank_of(self, user_id: int):
+        entry = self._by_user.get(user_id)
+        if entry is None:
+            return None
+        slot = self._slot(entry[3])
+        rank = self._count_before(slot) + \
+            bisect.bisect_left(self._buckets[slot], entry) + 1
+        return _as_dict(rank, entry)
+
+
+def _as_dict(rank, entry):
+    finish_datetime, solve_id, user_id, score = entry
+    return {
+        'rank': rank,
+        'solve_id': solve_id,
+        'user_id': user_id,
+        'quiz_score': score,
+        'finish_datetime': finish_datetime,
+    }
+
+
+# Boards are built once per quiz from the database and then kept current by
+# the solves finishing in this process. Solves finished by other workers
+# come from the outbox change stream, which is in commit order: at most
+# every `sync_seconds`, one reader per process applies the events after its
+# cursor to the cached boards, and drops the boards of quizes re-scored or
+# deleted. `load()` returns the stream position read before the solves of
+# the board; `changes(after, limit)` returns change records and raises
+# ValueError when events after `after` were pruned, which drops every board.
+class Leaderboards:
+    def __init__(self, maxsize: int = 1000, sync_seconds: float = 1.0,
+                 batch_size: int = 1000):
+        self.maxsize = maxsize
+        self.sync_seconds = sync_seconds
+        self.batch_size = batch_size
+        self.position = None
+        self._boards = OrderedDict()
+        self._synced_at = None
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    def get(self, quiz_id: int, load, changes):
+        self.sync(changes)
+        with self._lock:
+            entry = self._boards.get(quiz_id)
+            if entry is None:
+                entry = self._boards[quiz_id] = _Entry()
+                if len(self._boards) > self.maxsize:
+                    self._boards.popitem(last=False)
+            else:
+                self._boards.move_to_end(quiz_id)
+        # Only requests for this quiz wait while its board is built.
+        with entry.lock:
+            if entry.board is None:
+                position, solves = load()
+                board = Leaderboard()
+                for solve in solves:
+                    board.add(solve.id, solve.user_id, solve.quiz_score,
+                              solve.finish_datetime)
+                entry.board = board
+                with self._lock:
+                    if self.position is None:
+                        self.position = position
+            return entry.board
+
+    # Another request already syncing is not waited for; its boards are at
+    # most that sync behind.
+    def sync(self, changes):
+        if not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            now = time.monotonic()
+            if self.position is None or self._synced_at is not None and \
+                    now - self._synced_at < self.sync_seconds:
+                return
+            self._synced_at = now
+            while True:
+                try:
+                    records = changes(self.position, self.batch_size)
+                except ValueError:
+                    with self._lock:
+                        self._boards.clear()
+                        self.position = None
+                    return
+                for record in records:
+                    self._apply(record)
+                if records:
+                    self.position = records[-1]['position']
+                if len(records) < self.batch_size:
+                    return
+        finally:
+            self._sync_lock.release()
+
+    def _apply(self, record: dict):
+        data = record['data']
+        if record['kind'] == 'solve_finished':
+            self._add(data['quiz_id'], data['solve_id'], data['user_id'],
+                      data['quiz_score'], data['finish_datetime'])
+        elif record['kind'] in ('quiz_rescored', 'quiz_deleted'):
+            self.discard(data['quiz_id'])
+
+    # A board still being built doesn't hold the request up: the solve
+    # reaches it through the change stream.
+    def record(self, quiz_id: int, solve_id: int, user_id: int, score: int,
+               finish_datetime: str):
+        self._add(quiz_id, solve_id, user_id, score, finish_datetime,
+                  blocking=False)
+
+    def _add(self, quiz_id: int, solve_id: int, user_id: int, score: int,
+             finish_datetime: str, blocking: bool = True):
+        with self._lock:
+            entry = self._boards.get(quiz_id)
+        if entry is None or not entry.lock.acquire(blocking=blocking):
+            return
+        try:
+            if entry.board is not None:
+                entry.board.add(solve_id, user_id, score, finish_datetime)
+        finally:
+            entry.lock.release()
+
+    def discard(self, quiz_id: int):
+        with self._lock:
+            self._boards.pop(quiz_id, None)
+
+
+class _Entry:
+    def __init__(self):
+        self.board = None
+        self.lock = threading.Lock()
@@ -0,0 +1,36 @@
+from array import array
+
+
+# Per-question scores are within -100..100, so one signed byte each.
+def pack_scores(scores: list):
+    return array('b', scores).tobytes()
+
+
+def unpack_scores(data: bytes):
+    return array('b', data).tolist()
+
+
+def answer_order(questions):
+    return [
+        answer.id
+        for question in sorted(questions, key=lambda q: q.id)
+        for answer in sorted(question.answers, key=lambda a: a.id)
+    ]
+
+
+# One bit per answer of the quiz, in answer_order, set when it was selected.
+def pack_selections(order: list, selected: set):
+    bits = 0
+    for position, answer_id in enumerate(order):
+        if answer_id in selected:
+            bits |= 1 << position
+    return bits.to_bytes((len(order) + 7) // 8, 'little')
+
+
+def unpack_selections(data: bytes, order: list):
+    bits = int.from_bytes(data, 'little')
+    return {
+        answer_id
+        for position, answer_id in enumerate(order)
+        if bits >> position & 1
+    }
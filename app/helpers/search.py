@@ -0,0 +1,103 @@
+import bisect
+import math
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+
+def tokenize(text: str):
+    return re.findall(r'\w+', text.lower())
+
+
+# Inverted index used when the database has no full text search of its
+# own. Query terms match as prefixes and all of them must match; results
+# are ranked by tf-idf.
+class InvertedIndex:
+    def __init__(self):
+        self._postings = defaultdict(dict)
+        self._docs = {}
+        self._vocabulary = None
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, key, text: str, **fields):
+        counts = defaultdict(int)
+        for token in tokenize(text):
+            counts[token] += 1
+        for token, count in counts.items():
+            self._postings[token][key] = count
+        self._docs[key] = dict(fields, text=text)
+        self._vocabulary = None
+
+    def _expand(self, term: str):
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self._postings)
+        start = bisect.bisect_left(self._vocabulary, term)
+        end = bisect.bisect_left(self._vocabulary, term + '\U0010ffff')
+        return self._vocabulary[start:end]
+
+    def search(self, text: str, offset: int = 0, limit: int = 20):
+        scores = None
+        for term in set(tokenize(text)):
+            term_scores = defaultdict(float)
+            for token in self._expand(term):
+                postings = self._postings[token]
+                idf = math.log(1 + len(self._docs) / len(postings))
+                for key, count in postings.items():
+                    term_scores[key] += count * idf
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {key: score + term_scores[key]
+                          for key, score in scores.items()
+                          if key in term_scores}
+        ranked = sorted((scores or {}).items(),
+                        key=lambda item: (-item[1], item[0]))
+        return [
+            dict(self._docs[key], rank=score)
+            for key, score in ranked[offset:offset + limit]
+        ]
+
+
+# One index per user, built on first search. It is dropped when that user
+# edits a quiz or a question in this process; edits made through other
+# workers show up as a new `version` of the user's data, and no index is
+# kept for longer than max_age seconds (0 keeps them until then).
+class SearchIndexes:
+    def __init__(self, maxsize: int = 1000, max_age: float = 0):
+        self.maxsize = maxsize
+        self.max_age = max_age
+        self._indexes = OrderedDict()
+        self._generations = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int, load, version=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._indexes.get(user_id)
+            if entry is not None:
+                index, index_version, loaded = entry
+                if index_version == version and \
+                        not (self.max_age and now - loaded > self.max_age):
+                    self._indexes.move_to_end(user_id)
+                    return index
+                del self._indexes[user_id]
+            generation = self._generations[user_id]
+        index = InvertedIndex()
+        for row in load():
+            index.add((row.kind, row.id), row.text,
+                      kind=row.kind, id=row.id, quiz_id=row.quiz_id)
+        with self._lock:
+            # Don't keep an index that was loaded while the user edited.
+            if self._generations[user_id] == generation:
+                self._indexes[user_id] = (index, version, now)
+                if len(self._indexes) > self.maxsize:
+                    self._indexes.popitem(last=False)
+        return index
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._generations[user_id] += 1
+            self._indexes.pop(user_id, None)
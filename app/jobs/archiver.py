@@ -0,0 +1,101 @@
+import base64
+import itertools
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm import Session
+
+from app.db import crud, schemas
+from app.helpers.archive import get_archive
+
+logger = logging.getLogger(__name__)
+
+
+def solve_record(solve):
+    record = schemas.GetSolve.from_orm(solve).dict()
+    record['question_scores'].sort(key=lambda qs: qs['question_id'])
+    record['answers'] = base64.b64encode(solve.packed_answers).decode() \
+        if solve.packed_answers is not None else None
+    record['seed'] = solve.seed
+    return record
+
+
+# Moves solves finished more than `after` ago out of the database, a batch
+# at a time, into segment files (see app.helpers.archive); reads of a
+# quiz's solves merge them back in. Like the sweeper, every worker runs one
+# and rows another worker is archiving are skipped.
+class SolveArchiver:
+    def __init__(self, after: timedelta, interval: float = 3600.0,
+                 batch_size: int = 5000):
+        self.after = after
+        self.interval = interval
+        self.batch_size = batch_size
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def start(self, bind):
+        if not self.after:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, args=(bind,),
+                                            name='solve-archiver',
+                                            daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        self._stopping.set()
+        if thread is not None:
+            thread.join(timeout)
+
+    def _run(self, bind):
+        while not self._stopping.wait(self.interval):
+            try:
+                self.archive(bind)
+            except Exception:
+                logger.exception("Could not archive solves")
+
+    def archive(self, bind, after: timedelta = None):
+        finished_before = (
+            datetime.utcnow() - (after or self.after)
+        ).isoformat()
+        archive = get_archive()
+        total = 0
+        while not self._stopping.is_set():
+            with Session(bind=bind) as db:
+                solves = crud.get_archivable_solves(db, finished_before,
+                                                    self.batch_size)
+                if not solves:
+                    break
+                by_quiz = [
+                    (quiz_id, list(quiz_solves))
+                    for quiz_id, quiz_solves in itertools.groupby(
+                        solves, key=lambda solve: solve.quiz_id
+                    )
+                ]
+                segment, index = archive.write(
+                    (quiz_id, [solve_record(solve) for solve in quiz_solves])
+                    for quiz_id, quiz_solves in by_quiz
+                )
+                try:
+                    crud.archive_solves(db, segment, [
+                        (quiz_id, offset, length, quiz_solves)
+                        for (quiz_id, offset, length), (_, quiz_solves)
+                        in zip(index, by_quiz)
+                    ])
+                    db.commit()
+                except BaseException:
+                    archive.remove(segment)
+                    raise
+            total += len(solves)
+            if len(solves) < self.batch_size:
+                break
+        if total:
+            logger.info("Archived %s solves", total)
+        return total
@@ -0,0 +1,157 @@
+import json
+import logging
+import queue
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.db import crud
+
+logger = logging.getLogger(__name__)
+
+
+# Jobs are inserted in the caller's transaction and handed to the worker
+# threads once it commits. The in-memory queue is bounded: when it is full
+# the job simply stays pending in the table and the poller picks it up
+# later, as it does for retries and for jobs left behind by a dead process.
+class JobQueue:
+    def __init__(self, handlers: dict, workers: int = 2, maxsize: int = 1000,
+                 max_attempts: int = 5, retry_delay: float = 1.0,
+                 lease_seconds: float = 60.0, poll_interval: float = 5.0):
+        self.handlers = handlers
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self._queue = queue.Queue(maxsize)
+        self._binds = set()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def start(self, bind=None):
+        with self._lock:
+            if bind is not None:
+                self._binds.add(bind)
+            if self._threads:
+                return
+            self._stopping.clear()
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work,
+                                          name=f'job-worker-{i}',
+                                          daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            poller = threading.Thread(target=self._poll,
+                                      name='job-poller',
+                                      daemon=True)
+            poller.start()
+            self._threads.append(poller)
+
+    # timeout bounds the whole shutdown: draining and every thread's join
+    # share one deadline.
+    def stop(self, drain: bool = True, timeout: float = 30.0):
+        deadline = time.monotonic() + timeout
+        if drain:
+            self.join(timeout)
+        with self._lock:
+            threads, self._threads = self._threads, []
+        self._stopping.set()
+        for _ in range(self.workers):
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                break
+        for thread in threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+
+    def join(self, timeout: float = 30.0):
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def submit(self, db: Session, kind: str, payload: dict):
+        db_job = crud.create_job(db, kind=kind, payload=payload)
+        if 'pending_jobs' not in db.info:
+            db.info['pending_jobs'] = []
+            event.listen(db, 'after_commit', self._after_commit)
+            event.listen(db, 'after_rollback', self._after_rollback)
+        db.info['pending_jobs'].append(db_job.id)
+        return db_job
+
+    def _after_commit(self, db: Session):
+        job_ids, db.info['pending_jobs'] = db.info['pending_jobs'], []
+        if not job_ids:
+            return
+        bind = db.get_bind()
+        self.start(bind)
+        for job_id in job_ids:
+            try:
+                self._queue.put_nowait((bind, job_id))
+            except queue.Full:
+                # Left pending in the table; the poller will catch up.
+                break
+
+    @staticmethod
+    def _after_rollback(db: Session):
+        db.info['pending_jobs'] = []
+
+    def _poll(self):
+        while not self._stopping.wait(self.poll_interval):
+            free = self._queue.maxsize - self._queue.qsize()
+            with self._lock:
+                binds = list(self._binds)
+            for bind in binds:
+                if free <= 0:
+                    break
+                try:
+                    with Session(bind=bind) as db:
+                        job_ids = crud.get_due_job_ids(db, limit=free)
+                except Exception:
+                    logger.exception("Could not poll pending jobs")
+                    continue
+                for job_id in job_ids:
+                    try:
+                        self._queue.put_nowait((bind, job_id))
+                    except queue.Full:
+                        break
+                    free -= 1
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self._run(*item)
+            except Exception:
+                logger.exception("Job worker failed")
+            finally:
+                self._queue.task_done()
+
+    def _run(self, bind, job_id: int):
+        with Session(bind=bind) as db:
+            db_job = crud.claim_job(db, job_id, self.lease_seconds)
+            if db_job is None:
+                return
+            kind, attempts = db_job.kind, db_job.attempts
+            try:
+                self.handlers[kind](db, **json.loads(db_job.payload))
+                if not crud.delete_job(db, job_id, attempts):
+                    logger.warning("Job %s (%s) outlived its lease and was "
+                                   "claimed again; its work was rolled back",
+                                   job_id, kind)
+            except Exception as e:
+                db.rollback()
+                if attempts >= self.max_attempts:
+                    logger.exception("Job %s (%s) failed", job_id, kind)
+                    crud.fail_job(db, job_id, attempts, repr(e))
+                else:
+                    delay = self.retry_delay * 2 ** (attempts - 1)
+                    crud.retry_job(db, job_id, attempts, repr(e), delay)
@@ -0,0 +1,73 @@
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm import Session
+
+from app.db import crud
+
+logger = logging.getLogger(__name__)
+
+
+# Gives outbox events their positions in the change stream, in batches, and
+# deletes the ones older than `retention` (0 keeps them). Every worker runs
+# one; while one is numbering, the others skip their turn.
+class OutboxRelay:
+    def __init__(self, interval: float = 1.0, batch_size: int = 1000,
+                 retention: timedelta = timedelta(0)):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.retention = retention
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def start(self, bind):
+        if not self.interval:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, args=(bind,),
+                                            name='outbox-relay',
+                                            daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        self._stopping.set()
+        if thread is not None:
+            thread.join(timeout)
+
+    def _run(self, bind):
+        while not self._stopping.wait(self.interval):
+            try:
+                self.relay(bind)
+                if self.retention:
+                    self.prune(bind)
+            except Exception:
+                logger.exception("Could not relay outbox events")
+
+    def relay(self, bind):
+        total = 0
+        while not self._stopping.is_set():
+            with Session(bind=bind) as db:
+                count = crud.relay_outbox_events(db, self.batch_size)
+            total += count
+            if count < self.batch_size:
+                break
+        return total
+
+    def prune(self, bind):
+        created_before = (datetime.utcnow() - self.retention).isoformat()
+        total = 0
+        while not self._stopping.is_set():
+            with Session(bind=bind) as db:
+                count = crud.delete_outbox_events(db, created_before,
+                                                  self.batch_size)
+            total += count
+            if count < self.batch_size:
+                break
+        return total
@@ -0,0 +1,63 @@
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm import Session
+
+from app.db import crud
+
+logger = logging.getLogger(__name__)
+
+
+# Deletes solves left open for longer than time_limit, a batch at a time,
+# which frees their users to start another one. Every worker runs one;
+# rows another worker is deleting are skipped.
+class SolveSweeper:
+    def __init__(self, time_limit: timedelta, interval: float = 60.0,
+                 batch_size: int = 500):
+        self.time_limit = time_limit
+        self.interval = interval
+        self.batch_size = batch_size
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def start(self, bind):
+        if not self.time_limit:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, args=(bind,),
+                                            name='solve-sweeper',
+                                            daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        self._stopping.set()
+        if thread is not None:
+            thread.join(timeout)
+
+    def _run(self, bind):
+        while not self._stopping.wait(self.interval):
+            try:
+                self.sweep(bind)
+            except Exception:
+                logger.exception("Could not expire open solves")
+
+    def sweep(self, bind):
+        started_before = (datetime.utcnow() - self.time_limit).isoformat()
+        total = 0
+        while not self._stopping.is_set():
+            with Session(bind=bind) as db:
+                count = crud.expire_open_solves(db, started_before,
+                                                self.batch_size)
+            total += count
+            if count < self.batch_size:
+                break
+        if total:
+            logger.info("Expired %s open solves", total)
+        return total
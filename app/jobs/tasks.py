@@ -0,0 +1,54 @@
+from datetime import timedelta
+
+from decouple import config
+from sqlalchemy.orm import Session
+
+from app.db import crud
+from app.jobs.archiver import SolveArchiver
+from app.jobs.queue import JobQueue
+from app.jobs.relay import OutboxRelay
+from app.jobs.sweeper import SolveSweeper
+
+
+def post_solve(db: Session, solve_id: int, question_scores: list = None,
+               quiz_id: int = None, selected_answer_ids: list = None):
+    if question_scores:
+        crud.create_question_scores(db, solve_id=solve_id, quiz_id=quiz_id,
+                                    question_scores=question_scores)
+    if quiz_id is not None:
+        crud.record_answer_selections(db, quiz_id=quiz_id,
+                                      answer_ids=selected_answer_ids)
+
+
+HANDLERS = {
+    'post_solve': post_solve,
+}
+
+job_queue = JobQueue(
+    HANDLERS,
+    workers=config('JOB_WORKERS', default=2, cast=int),
+    maxsize=config('JOB_QUEUE_SIZE', default=1000, cast=int),
+    max_attempts=config('JOB_MAX_ATTEMPTS', default=5, cast=int),
+    poll_interval=config('JOB_POLL_SECONDS', default=5.0, cast=float),
+)
+
+solve_sweeper = SolveSweeper(
+    timedelta(minutes=config('SOLVE_TIME_LIMIT_MINUTES', default=120,
+                             cast=float)),
+    interval=config('SOLVE_SWEEP_SECONDS', default=60.0, cast=float),
+    batch_size=config('SOLVE_SWEEP_BATCH_SIZE', default=500, cast=int),
+)
+
+# Off unless ARCHIVE_AFTER_DAYS is set.
+solve_archiver = SolveArchiver(
+    timedelta(days=config('ARCHIVE_AFTER_DAYS', default=0, cast=float)),
+    interval=config('ARCHIVE_SECONDS', default=3600.0, cast=float),
+    batch_size=config('ARCHIVE_BATCH_SIZE', default=5000, cast=int),
+)
+
+outbox_relay = OutboxRelay(
+    interval=config('OUTBOX_RELAY_SECONDS', default=1.0, cast=float),
+    batch_size=config('OUTBOX_BATCH_SIZE', default=1000, cast=int),
+    retention=timedelta(days=config('OUTBOX_RETENTION_DAYS', default=0,
+                                    cast=float)),
+)
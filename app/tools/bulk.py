@@ -0,0 +1,134 @@
+import io
+
+from sqlalchemy import Integer, column, func, select, table, text
+
+COUNTS_TABLE = table('bulk_counts', column('id', Integer),
+                     column('count', Integer))
+
+# The backslash escapes of COPY's text format; a bare carriage return is
+# rejected in data, even inside a value.
+COPY_ESCAPES = str.maketrans({
+    '\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r',
+    '\b': '\\b', '\f': '\\f', '\v': '\\v',
+})
+
+
+def copy_text(value: str):
+    return value.translate(COPY_ESCAPES)
+
+
+def copy_bool(value: bool):
+    return 't' if value else 'f'
+
+
+def copy_bytes(value: bytes):
+    return '\\\\x' + value.hex()
+
+
+def nullable(convert):
+    return lambda value: '\\N' if value is None else convert(value)
+
+
+# One converter per column, picked from its type once rather than per
+# value; columns get the NULL check only if the batch has a None in them.
+def copy_converters(table, columns: list, rows: list):
+    converters = []
+    for index, name in enumerate(columns):
+        python_type = table.c[name].type.python_type
+        if python_type is bool:
+            convert = copy_bool
+        elif python_type is bytes:
+            convert = copy_bytes
+        elif python_type is str:
+            convert = copy_text
+        else:
+            convert = str
+        if any(row[index] is None for row in rows):
+            convert = nullable(convert)
+        converters.append(convert)
+    return converters
+
+
+# Writes rows with COPY on PostgreSQL and with executemany elsewhere.
+class Loader:
+    def __init__(self, connection):
+        self.connection = connection
+        self.copy = connection.dialect.name == 'postgresql'
+        self._next_ids = {}
+
+    def next_id(self, table):
+        return self.connection.execute(
+            select(func.coalesce(func.max(table.c.id), 0))
+        ).scalar() + 1
+
+    # Ids for rows inserted with explicit ids, in ascending order. On
+    # PostgreSQL they come from the table's sequence, so rows written
+    # concurrently by the API never collide with them.
+    def reserve_ids(self, table, count: int):
+        if not count:
+            return []
+        if self.copy:
+            return sorted(self.connection.execute(text(
+                f"SELECT nextval(pg_get_serial_sequence('{table.name}', 'id'))"
+                f" FROM generate_series(1, :count)"
+            ), {'count': count}).scalars())
+        start = self._next_ids.get(table.name) or self.next_id(table)
+        self._next_ids[table.name] = start + count
+        return list(range(start, start + count))
+
+    def insert(self, table, columns: list, rows: list):
+        if not rows:
+            return
+        if self.copy:
+            converters = copy_converters(table, columns, rows)
+            data = io.StringIO()
+            if all(convert is str for convert in converters):
+                lines = ('\t'.join(map(str, row)) for row in rows)
+            else:
+                lines = ('\t'.join([convert(value) for convert, value
+                                    in zip(converters, row)])
+                         for row in rows)
+            data.write('\n'.join(lines))
+            data.write('\n')
+            data.seek(0)
+            with self.connection.connection.cursor() as cursor:
+                cursor.copy_expert(
+                    f"COPY {table.name} ({', '.join(columns)}) FROM STDIN",
+                    data
+                )
+        else:
+            self.connection.execute(
+                table.insert(), [dict(zip(columns, row)) for row in rows]
+            )
+
+    def set_counts(self, table, column: str, counts: dict):
+        if not counts:
+            return
+        if self.copy:
+            self.connection.execute(text(
+                "CREATE TEMPORARY TABLE bulk_counts "
+                "(id integer PRIMARY KEY, count integer)"
+            ))
+            self.insert(COUNTS_TABLE, ['id', 'count'], list(counts.items()))
+            self.connection.execute(text(
+                f"UPDATE {table.name} SET {column} = bulk_counts.count "
+                f"FROM bulk_counts "
+                f"WHERE {table.name}.id = bulk_counts.id"
+            ))
+            self.connection.execute(text("DROP TABLE bulk_counts"))
+        else:
+            self.connection.execute(
+                text(f"UPDATE {table.name} SET {column} = :count "
+                     f"WHERE id = :id"),
+                [{'id': key, 'count': count}
+                 for key, count in counts.items()]
+            )
+
+    def reset_sequences(self, tables: list):
+        if not self.copy:
+            return
+        for table in tables:
+            self.connection.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'),"
+                f" (SELECT max(id) FROM {table.name}))"
+            ))
@@ -0,0 +1,87 @@
+import json
+import os
+import time
+
+from sqlalchemy.orm import Session
+
+from app.db import crud
+
+
+def change_record(db_event):
+    return {
+        'position': db_event.position,
+        'kind': db_event.kind,
+        'created_datetime': db_event.created_datetime,
+        'data': json.loads(db_event.payload)
+    }
+
+
+# Events are deleted oldest first once past their retention, so positions
+# left are contiguous and a cursor from before the oldest one missed some.
+def check_cursor(db: Session, after: int):
+    first = crud.get_first_outbox_position(db)
+    if first is not None and first > after + 1:
+        raise ValueError(f"Events after {after} were deleted; the oldest "
+                         f"left is {first}")
+
+
+# The change stream appended to an NDJSON file, one event per line. It
+# resumes after the position on its last line; a line cut short by a crash
+# is dropped first and written again.
+class FileSink:
+    def __init__(self, path: str):
+        self.path = path
+
+    def last_position(self):
+        try:
+            f = open(self.path, 'rb+')
+        except FileNotFoundError:
+            return 0
+        with f:
+            end = f.seek(0, os.SEEK_END)
+            tail, start = b'', end
+            while start > 0 and tail.count(b'\n') < 2:
+                step = min(64 * 1024, start)
+                start -= step
+                f.seek(start)
+                tail = f.read(step) + tail
+            complete = tail.rfind(b'\n') + 1
+            if start + complete < end:
+                f.truncate(start + complete)
+            lines = tail[:complete].splitlines()
+            if not lines:
+                return 0
+            return json.loads(lines[-1])['position']
+
+    def write(self, records: list):
+        with open(self.path, 'ab') as f:
+            f.write(b''.join(
+                json.dumps(record, separators=(',', ':')).encode() + b'\n'
+                for record in records
+            ))
+            f.flush()
+            os.fsync(f.fileno())
+
+
+# Copies the change stream into the sink a batch at a time, until it is
+# caught up or, with follow, until stopping() is true.
+def stream_changes(bind, sink: FileSink, batch_size: int = 1000,
+                   follow: bool = False, poll_seconds: float = 1.0,
+                   stopping=lambda: False):
+    after = sink.last_position()
+    with Session(bind=bind) as db:
+        check_cursor(db, after)
+    total = 0
+    while not stopping():
+        with Session(bind=bind) as db:
+            records = [change_record(db_event) for db_event in
+                       crud.get_outbox_events(db, after, batch_size)]
+        if records:
+            sink.write(records)
+            after = records[-1]['position']
+            total += len(records)
+        if len(records) < batch_size:
+            if not follow:
+                break
+            time.sleep(poll_seconds)
+    return total
@@ -0,0 +1,406 @@
+import base64
+import gzip
+import io
+import itertools
+import json
+import zlib
+from collections import Counter, defaultdict
+
+from sqlalchemy import select
+
+from app.db import models
+from app.helpers import banks
+from app.helpers.archive import get_archive
+from app.helpers.packing import pack_scores, unpack_scores, \
+    unpack_selections
+from app.tools.bulk import Loader
+
+FORMAT = 'quiz-builder'
+VERSION = 1
+MAX_QUESTIONS = 10
+MAX_ANSWERS = 5
+
+quizes = models.Quiz.__table__
+questions = models.Question.__table__
+answers = models.Answer.__table__
+solves = models.Solve.__table__
+question_scores = models.QuestionScore.__table__
+users = models.User.__table__
+archived_blocks = models.ArchivedBlock.__table__
+solved_quizes = models.SolvedQuiz.__table__
+
+
+def group(rows, key: str):
+    grouped = defaultdict(list)
+    for row in rows:
+        grouped[getattr(row, key)].append(row)
+    return grouped
+
+
+# Quiz trees as one JSON object per line: a header, then each quiz with its
+# questions and answers nested, in id order, followed by the finished solves
+# of that batch of quizes if asked for. Solvers are referred to by email,
+# since ids differ between instances; scores and selections are in question
+# and answer id order, as in app.helpers.packing.
+def export_quizes(connection, user_id: int = None, with_solves: bool = False,
+                  batch_size: int = 500):
+    yield {'format': FORMAT, 'version': VERSION, 'solves': with_solves}
+    last_id = 0
+    while True:
+        query = select(quizes).where(
+            quizes.c.id > last_id
+        ).order_by(quizes.c.id).limit(batch_size)
+        if user_id is not None:
+            query = query.where(quizes.c.user_id == user_id)
+        quiz_rows = connection.execute(query).fetchall()
+        if not quiz_rows:
+            return
+        last_id = quiz_rows[-1].id
+        quiz_ids = [row.id for row in quiz_rows]
+        quiz_questions = group(connection.execute(
+            select(questions).where(
+                questions.c.quiz_id.in_(quiz_ids)
+            ).order_by(questions.c.id)
+        ), 'quiz_id')
+        question_answers = group(connection.execute(
+            select(answers).join(
+                questions, questions.c.id == answers.c.question_id
+            ).where(
+                questions.c.quiz_id.in_(quiz_ids)
+            ).order_by(answers.c.id)
+        ), 'question_id')
+        for quiz in quiz_rows:
+            yield {
+                'type': 'quiz',
+                'id': quiz.id,
+                'title': quiz.title,
+                'is_active': quiz.is_active,
+                'draw_count': quiz.draw_count,
+                'questions': [
+                    {
+                        'description': question.description,
+                        'single_correct_answer':
+                            question.single_correct_answer,
+                        'answers': [
+                            {'description': answer.description,
+                             'is_correct': answer.is_correct}
+                            for answer in question_answers[question.id]
+                        ]
+                    }
+                    for question in quiz_questions[quiz.id]
+                ]
+            }
+        if with_solves:
+            yield from export_solves(connection, quiz_ids)
+            yield from export_archived_solves(connection, quiz_ids)
+
+
+def export_solves(connection, quiz_ids: list):
+    streaming = connection.execution_options(stream_results=True)
+    solve_rows = streaming.execute(
+        select(solves, users.c.email).join(
+            users, users.c.id == solves.c.user_id
+        ).where(
+            solves.c.quiz_id.in_(quiz_ids)
+        ).where(
+            solves.c.is_finished == True
+        ).order_by(solves.c.quiz_id, solves.c.id)
+    )
+    # Scores kept as rows come from a second cursor in the same order.
+    score_rows = streaming.execute(
+        select(question_scores).where(
+            question_scores.c.quiz_id.in_(quiz_ids)
+        ).order_by(question_scores.c.quiz_id, question_scores.c.solve_id,
+                   question_scores.c.question_id)
+    )
+    scores = itertools.groupby(
+        score_rows, key=lambda row: (row.quiz_id, row.solve_id)
+    )
+    pending = next(scores, None)
+    for solve in solve_rows:
+        key = (solve.quiz_id, solve.id)
+        while pending is not None and pending[0] < key:
+            pending = next(scores, None)
+        if solve.packed_question_scores is not None:
+            solve_scores = unpack_scores(solve.packed_question_scores)
+        elif pending is not None and pending[0] == key:
+            solve_scores = [row.score for row in pending[1]]
+        else:
+            solve_scores = []
+        yield {
+            'type': 'solve',
+            'quiz_id': solve.quiz_id,
+            'user': solve.email,
+            'start_datetime': solve.start_datetime,
+            'finish_datetime': solve.finish_datetime,
+            'quiz_score': solve.quiz_score,
+            'question_scores': solve_scores,
+            'answers': base64.b64encode(solve.packed_answers).decode()
+            if solve.packed_answers is not None else None,
+            'seed': solve.seed
+        }
+
+
+# Archived solves of users that still exist, after the ones in the table.
+def export_archived_solves(connection, quiz_ids: list):
+    archive = get_archive()
+    blocks = connection.execute(
+        select(archived_blocks).where(
+            archived_blocks.c.quiz_id.in_(quiz_ids)
+        ).order_by(archived_blocks.c.quiz_id, archived_blocks.c.id)
+    ).fetchall()
+    for quiz_id, quiz_blocks in itertools.groupby(
+            blocks, key=lambda block: block.quiz_id
+    ):
+        emails = dict(connection.execute(
+            select(solved_quizes.c.user_id, users.c.email).join(
+                users, users.c.id == solved_quizes.c.user_id
+            ).where(solved_quizes.c.quiz_id == quiz_id)
+        ).fetchall())
+        for block in quiz_blocks:
+            for record in archive.read(block.segment, block.offset,
+                                       block.length):
+                if record['user_id'] not in emails:
+                    continue
+                yield {
+                    'type': 'solve',
+                    'quiz_id': quiz_id,
+                    'user': emails[record['user_id']],
+                    'start_datetime': record['start_datetime'],
+                    'finish_datetime': record['finish_datetime'],
+                    'quiz_score': record['quiz_score'],
+                    'question_scores': [qs['score'] for qs
+                                        in record['question_scores']],
+                    'answers': record['answers'],
+                    'seed': record.get('seed')
+                }
+
+
+# Gzipped, compressed as it is produced so a response can stream it.
+def dump(records, compresslevel: int = 6):
+    compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, 31)
+    chunk = []
+    size = 0
+    for record in records:
+        line = json.dumps(record, separators=(',', ':')).encode() + b'\n'
+        chunk.append(line)
+        size += len(line)
+        if size >= 64 * 1024:
+            data = compressor.compress(b''.join(chunk))
+            chunk, size = [], 0
+            if data:
+                yield data
+    yield compressor.compress(b''.join(chunk)) + compressor.flush()
+
+
+# Reads gzipped or plain NDJSON and checks the header.
+def load(fileobj):
+    if hasattr(fileobj, 'peek'):
+        magic = fileobj.peek(2)[:2]
+    else:
+        magic = fileobj.read(2)
+        fileobj.seek(0)
+    if magic == b'\x1f\x8b':
+        fileobj = gzip.GzipFile(fileobj=fileobj, mode='rb')
+    lines = io.TextIOWrapper(fileobj, encoding='utf-8')
+    header = json.loads(next(lines, 'null'))
+    if not isinstance(header, dict) or header.get('format') != FORMAT:
+        raise ValueError("Not a quiz export")
+    if header.get('version') != VERSION:
+        raise ValueError(f"Unsupported export version: "
+                         f"{header.get('version')}")
+    for number, line in enumerate(lines, 2):
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError as error:
+                raise ValueError(f"Line {number}: {error}") from error
+
+
+def check_quiz(record: dict):
+    quiz_questions = record['questions']
+    draw_count = record.get('draw_count')
+    limit = banks.MAX_QUESTIONS if draw_count else MAX_QUESTIONS
+    if len(quiz_questions) > limit:
+        raise ValueError(f"Quiz {record['id']}: "
+                         f"more than {limit} questions")
+    if draw_count is not None and (
+            not isinstance(draw_count, int) or draw_count < 1 or
+            record['is_active'] and draw_count > len(quiz_questions)
+    ):
+        raise ValueError(f"Quiz {record['id']}: invalid draw_count")
+    for question in quiz_questions:
+        question_answers = question['answers']
+        if len(question_answers) > MAX_ANSWERS:
+            raise ValueError(f"Quiz {record['id']}: "
+                             f"more than {MAX_ANSWERS} answers")
+        if not record['is_active']:
+            continue
+        correct = sum(bool(answer['is_correct'])
+                      for answer in question_answers)
+        if len(question_answers) < 2 or correct == 0 or \
+                question['single_correct_answer'] and correct > 1:
+            raise ValueError(f"Quiz {record['id']}: "
+                             f"published but can't be solved")
+    if record['is_active'] and not quiz_questions:
+        raise ValueError(f"Quiz {record['id']}: published without questions")
+
+
+# Writes the quizes of an export for owner_id, with new ids, in the caller's
+# transaction. Ids are reserved in blocks and handed out in the export's
+# order, so packed selections and scores still line up with them. Solves
+# are kept only for solvers who have an account here, by email; the quiz
+# solve and answer selection counts are taken from the solves imported.
+def import_quizes(connection, records, owner_id: int,
+                  with_solves: bool = True, scores_storage: str = 'rows',
+                  batch_size: int = 1000):
+    loader = Loader(connection)
+    totals = Counter()
+    quiz_ids = {}
+    question_ids = {}
+    answer_ids = {}
+    draw_counts = {}
+    user_ids = {}
+    solve_counts, selection_counts = Counter(), Counter()
+    pending_quizes, pending_solves = [], []
+
+    def flush_quizes():
+        if not pending_quizes:
+            return
+        new_quiz_ids = iter(loader.reserve_ids(quizes, len(pending_quizes)))
+        new_question_ids = iter(loader.reserve_ids(questions, sum(
+            len(record['questions']) for record in pending_quizes
+        )))
+        new_answer_ids = iter(loader.reserve_ids(answers, sum(
+            len(question['answers']) for record in pending_quizes
+            for question in record['questions']
+        )))
+        quiz_rows, question_rows, answer_rows = [], [], []
+        for record in pending_quizes:
+            quiz_id = quiz_ids[record['id']] = next(new_quiz_ids)
+            is_active = bool(record['is_active'])
+            draw_counts[quiz_id] = record.get('draw_count')
+            quiz_rows.append((quiz_id, str(record['title']), is_active,
+                              draw_counts[quiz_id], 0, 1, owner_id))
+            question_ids[quiz_id], answer_ids[quiz_id] = [], []
+            for ordinal, question in enumerate(record['questions']):
+                question_id = next(new_question_ids)
+                question_ids[quiz_id].append(question_id)
+                answer_ids[quiz_id].append([])
+                question_rows.append((
+                    question_id, str(question['description']),
+                    bool(question['single_correct_answer']), quiz_id,
+                    ordinal if is_active else None
+                ))
+                for answer in question['answers']:
+                    answer_id = next(new_answer_ids)
+                    answer_ids[quiz_id][-1].append(answer_id)
+                    answer_rows.append((
+                        answer_id, str(answer['description']),
+                        bool(answer['is_correct']), 0, question_id
+                    ))
+        loader.insert(quizes, ['id', 'title', 'is_active', 'draw_count',
+                               'solve_count', 'version', 'user_id'],
+                      quiz_rows)
+        loader.insert(questions, ['id', 'description',
+                                  'single_correct_answer', 'quiz_id',
+                                  'ordinal'], question_rows)
+        loader.insert(answers, ['id', 'description', 'is_correct',
+                                'selection_count', 'question_id'],
+                      answer_rows)
+        totals['quizes'] += len(quiz_rows)
+        totals['questions'] += len(question_rows)
+        totals['answers'] += len(answer_rows)
+        pending_quizes.clear()
+
+    def flush_solves():
+        flush_quizes()
+        if not pending_solves:
+            return
+        emails = {record['user'] for record in pending_solves} - \
+            user_ids.keys()
+        if emails:
+            user_ids.update(dict.fromkeys(emails))
+            user_ids.update(connection.execute(
+                select(users.c.email, users.c.id).where(
+                    users.c.email.in_(emails)
+                )
+            ).fetchall())
+        records = [record for record in pending_solves
+                   if record['quiz_id'] in quiz_ids and
+                   user_ids[record['user']] is not None]
+        totals['skipped_solves'] += len(pending_solves) - len(records)
+        solve_rows, score_rows = [], []
+        new_solve_ids = iter(loader.reserve_ids(solves, len(records)))
+        new_score_ids = iter(loader.reserve_ids(question_scores, sum(
+            len(record['question_scores']) for record in records
+        )) if scores_storage == 'rows' else ())
+        for record in records:
+            solve_id = next(new_solve_ids)
+            quiz_id = quiz_ids[record['quiz_id']]
+            seed = record.get('seed')
+            # Ids are handed out in the export's order, so the seed draws
+            # the same questions here.
+            ordinals = range(len(question_ids[quiz_id]))
+            if seed is not None:
+                seed = int(seed)
+                ordinals = banks.draw_ordinals(seed, len(ordinals),
+                                               draw_counts[quiz_id])
+            scores = [int(score) for score in record['question_scores']]
+            packed_scores = None
+            if scores_storage == 'packed':
+                packed_scores = pack_scores(scores)
+            else:
+                for ordinal, score in zip(ordinals, scores):
+                    score_rows.append((next(new_score_ids), solve_id,
+                                       quiz_id,
+                                       question_ids[quiz_id][ordinal],
+                                       score))
+            packed_answers = None
+            if record['answers'] is not None:
+                packed_answers = base64.b64decode(record['answers'])
+                selection_counts.update(unpack_selections(
+                    packed_answers, [
+                        answer_id for ordinal in ordinals
+                        for answer_id in answer_ids[quiz_id][ordinal]
+                    ]
+                ))
+            solve_counts[quiz_id] += 1
+            solve_rows.append((
+                solve_id, user_ids[record['user']], quiz_id,
+                str(record['start_datetime']),
+                str(record['finish_datetime']), True,
+                int(record['quiz_score']), packed_scores, packed_answers,
+                seed
+            ))
+        loader.insert(solves, ['id', 'user_id', 'quiz_id', 'start_datetime',
+                               'finish_datetime', 'is_finished',
+                               'quiz_score', 'packed_question_scores',
+                               'packed_answers', 'seed'], solve_rows)
+        loader.insert(question_scores, ['id', 'solve_id', 'quiz_id',
+                                        'question_id', 'score'], score_rows)
+        totals['solves'] += len(solve_rows)
+        totals['questionscores'] += len(score_rows)
+        pending_solves.clear()
+
+    for record in records:
+        try:
+            kind = record['type']
+            if kind == 'quiz':
+                check_quiz(record)
+                pending_quizes.append(record)
+                if len(pending_quizes) >= batch_size:
+                    flush_quizes()
+            elif kind == 'solve' and with_solves:
+                pending_solves.append(record)
+                if len(pending_solves) >= batch_size:
+                    flush_solves()
+        except (KeyError, TypeError) as error:
+            raise ValueError(f"Malformed record: {error!r}") from error
+    try:
+        flush_solves()
+    except (KeyError, TypeError) as error:
+        raise ValueError(f"Malformed record: {error!r}") from error
+    loader.set_counts(quizes, 'solve_count', solve_counts)
+    loader.set_counts(answers, 'selection_count', selection_counts)
+    return dict(totals)
@@ -0,0 +1,49 @@
+import csv
+import io
+import json
+
+from app.db import crud, schemas
+
+
+# A JSON list of {"email": ..., "password": ...} objects, or CSV with an
+# email and a password column. Rows are numbered from 1, the CSV header
+# not counted.
+def read_users(data: bytes, content_type: str = 'application/json'):
+    text = data.decode('utf-8-sig')
+    if 'csv' in content_type:
+        rows = list(csv.DictReader(io.StringIO(text)))
+    else:
+        rows = json.loads(text)
+        if not isinstance(rows, list):
+            raise ValueError("Expected a list of users")
+    users, invalid = [], []
+    for number, row in enumerate(rows, 1):
+        email = password = None
+        if isinstance(row, dict):
+            email, password = row.get('email'), row.get('password')
+        if isinstance(email, str):
+            email = email.strip()
+        if not isinstance(email, str) or '@' not in email:
+            invalid.append({'row': number, 'email': str(email or ''),
+                            'status': 'invalid', 'detail': "Invalid email"})
+        elif not isinstance(password, str) or not password:
+            invalid.append({'row': number, 'email': email,
+                            'status': 'invalid', 'detail': "No password"})
+        else:
+            users.append((number, schemas.UserCreate(email=email,
+                                                     password=password)))
+    return users, invalid
+
+
+# Creates the users and reports on every row, in order.
+def provision_users(db, data: bytes, content_type: str = 'application/json',
+                    max_rows: int = None):
+    users, invalid = read_users(data, content_type)
+    if max_rows is not None and len(users) + len(invalid) > max_rows:
+        raise ValueError(f"More than {max_rows} users")
+    statuses = crud.create_users(db, [user for _, user in users])
+    report = invalid + [
+        dict(status, row=number)
+        for (number, _), status in zip(users, statuses)
+    ]
+    return sorted(report, key=lambda status: status['row'])
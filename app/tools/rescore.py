@@ -0,0 +1,246 @@
+import json
+import multiprocessing
+import os
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+from types import SimpleNamespace
+
+from sqlalchemy import bindparam, select, update
+
+from app.db import models
+from app.helpers.banks import draw_ordinals
+from app.helpers.math import calculate_scores
+from app.helpers.packing import answer_order, pack_scores, unpack_selections
+
+quizes = models.Quiz.__table__
+questions = models.Question.__table__
+answers = models.Answer.__table__
+solves = models.Solve.__table__
+question_scores = models.QuestionScore.__table__
+outbox_events = models.OutboxEvent.__table__
+
+
+def load_questions(connection, quiz_id: int):
+    question_answers = defaultdict(list)
+    for answer in connection.execute(
+            select(answers.c.id, answers.c.is_correct,
+                   answers.c.question_id).join(
+                questions, questions.c.id == answers.c.question_id
+            ).where(questions.c.quiz_id == quiz_id)
+    ):
+        question_answers[answer.question_id].append(
+            SimpleNamespace(id=answer.id, is_correct=answer.is_correct)
+        )
+    return [
+        SimpleNamespace(id=question.id,
+                        single_correct_answer=question.single_correct_answer,
+                        answers=question_answers[question.id])
+        for question in connection.execute(
+            select(questions.c.id, questions.c.single_correct_answer)
+            .where(questions.c.quiz_id == quiz_id)
+            .order_by(questions.c.id)
+        )
+    ]
+
+
+# Scores the finished solves of a quiz again from their packed selections,
+# with the current calculate_scores, and writes back the scores that came
+# out different. Solves from before selections were stored are skipped. A
+# solve of a bank is scored on the questions its seed drew, which are in
+# id order like the ordinals. A quiz whose scores changed gets a
+# `quiz_rescored` outbox event, so that the API workers rebuild its
+# leaderboard.
+def rescore_quiz(connection, quiz_id: int, batch_size: int = 1000,
+                 dry_run: bool = False):
+    totals = Counter()
+    quiz_questions = load_questions(connection, quiz_id)
+    if not quiz_questions:
+        return totals
+    quiz_order = answer_order(quiz_questions)
+    draw_count = connection.execute(
+        select(quizes.c.draw_count).where(quizes.c.id == quiz_id)
+    ).scalar()
+    update_solve = update(solves).where(
+        solves.c.id == bindparam('solve_id')
+    ).where(
+        solves.c.quiz_id == quiz_id
+    ).values(quiz_score=bindparam('quiz_score'),
+             packed_question_scores=bindparam('packed_question_scores'))
+    update_score = update(question_scores).where(
+        question_scores.c.id == bindparam('score_id')
+    ).where(
+        question_scores.c.quiz_id == quiz_id
+    ).values(score=bindparam('score'))
+    result = connection.execution_options(stream_results=True).execute(
+        select(solves.c.id, solves.c.quiz_score, solves.c.seed,
+               solves.c.packed_question_scores, solves.c.packed_answers)
+        .where(solves.c.quiz_id == quiz_id)
+        .where(solves.c.is_finished == True)
+        .order_by(solves.c.id)
+    )
+    for batch in result.partitions(batch_size):
+        stored_rows = defaultdict(list)
+        row_solve_ids = [solve.id for solve in batch
+                         if solve.packed_question_scores is None]
+        if row_solve_ids:
+            for row in connection.execute(
+                    select(question_scores.c.id, question_scores.c.solve_id,
+                           question_scores.c.question_id,
+                           question_scores.c.score)
+                    .where(question_scores.c.quiz_id == quiz_id)
+                    .where(question_scores.c.solve_id.in_(row_solve_ids))
+            ):
+                stored_rows[row.solve_id].append(row)
+        solve_changes, score_changes = [], []
+        for solve in batch:
+            totals['solves'] += 1
+            if solve.packed_answers is None:
+                totals['skipped'] += 1
+                continue
+            solve_questions, order = quiz_questions, quiz_order
+            if solve.seed is not None:
+                solve_questions = [
+                    quiz_questions[ordinal] for ordinal in draw_ordinals(
+                        solve.seed, len(quiz_questions), draw_count
+                    )
+                ]
+                order = answer_order(solve_questions)
+            selected = unpack_selections(solve.packed_answers, order)
+            try:
+                scores, quiz_score = calculate_scores(solve_questions, {
+                    answer_id: answer_id in selected for answer_id in order
+                })
+            except (ValueError, KeyError, ZeroDivisionError):
+                totals['failed'] += 1
+                continue
+            scores = {qs['question_id']: qs['score'] for qs in scores}
+            packed_scores = solve.packed_question_scores
+            if packed_scores is not None:
+                packed_scores = pack_scores(
+                    [scores[question_id] for question_id in sorted(scores)]
+                )
+            if quiz_score != solve.quiz_score or \
+                    packed_scores != solve.packed_question_scores:
+                solve_changes.append({
+                    'solve_id': solve.id,
+                    'quiz_score': quiz_score,
+                    'packed_question_scores': packed_scores
+                })
+            for row in stored_rows[solve.id]:
+                score = scores.get(row.question_id, row.score)
+                if score != row.score:
+                    score_changes.append({'score_id': row.id, 'score': score})
+        totals['changed'] += len(solve_changes)
+        totals['question_scores_changed'] += len(score_changes)
+        if dry_run:
+            continue
+        if solve_changes:
+            connection.execute(update_solve, solve_changes)
+        if score_changes:
+            connection.execute(update_score, score_changes)
+    if totals['changed'] and not dry_run:
+        connection.execute(outbox_events.insert().values(
+            kind='quiz_rescored',
+            payload=json.dumps({'quiz_id': quiz_id,
+                                'changed': totals['changed']}),
+            created_datetime=datetime.utcnow().isoformat()
+        ))
+    return totals
+
+
+# Quizes already re-scored, saved to a file at most every `interval`
+# seconds. A quiz done again after a crash just finds nothing to change.
+class Checkpoint:
+    def __init__(self, path: str, interval: float = 1.0):
+        self.path = path
+        self.interval = interval
+        self.done = set()
+        self.totals = Counter()
+        self._saved_at = time.monotonic()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            self.done = set(state['done'])
+            self.totals = Counter(state['totals'])
+
+    def mark(self, quiz_id: int, totals: Counter):
+        self.done.add(quiz_id)
+        self.totals.update(totals)
+        if time.monotonic() - self._saved_at >= self.interval:
+            self.save()
+
+    def save(self):
+        self._saved_at = time.monotonic()
+        if not self.path:
+            return
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump({'done': sorted(self.done),
+                       'totals': dict(self.totals)}, f)
+        os.replace(self.path + '.tmp', self.path)
+
+    def remove(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+_worker_engine = None
+
+
+def init_worker(url: str):
+    global _worker_engine
+    from app.db.database import build_engine
+    _worker_engine = build_engine(url)
+
+
+def rescore_in_worker(quiz_id: int, batch_size: int, dry_run: bool):
+    with _worker_engine.begin() as connection:
+        return quiz_id, rescore_quiz(connection, quiz_id, batch_size, dry_run)
+
+
+# Each quiz is re-scored and committed on its own, in this process or, with
+# jobs > 1, spread over that many worker processes.
+def rescore(bind, quiz_ids: list = None, jobs: int = 1,
+            checkpoint: Checkpoint = None, batch_size: int = 1000,
+            dry_run: bool = False, progress=None):
+    checkpoint = checkpoint or Checkpoint('')
+    if quiz_ids is None:
+        with bind.connect() as connection:
+            quiz_ids = list(connection.execute(
+                select(quizes.c.id).order_by(quizes.c.id)
+            ).scalars())
+    pending = [quiz_id for quiz_id in quiz_ids
+               if quiz_id not in checkpoint.done]
+
+    def finished(quiz_id, totals):
+        checkpoint.mark(quiz_id, totals)
+        if progress is not None:
+            progress(len(checkpoint.done), checkpoint.totals)
+
+    if jobs <= 1:
+        for quiz_id in pending:
+            with bind.begin() as connection:
+                finished(quiz_id, rescore_quiz(connection, quiz_id,
+                                               batch_size, dry_run))
+    else:
+        with ProcessPoolExecutor(
+                max_workers=jobs,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_worker,
+                initargs=(bind.url.render_as_string(hide_password=False),)
+        ) as pool:
+            quiz_ids, running = iter(pending), set()
+            while True:
+                for quiz_id in quiz_ids:
+                    running.add(pool.submit(rescore_in_worker, quiz_id,
+                                            batch_size, dry_run))
+                    if len(running) >= jobs * 2:
+                        break
+                if not running:
+                    break
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finished(*future.result())
+    checkpoint.save()
+    return checkpoint.totals
@@ -0,0 +1,230 @@
+import bisect
+import itertools
+import random
+from collections import Counter
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from app.db import models
+from app.helpers.math import calculate_scores
+from app.helpers.packing import answer_order, pack_scores, pack_selections
+from app.tools.bulk import Loader
+
+WORDS = """
+algebra anatomy art astronomy biology botany capitals chemistry cinema
+climate coding computers cooking culture databases design ecology economics
+energy engines fashion film finance football galaxies genetics geography
+geology grammar history inventions languages law literature logic maps
+mathematics medicine music mythology networks nutrition oceans painting
+philosophy photography physics planets poetry politics programming
+psychology rivers robots science security sports statistics theatre travel
+volcanoes weather wildlife
+""".split()
+
+USER_COLUMNS = ['id', 'email', 'hashed_password', 'is_active']
+QUIZ_COLUMNS = ['id', 'title', 'is_active', 'solve_count', 'version',
+                'user_id']
+QUESTION_COLUMNS = ['id', 'description', 'single_correct_answer', 'quiz_id']
+ANSWER_COLUMNS = ['id', 'description', 'is_correct', 'selection_count',
+                  'question_id']
+SOLVE_COLUMNS = ['id', 'user_id', 'quiz_id', 'start_datetime',
+                 'finish_datetime', 'is_finished', 'quiz_score',
+                 'packed_question_scores', 'packed_answers']
+QUESTION_SCORE_COLUMNS = ['id', 'solve_id', 'quiz_id', 'question_id',
+                          'score']
+
+
+def title(rng: random.Random, number: int):
+    return f"{' '.join(rng.sample(WORDS, 3)).capitalize()} quiz {number}"
+
+
+# Fills the database with users, quizes and solves. The distributions:
+# a share of the users author quizes, each a geometric number of them;
+# quizes have 1-10 questions of 2-5 answers, and a popularity that falls
+# off as 1/rank, so a few quizes get most of the solves. Each solver has
+# a skill, the chance of getting an answer right, and the scores come from
+# calculate_scores, as in PUT /solve. The same seed gives the same data.
+def generate(bind, users: int = 1000, authors: float = 0.1,
+             quizes_per_author: float = 5.0, published: float = 0.9,
+             single_ratio: float = 0.5, solves: int = 100000,
+             open_ratio: float = 0.01, days: int = 90,
+             question_scores: str = 'rows', password: str = 'secret',
+             batch_size: int = 10000, seed: int = 0, progress=None):
+    from app.auth.auth_bearer import get_password_hash
+    rng = random.Random(seed)
+    hashed_password = get_password_hash(password)
+    now = datetime.utcnow()
+    tables = [models.User.__table__, models.Quiz.__table__,
+              models.Question.__table__, models.Answer.__table__,
+              models.Solve.__table__, models.QuestionScore.__table__]
+    totals = Counter()
+
+    def report(name, count):
+        totals[name] += count
+        if progress is not None:
+            progress(name, totals[name])
+
+    with bind.begin() as connection:
+        loader = Loader(connection)
+        user_table, quiz_table, question_table, answer_table, \
+            solve_table, score_table = tables
+        ids = {table.name: loader.next_id(table) for table in tables}
+
+        def take_id(table):
+            ids[table.name] += 1
+            return ids[table.name] - 1
+
+        user_ids = [take_id(user_table) for _ in range(users)]
+        for start in range(0, users, batch_size):
+            loader.insert(user_table, USER_COLUMNS, [
+                (user_id, f'user{user_id}@example.com', hashed_password, True)
+                for user_id in user_ids[start:start + batch_size]
+            ])
+        report('users', users)
+
+        quizes = []
+        quiz_rows, question_rows, answer_rows = [], [], []
+        for author_id in rng.sample(user_ids, max(1, int(users * authors))):
+            count = 1
+            if quizes_per_author > 1:
+                count += int(rng.expovariate(1 / (quizes_per_author - 1)))
+            for _ in range(count):
+                quiz_id = take_id(quiz_table)
+                is_active = rng.random() < published
+                quiz_rows.append((quiz_id, title(rng, quiz_id), is_active, 0,
+                                  1, author_id))
+                questions = []
+                for _ in range(rng.randint(1, 10)):
+                    question_id = take_id(question_table)
+                    single = rng.random() < single_ratio
+                    question_rows.append((
+                        question_id,
+                        f"{' '.join(rng.sample(WORDS, 6)).capitalize()}?",
+                        single, quiz_id
+                    ))
+                    answers = rng.randint(2, 5)
+                    if single:
+                        correct = {rng.randrange(answers)}
+                    else:
+                        correct = {i for i in range(answers)
+                                   if rng.random() < 0.5} or \
+                                  {rng.randrange(answers)}
+                    question = SimpleNamespace(id=question_id,
+                                               single_correct_answer=single,
+                                               answers=[])
+                    for i in range(answers):
+                        answer = SimpleNamespace(id=take_id(answer_table),
+                                                 is_correct=i in correct)
+                        answer_rows.append((answer.id, rng.choice(WORDS),
+                                            answer.is_correct, 0,
+                                            question_id))
+                        question.answers.append(answer)
+                    questions.append(question)
+                if is_active:
+                    quizes.append(SimpleNamespace(
+                        id=quiz_id, user_id=author_id, questions=questions,
+                        order=answer_order(questions)
+                    ))
+        for table, columns, rows in (
+                (quiz_table, QUIZ_COLUMNS, quiz_rows),
+                (question_table, QUESTION_COLUMNS, question_rows),
+                (answer_table, ANSWER_COLUMNS, answer_rows)):
+            for start in range(0, len(rows), batch_size):
+                loader.insert(table, columns, rows[start:start + batch_size])
+            report(table.name, len(rows))
+
+        solve_counts, selection_counts = Counter(), Counter()
+        if quizes and solves:
+            rng.shuffle(quizes)
+            popularity = list(itertools.accumulate(
+                1 / rank for rank in range(1, len(quizes) + 1)
+            ))
+            solve_rows, score_rows = [], []
+
+            def flush():
+                loader.insert(solve_table, SOLVE_COLUMNS, solve_rows)
+                loader.insert(score_table, QUESTION_SCORE_COLUMNS,
+                              score_rows)
+                report('solves', len(solve_rows))
+                report('questionscores', len(score_rows))
+                solve_rows.clear()
+                score_rows.clear()
+
+            per_user = solves / users
+            for user_id in user_ids:
+                skill = rng.betavariate(4, 2)
+                wanted = min(int(rng.expovariate(1 / per_user)),
+                             len(quizes))
+                chosen = {
+                    bisect.bisect(popularity,
+                                  rng.random() * popularity[-1])
+                    for _ in range(wanted)
+                }
+                chosen = [quizes[index] for index in chosen
+                          if quizes[index].user_id != user_id]
+                for position, quiz in enumerate(chosen):
+                    solve_id = take_id(solve_table)
+                    started = now - timedelta(seconds=rng.randrange(
+                        days * 86400
+                    ))
+                    if position == len(chosen) - 1 and \
+                            rng.random() < open_ratio:
+                        solve_rows.append((solve_id, user_id, quiz.id,
+                                           started.isoformat(), '', False,
+                                           0, None, None))
+                        continue
+                    user_answers = answer_choices(rng, quiz.questions, skill)
+                    scores, quiz_score = calculate_scores(quiz.questions,
+                                                          user_answers)
+                    selected = {answer_id for answer_id, chosen_answer
+                                in user_answers.items() if chosen_answer}
+                    finished = started + timedelta(
+                        seconds=rng.randint(20, 60 * len(quiz.questions))
+                    )
+                    packed_scores = None
+                    if question_scores == 'packed':
+                        packed_scores = pack_scores([
+                            qs['score'] for qs in
+                            sorted(scores, key=lambda qs: qs['question_id'])
+                        ])
+                    else:
+                        for qs in scores:
+                            score_rows.append((
+                                take_id(score_table), solve_id, quiz.id,
+                                qs['question_id'], qs['score']
+                            ))
+                    solve_rows.append((
+                        solve_id, user_id, quiz.id, started.isoformat(),
+                        finished.isoformat(), True, quiz_score,
+                        packed_scores, pack_selections(quiz.order, selected)
+                    ))
+                    solve_counts[quiz.id] += 1
+                    selection_counts.update(selected)
+                    if len(solve_rows) >= batch_size:
+                        flush()
+            flush()
+
+        loader.set_counts(quiz_table, 'solve_count', solve_counts)
+        loader.set_counts(answer_table, 'selection_count', selection_counts)
+        loader.reset_sequences(tables)
+    return dict(totals)
+
+
+def answer_choices(rng: random.Random, questions: list, skill: float):
+    choices = {}
+    for question in questions:
+        if question.single_correct_answer:
+            roll = rng.random()
+            if roll < skill:
+                pick = next(a for a in question.answers if a.is_correct)
+            elif roll < skill + (1 - skill) * 0.8:
+                pick = rng.choice(question.answers)
+            else:
+                pick = None
+            for answer in question.answers:
+                choices[answer.id] = answer is pick
+        else:
+            for answer in question.answers:
+                right = rng.random() < skill
+                choices[answer.id] = answer.is_correct == right
+    return choices
@@ -0,0 +1,146 @@
+import argparse
+import os
+import sys
+import timeit
+
+from sqlalchemy.orm import Session
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db import crud, models  # noqa: E402
+from app.db.database import build_engine  # noqa: E402
+from app.db.schema import create_schema  # noqa: E402
+
+
+# The lookups as they were written before they became lambda statements:
+# a Query built, and its cache key computed, on every call.
+def query_user_by_email(db: Session, email: str):
+    return db.query(models.User).filter(models.User.email == email).first()
+
+
+def query_quiz(db: Session, quiz_id: int, user_id: int):
+    return db.query(models.Quiz).filter(
+        models.Quiz.id == quiz_id
+    ).filter(
+        models.Quiz.user_id == user_id
+    ).first()
+
+
+def query_question(db: Session, question_id: int, user_id: int):
+    return db.query(
+        models.Question
+    ).join(
+        models.Quiz, models.Quiz.id == models.Question.quiz_id
+    ).join(
+        models.User, models.User.id == models.Quiz.user_id
+    ).filter(
+        models.Question.id == question_id
+    ).filter(
+        models.User.id == user_id
+    ).first()
+
+
+def query_answer(db: Session, answer_id: int, user_id):
+    return db.query(
+        models.Answer
+    ).join(
+        models.Question, models.Question.id == models.Answer.question_id
+    ).join(
+        models.Quiz, models.Quiz.id == models.Question.quiz_id
+    ).join(
+        models.User, models.User.id == models.Quiz.user_id
+    ).filter(
+        models.Answer.id == answer_id
+    ).filter(
+        models.User.id == user_id
+    ).first()
+
+
+def query_unfinished_solve(db: Session, solve_id: int, user_id: int):
+    return db.query(models.Solve).filter(
+        models.Solve.id == solve_id
+    ).filter(
+        models.Solve.user_id == user_id
+    ).filter(
+        models.Solve.is_finished == False
+    ).first()
+
+
+def seed(db: Session):
+    user = models.User(email='benchmark@testing.com', hashed_password='')
+    db.add(user)
+    db.flush()
+    quiz = models.Quiz(title="Benchmark", user_id=user.id)
+    db.add(quiz)
+    db.flush()
+    question = models.Question(description="Question", quiz_id=quiz.id)
+    db.add(question)
+    db.flush()
+    answer = models.Answer(description="Answer", question_id=question.id)
+    solve = models.Solve(user_id=user.id, quiz_id=quiz.id)
+    db.add_all([answer, solve])
+    db.commit()
+    return user, quiz, question, answer, solve
+
+
+def lookups(user, quiz, question, answer, solve):
+    return {
+        'get_user_by_email': (
+            (query_user_by_email, crud.get_user_by_email), (user.email,)
+        ),
+        'get_quiz': ((query_quiz, crud.get_quiz), (quiz.id, user.id)),
+        'get_question': (
+            (query_question, crud.get_question), (question.id, user.id)
+        ),
+        'get_answer': ((query_answer, crud.get_answer), (answer.id, user.id)),
+        'get_unfinished_solve': (
+            (query_unfinished_solve, crud.get_unfinished_solve),
+            (solve.id, user.id)
+        ),
+    }
+
+
+def per_call(db: Session, lookup, args, number: int, repeat: int):
+    # The identity map would otherwise hand back the same objects without
+    # the ORM loading the rows again.
+    def run():
+        db.expunge_all()
+        lookup(db, *args)
+
+    run()
+    return min(timeit.repeat(run, number=number, repeat=repeat)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the per-call overhead of the hot crud lookups, "
+                    "built as a Query each call and as cached lambda "
+                    "statements."
+    )
+    parser.add_argument('--url', default='sqlite://',
+                        help="database to run on (default: in memory)")
+    parser.add_argument('--number', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    engine = build_engine(args.url)
+    create_schema(engine)
+    with Session(bind=engine) as db:
+        rows = seed(db)
+        try:
+            print(f"{'lookup':<22}{'query':>10}{'lambda':>10}{'saved':>8}")
+            for name, (functions, call_args) in lookups(*rows).items():
+                before, after = (
+                    per_call(db, function, call_args, args.number,
+                             args.repeat) * 1e6
+                    for function in functions
+                )
+                print(f"{name:<22}{before:>8.1f}us{after:>8.1f}us"
+                      f"{1 - after / before:>8.0%}")
+        finally:
+            db.delete(rows[0])
+            db.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+SETTINGS = (
+    'SECRET_KEY', 'ALGORITHM', 'ACCESS_TOKEN_EXPIRE_MINUTES',
+    'POSTGRES_DB', 'POSTGRES_DB_TEST', 'POSTGRES_USER', 'POSTGRES_PASS',
+    'DATABASE_URL', 'DATABASE_TEST_URL',
+)
+
+
+def import_times(module: str):
+    # Runs from an empty directory with the settings removed from the
+    # environment, so a .env file can't hide an import-time dependency on
+    # the configuration or the database.
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {k: v for k, v in os.environ.items() if k not in SETTINGS}
+    env['PYTHONPATH'] = root
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=os.path.join(root, 'benchmarks'),
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode:
+        sys.exit(result.stderr.splitlines()[-1])
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure how long importing the app takes."
+    )
+    parser.add_argument('--module', default='app.api')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    runs = [import_times(args.module) for _ in range(args.runs)]
+    total = statistics.median(run[args.module] for run in runs)
+    print(f"{args.module}: {total / 1000:.1f} ms "
+          f"(median of {args.runs} runs)")
+    slowest = sorted(
+        (item for item in runs[-1].items() if item[0] != args.module),
+        key=lambda item: -item[1]
+    )
+    for name, cumulative in slowest[:args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
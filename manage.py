@@ -0,0 +1,339 @@
+import argparse
+import sys
+import time
+
+
+def create_schema(args):
+    from app.db import database, schema
+    bind = database.get_testing_engine() if args.test \
+        else database.get_engine()
+    if args.drop:
+        schema.drop_schema(bind)
+    expired = schema.create_schema(bind)
+    if expired:
+        print(f"expired {expired} open solves of users with more than one, "
+              f"keeping the latest")
+
+
+def partition_solves(args):
+    from app.db import database, partitioning
+    bind = database.get_testing_engine() if args.test \
+        else database.get_engine()
+    if partitioning.partition_solves(bind, args.partitions):
+        print(f"solves and questionscores now have {args.partitions} "
+              f"partitions")
+    else:
+        print("solves is already partitioned")
+
+
+def generate_data(args):
+    from decouple import config
+    from app.db import database
+    from app.tools import synthetic
+    bind = database.get_testing_engine() if args.test \
+        else database.get_engine()
+    start = time.perf_counter()
+    totals = synthetic.generate(
+        bind,
+        users=args.users,
+        authors=args.authors,
+        quizes_per_author=args.quizes_per_author,
+        published=args.published,
+        single_ratio=args.single_ratio,
+        solves=args.solves,
+        open_ratio=args.open_ratio,
+        days=args.days,
+        question_scores=args.question_scores or config(
+            'QUESTION_SCORES_STORAGE', default='rows'
+        ),
+        batch_size=args.batch_size,
+        seed=args.seed,
+        progress=lambda name, count: print(f'{name}: {count}', end='\r')
+    )
+    seconds = time.perf_counter() - start
+    rows = sum(totals.values())
+    for name, count in totals.items():
+        print(f'{name:<16}{count:>12}')
+    print(f'{rows} rows in {seconds:.1f} s ({rows / seconds:,.0f} rows/s)')
+
+
+def export_quizes(args):
+    from sqlalchemy import select
+    from app.db import database, models
+    from app.tools import interchange
+    bind = database.get_testing_engine() if args.test \
+        else database.get_engine()
+    output = sys.stdout.buffer if args.output == '-' \
+        else open(args.output, 'wb')
+    with bind.connect() as connection, output:
+        user_id = None
+        if args.user:
+            user_id = connection.execute(
+                select(models.User.id).where(models.User.email == args.user)
+            ).scalar()
+            if user_id is None:
+                sys.exit(f"No user {args.user}")
+        for chunk in interchange.dump(interchange.export_quizes(
+                connection, user_id=user_id, with_solves=args.solves
+        )):
+            output.write(chunk)
+
+
+def import_quizes(args):
+    from decouple import config
+    from sqlalchemy import select
+    from app.db import database, models
+    from app.tools import interchange
+    bind = database.get_testing_engine() if args.test \
+        else database.get_engine()
+    source = sys.stdin.buffer if args.file == '-' else open(args.file, 'rb')
+    start = time.perf_counter()
+    with bind.begin() as connection, source:
+        owner_id = connection.execute(
+            select(models.User.id).where(models.User.email == args.owner)
+        ).scalar()
+        if owner_id is None:
+            sys.exit(f"No user {args.owner}")
+        try:
+            totals = interchange.import_quizes(
+                connection, interchange.load(source), owner_id=owner_id,
+                with_solves=not args.no_solves,
+                scores_storage=args.question_scores or config(
+                    'QUESTION_SCORES_STORAGE', default='rows'
+                ),
+                batch_size=args.batch_size
+            )
+        except ValueError as error:
+            sys.exit(f"Import failed, nothing was written: {error}")
+    seconds = time.perf_counter() - start
+    for name, count in totals.items():
+        print(f'{name:<16}{count:>12}')
+    print(f'in {seconds:.1f} s')
+
+
+def create_users(args):
+    import csv
+    from collections import Counter
+    from app.db import database
+    from app.tools import provisioning
+    sessionmaker = database.TestingSessionLocal if args.test \
+        else database.SessionLocal
+    with open(args.file, 'rb') as f:
+        data = f.read()
+    content_type = 'text/csv' if args.file.endswith('.csv') \
+        else 'application/json'
+    start = time.perf_counter()
+    with sessionmaker() as db:
+        report = provisioning.provision_users(db, data, content_type)
+    seconds = time.perf_counter() - start
+    if args.report:
+        with open(args.report, 'w', newline='') as f:
+            writer = csv.DictWriter(f, ['row', 'email', 'status', 'id',
+                                        'detail'])
+            writer.writeheader()
+            writer.writerows(report)
+    for status, count in Counter(row['status'] for row in report).items():
+        print(f'{status:<16}{count:>12}')
+    print(f'in {seconds:.1f} s')
+
+
+def rescore(args):
+    from app.db import database
+    from app.tools import rescore
+    bind = database.get_testing_engine() if args.test \
+        else database.get_engine()
+    checkpoint = rescore.Checkpoint('' if args.dry_run else args.checkpoint)
+    if args.restart:
+        checkpoint.remove()
+        checkpoint = rescore.Checkpoint(checkpoint.path)
+    if checkpoint.done:
+        print(f"Resuming after {len(checkpoint.done)} quizes")
+    start = time.perf_counter()
+    totals = rescore.rescore(
+        bind, quiz_ids=args.quiz or None, jobs=args.jobs,
+        checkpoint=checkpoint, batch_size=args.batch_size,
+        dry_run=args.dry_run,
+        progress=lambda count, totals: print(
+            f"{count} quizes, {totals['solves']} solves, "
+            f"{totals['changed']} changed", end='\r'
+        )
+    )
+    checkpoint.remove()
+    print()
+    for name in ('solves', 'changed', 'question_scores_changed', 'skipped',
+                 'failed'):
+        print(f'{name:<24}{totals[name]:>12}')
+    print(f'in {time.perf_counter() - start:.1f} s')
+
+
+def archive_solves(args):
+    from datetime import timedelta
+    from app.db import database
+    from app.jobs.archiver import SolveArchiver
+    bind = database.get_testing_engine() if args.test \
+        else database.get_engine()
+    start = time.perf_counter()
+    total = SolveArchiver(
+        timedelta(days=args.older_than_days), batch_size=args.batch_size
+    ).archive(bind)
+    print(f"Archived {total} solves in {time.perf_counter() - start:.1f} s")
+
+
+def stream_events(args):
+    from app.db import database
+    from app.tools import changes
+    bind = database.get_testing_engine() if args.test \
+        else database.get_engine()
+    sink = changes.FileSink(args.file)
+    try:
+        total = changes.stream_changes(
+            bind, sink, batch_size=args.batch_size, follow=args.follow,
+            poll_seconds=args.poll_seconds
+        )
+    except KeyboardInterrupt:
+        total = None
+    except ValueError as e:
+        sys.exit(str(e))
+    if total is not None:
+        print(f"Wrote {total} events, up to {sink.last_position()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quiz builder management")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('create-schema',
+                                  help="create the database tables")
+    command.add_argument('--test', action='store_true',
+                         help="use the test database")
+    command.add_argument('--drop', action='store_true',
+                         help="drop the existing tables first")
+    command.set_defaults(run=create_schema)
+
+    command = commands.add_parser(
+        'partition-solves',
+        help="hash partition solves and questionscores on quiz_id "
+             "(PostgreSQL)"
+    )
+    command.add_argument('--test', action='store_true',
+                         help="use the test database")
+    command.add_argument('--partitions', type=int, default=16)
+    command.set_defaults(run=partition_solves)
+
+    command = commands.add_parser(
+        'generate-data',
+        help="fill the database with synthetic users, quizes and solves"
+    )
+    command.add_argument('--test', action='store_true',
+                         help="use the test database")
+    command.add_argument('--users', type=int, default=1000)
+    command.add_argument('--authors', type=float, default=0.1,
+                         help="share of the users who write quizes")
+    command.add_argument('--quizes-per-author', type=float, default=5.0,
+                         help="mean of a geometric distribution")
+    command.add_argument('--published', type=float, default=0.9,
+                         help="share of the quizes that are published")
+    command.add_argument('--single-ratio', type=float, default=0.5,
+                         help="share of single correct answer questions")
+    command.add_argument('--solves', type=int, default=100000,
+                         help="about this many solves in total")
+    command.add_argument('--open-ratio', type=float, default=0.01,
+                         help="share of the users with an unfinished solve")
+    command.add_argument('--days', type=int, default=90,
+                         help="solves start within this many days back")
+    command.add_argument('--question-scores', choices=['rows', 'packed'],
+                         help="default: QUESTION_SCORES_STORAGE")
+    command.add_argument('--batch-size', type=int, default=10000)
+    command.add_argument('--seed', type=int, default=0)
+    command.set_defaults(run=generate_data)
+
+    command = commands.add_parser(
+        'export-quizes',
+        help="write quizes with their questions and answers as gzipped "
+             "NDJSON"
+    )
+    command.add_argument('--test', action='store_true',
+                         help="use the test database")
+    command.add_argument('--user', help="only this user's quizes (email)")
+    command.add_argument('--solves', action='store_true',
+                         help="include the finished solves")
+    command.add_argument('-o', '--output', default='-',
+                         help="file to write, default: stdout")
+    command.set_defaults(run=export_quizes)
+
+    command = commands.add_parser(
+        'import-quizes',
+        help="add the quizes of an export, with new ids"
+    )
+    command.add_argument('file', help="export to read, - for stdin")
+    command.add_argument('--owner', required=True,
+                         help="email of the user who gets the quizes")
+    command.add_argument('--test', action='store_true',
+                         help="use the test database")
+    command.add_argument('--no-solves', action='store_true',
+                         help="skip the solves in the export")
+    command.add_argument('--question-scores', choices=['rows', 'packed'],
+                         help="default: QUESTION_SCORES_STORAGE")
+    command.add_argument('--batch-size', type=int, default=1000)
+    command.set_defaults(run=import_quizes)
+
+    command = commands.add_parser(
+        'create-users',
+        help="create users from a CSV (email,password) or JSON file"
+    )
+    command.add_argument('file')
+    command.add_argument('--test', action='store_true',
+                         help="use the test database")
+    command.add_argument('--report',
+                         help="write the status of every row to this CSV")
+    command.set_defaults(run=create_users)
+
+    command = commands.add_parser(
+        'rescore',
+        help="recompute the scores of finished solves from their selections"
+    )
+    command.add_argument('--test', action='store_true',
+                         help="use the test database")
+    command.add_argument('--quiz', type=int, action='append',
+                         help="only this quiz; can be repeated")
+    command.add_argument('--jobs', type=int, default=1,
+                         help="worker processes, each taking whole quizes")
+    command.add_argument('--checkpoint', default='rescore-checkpoint.json',
+                         help="progress file, to resume an interrupted run")
+    command.add_argument('--restart', action='store_true',
+                         help="ignore the progress file")
+    command.add_argument('--batch-size', type=int, default=1000)
+    command.add_argument('--dry-run', action='store_true',
+                         help="only count the solves that would change")
+    command.set_defaults(run=rescore)
+
+    command = commands.add_parser(
+        'archive-solves',
+        help="move old finished solves to the archive directory"
+    )
+    command.add_argument('--test', action='store_true',
+                         help="use the test database")
+    command.add_argument('--older-than-days', type=float, required=True)
+    command.add_argument('--batch-size', type=int, default=5000)
+    command.set_defaults(run=archive_solves)
+
+    command = commands.add_parser(
+        'stream-events',
+        help="append the change stream to an NDJSON file, resuming after "
+             "its last event"
+    )
+    command.add_argument('file')
+    command.add_argument('--test', action='store_true',
+                         help="use the test database")
+    command.add_argument('--follow', action='store_true',
+                         help="keep waiting for new events")
+    command.add_argument('--batch-size', type=int, default=1000)
+    command.add_argument('--poll-seconds', type=float, default=1.0)
+    command.set_defaults(run=stream_events)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import argparse
+import os
+
+import uvicorn
+from decouple import config
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Run the quiz builder API with multiple workers."
+    )
+    parser.add_argument('--host', default=config('HOST', default='0.0.0.0'))
+    parser.add_argument('--port', type=int,
+                        default=config('PORT', default=8081, cast=int))
+    parser.add_argument('--workers', type=int,
+                        default=config('WEB_WORKERS',
+                                       default=os.cpu_count() or 1,
+                                       cast=int))
+    parser.add_argument('--backlog', type=int,
+                        default=config('BACKLOG', default=2048, cast=int))
+    parser.add_argument('--keep-alive', type=int,
+                        default=config('KEEP_ALIVE_SECONDS', default=5,
+                                       cast=int),
+                        help="seconds an idle keep-alive connection is kept")
+    parser.add_argument('--drain-timeout', type=float,
+                        default=config('SHUTDOWN_DRAIN_SECONDS', default=30,
+                                       cast=float),
+                        help="seconds each worker waits on shutdown for "
+                             "queued post-solve jobs")
+    parser.add_argument('--access-log', action=argparse.BooleanOptionalAction,
+                        default=False)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    # Workers are separate processes; they read these back through config().
+    os.environ['SHUTDOWN_DRAIN_SECONDS'] = str(args.drain_timeout)
+    uvicorn.run(
+        "app.api:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        # "auto" picks uvloop and httptools when they are installed.
+        loop="auto",
+        http="auto",
+        backlog=args.backlog,
+        timeout_keep_alive=args.keep_alive,
+        access_log=args.access_log,
+        proxy_headers=True,
+    )
+
+
+if __name__ == "__main__":
+    main()
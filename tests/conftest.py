@@ -0,0 +1,74 @@
+import os
+import shutil
+import tempfile
+
+# Set before the app is imported, so the shared quiz cache of the tests
+# stays out of the host's.
+os.environ['QUIZ_CACHE_DIR'] = tempfile.mkdtemp(prefix='quiz-builder-cache-')
+
+import pytest  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.api import app, get_db  # noqa: E402
+from app.db.database import get_testing_engine  # noqa: E402
+from app.db.database import TestingSessionLocal  # noqa: E402
+from app.db.schema import create_schema  # noqa: E402
+
+
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+app.dependency_overrides[get_db] = override_get_db
+
+client = TestClient(app)
+
+
+def login(email, password='secret'):
+    client.post("/users", json={"email": email, "password": password})
+    response = client.post(
+        '/token',
+        data={'username': email, 'password': password}
+    )
+    assert response.status_code == 200, response.text
+    return {'Authorization': f'Bearer {response.json()["access_token"]}'}
+
+
+# A published quiz with one question and a right and a wrong answer,
+# returned as (answer_id, is_correct) pairs.
+def publish_quiz(headers, title='Published'):
+    quiz_id = client.post('/users/quiz', json={"title": title},
+                          headers=headers).json()['id']
+    question_id = client.post(
+        f'/quizes/{quiz_id}/question',
+        json={"description": "Question", "single_correct_answer": True},
+        headers=headers
+    ).json()['id']
+    answer_ids = [
+        (client.post(f'/questions/{question_id}/answer',
+                     json={"description": "Answer", "is_correct": is_correct},
+                     headers=headers).json()['id'], is_correct)
+        for is_correct in (True, False)
+    ]
+    response = client.put(f'/quizes/{quiz_id}',
+                          json={"title": title, "is_active": True},
+                          headers=headers)
+    assert response.status_code == 200, response.text
+    return quiz_id, answer_ids
+
+
+@pytest.fixture(scope='session', autouse=True)
+def quiz_cache_directory():
+    yield os.environ['QUIZ_CACHE_DIR']
+    shutil.rmtree(os.environ['QUIZ_CACHE_DIR'], ignore_errors=True)
+
+
+# Importing the app no longer creates the tables, so the test database is
+# brought up to date once per run, as `manage.py create-schema --test` does.
+@pytest.fixture(scope='session', autouse=True)
+def testing_schema():
+    create_schema(get_testing_engine())
@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta
+from random import random
+
+from app.db import models
+from app.db.database import get_testing_engine, TestingSessionLocal
+from app.helpers.archive import get_archive
+from app.jobs.archiver import SolveArchiver
+from app.jobs.tasks import job_queue
+from .conftest import client, login, publish_quiz
+
+
+def test_archived_solves_are_still_read(monkeypatch, tmp_path):
+    monkeypatch.setenv('ARCHIVE_DIR', str(tmp_path))
+    get_archive.cache_clear()
+    author_headers = login(f'author{random()}@testing.com')
+    quiz_id, answer_ids = publish_quiz(author_headers, "Archived")
+    try:
+        solver_headers = login(f'solver{random()}@testing.com')
+        response = client.post('/solve', headers=solver_headers)
+        assert response.status_code == 200, response.text
+        assert response.json()['quiz_id'] == quiz_id
+        solve_id = response.json()['id']
+        response = client.put(
+            f"/solve/{solve_id}",
+            json=[{"id": answer_id, "user_answer": is_correct}
+                  for answer_id, is_correct in answer_ids],
+            headers=solver_headers
+        )
+        assert response.status_code == 200, response.text
+        job_queue.join()
+        expected = client.get(f'/quizes/{quiz_id}/solves',
+                              headers=author_headers).json()
+        assert [solve['id'] for solve in expected] == [solve_id]
+
+        with TestingSessionLocal() as db:
+            db.query(models.Solve).filter(models.Solve.id == solve_id).update({
+                'finish_datetime':
+                    (datetime.utcnow() - timedelta(days=60)).isoformat()
+            })
+            db.commit()
+        expected[0]['finish_datetime'] = client.get(
+            '/users/finished_solves', headers=solver_headers
+        ).json()['finish_datetime']
+
+        archiver = SolveArchiver(timedelta(days=30))
+        assert archiver.archive(get_testing_engine()) == 1
+        assert len(list(tmp_path.glob('*.ndjson.gz'))) == 1
+        with TestingSessionLocal() as db:
+            assert db.get(models.Solve, solve_id) is None
+
+        assert client.get(f'/quizes/{quiz_id}/solves',
+                          headers=author_headers).json() == expected
+        archive, reads = get_archive(), []
+        read = archive.read
+
+        def counted_read(*block):
+            reads.append(block)
+            return read(*block)
+
+        monkeypatch.setattr(archive, 'read', counted_read)
+        response = client.get('/users/finished_solves',
+                              headers=solver_headers)
+        monkeypatch.delattr(archive, 'read')
+        assert response.status_code == 200, response.text
+        assert response.json()['id'] == solve_id
+        # Only the block holding the solve was read.
+        assert len(reads) == 1
+        assert response.json()['quiz']['id'] == quiz_id
+        assert response.json()['question_scores'] == \
+            expected[0]['question_scores']
+
+        # Solved already, so it isn't handed out again.
+        response = client.post('/solve', headers=solver_headers)
+        assert response.status_code == 404 or \
+            response.json()['quiz_id'] != quiz_id
+
+        response = client.get(f'/quizes/{quiz_id}/leaderboard',
+                              headers=author_headers)
+        assert [entry['solve_id'] for entry in response.json()] == \
+            [solve_id]
+    finally:
+        client.delete(f'/quizes/{quiz_id}', headers=author_headers)
+        monkeypatch.undo()
+        get_archive.cache_clear()
@@ -0,0 +1,86 @@
+from random import random
+
+from app.db.database import get_testing_engine
+from app.helpers.banks import draw_ordinals
+from app.jobs.tasks import job_queue
+from app.tools.rescore import rescore_quiz
+from .conftest import client, login
+
+
+def test_draw_ordinals():
+    assert draw_ordinals(7, 1000, 5) == draw_ordinals(7, 1000, 5)
+    assert len(set(draw_ordinals(7, 1000, 5))) == 5
+    assert draw_ordinals(7, 3, 5) == [0, 1, 2]
+
+
+def test_bank_draws_questions_per_solve():
+    headers = login(f'author{random()}@testing.com')
+    quiz_id = client.post('/users/quiz',
+                          json={"title": "Bank", "draw_count": 30},
+                          headers=headers).json()['id']
+    try:
+        correct = {}
+        for number in range(25):
+            question_id = client.post(
+                f'/quizes/{quiz_id}/question',
+                json={"description": f"Question {number}",
+                      "single_correct_answer": True},
+                headers=headers
+            ).json()['id']
+            for is_correct in (True, False):
+                answer_id = client.post(
+                    f'/questions/{question_id}/answer',
+                    json={"description": "Answer", "is_correct": is_correct},
+                    headers=headers
+                ).json()['id']
+                correct[answer_id] = is_correct
+
+        response = client.put(f'/quizes/{quiz_id}',
+                              json={"title": "Bank", "is_active": True},
+                              headers=headers)
+        assert response.status_code == 405
+        response = client.put(f'/quizes/{quiz_id}',
+                              json={"title": "Bank", "is_active": True,
+                                    "draw_count": 3},
+                              headers=headers)
+        assert response.status_code == 200, response.text
+
+        drawn = set()
+        for _ in range(2):
+            solver_headers = login(f'solver{random()}@testing.com')
+            response = client.post('/solve', headers=solver_headers)
+            assert response.status_code == 200, response.text
+            solve = response.json()
+            assert solve['quiz_id'] == quiz_id
+            questions = solve['quiz']['questions']
+            assert len(questions) == 3
+            assert [q['id'] for q in questions] == \
+                sorted(q['id'] for q in questions)
+            drawn.update(q['id'] for q in questions)
+            response = client.get('/users/unfinished_solves',
+                                  headers=solver_headers)
+            assert response.json()['quiz']['questions'] == questions
+
+            response = client.put(
+                f"/solve/{solve['id']}",
+                json=[{"id": answer['id'],
+                       "user_answer": correct[answer['id']]}
+                      for question in questions
+                      for answer in question['answers']],
+                headers=solver_headers
+            )
+            assert response.status_code == 200, response.text
+            assert response.json()['quiz_score'] == 100
+        job_queue.join()
+
+        solves = client.get(f'/quizes/{quiz_id}/solves',
+                            headers=headers).json()
+        assert len(solves) == 2
+        assert {qs['question_id'] for solve in solves
+                for qs in solve['question_scores']} == drawn
+        with get_testing_engine().begin() as connection:
+            totals = rescore_quiz(connection, quiz_id, dry_run=True)
+        assert totals['solves'] == 2
+        assert totals['changed'] == totals['failed'] == 0
+    finally:
+        client.delete(f'/quizes/{quiz_id}', headers=headers)
@@ -0,0 +1,74 @@
+from random import random
+
+from sqlalchemy import event
+
+from app.db.database import get_testing_engine
+from .conftest import client, login
+
+
+def create_quiz(headers):
+    quiz_id = client.post('/users/quiz', json={"title": "Batch"},
+                          headers=headers).json()['id']
+    question_ids, answer_ids = [], []
+    for _ in range(2):
+        question_ids.append(client.post(
+            f'/quizes/{quiz_id}/question',
+            json={"description": "Question", "single_correct_answer": True},
+            headers=headers
+        ).json()['id'])
+        for is_correct in (True, False):
+            answer_ids.append(client.post(
+                f'/questions/{question_ids[-1]}/answer',
+                json={"description": "Answer", "is_correct": is_correct},
+                headers=headers
+            ).json()['id'])
+    return quiz_id, question_ids, answer_ids
+
+
+def test_batch_get():
+    headers = login(f'author{random()}@testing.com')
+    other_headers = login(f'other{random()}@testing.com')
+    quiz_id, question_ids, answer_ids = create_quiz(headers)
+    other_quiz_id, other_question_ids, _ = create_quiz(other_headers)
+    try:
+        queries = []
+
+        def count(*args):
+            queries.append(args[2])
+
+        event.listen(get_testing_engine(), 'before_cursor_execute', count)
+        try:
+            response = client.post('/batch/get', json={
+                'quiz_ids': [quiz_id, other_quiz_id],
+                'question_ids': question_ids[::-1] + question_ids,
+                'answer_ids': answer_ids[1:]
+            }, headers=headers)
+        finally:
+            event.remove(get_testing_engine(), 'before_cursor_execute',
+                         count)
+        assert response.status_code == 200, response.text
+        result = response.json()
+        assert [quiz['id'] for quiz in result['quizes']] == [quiz_id]
+        assert len(result['quizes'][0]['questions']) == 2
+        assert [q['id'] for q in result['questions']] == question_ids[::-1]
+        assert [a['id'] for a in result['answers']] == answer_ids[1:]
+        assert result['missing'] == {'quiz_ids': [other_quiz_id],
+                                     'question_ids': [], 'answer_ids': []}
+        # The questions and answers came with their quiz.
+        assert sum('FROM answers' in query for query in queries) == 1
+
+        response = client.post('/batch/get', json={
+            'question_ids': [other_question_ids[0], -1, question_ids[0]]
+        }, headers=headers)
+        assert response.json()['missing']['question_ids'] == \
+            [other_question_ids[0], -1]
+        assert [q['id'] for q in response.json()['questions']] == \
+            [question_ids[0]]
+
+        response = client.post('/batch/get',
+                               json={'answer_ids': list(range(1001))},
+                               headers=headers)
+        assert response.status_code == 422
+    finally:
+        client.delete(f'/quizes/{quiz_id}', headers=headers)
+        client.delete(f'/quizes/{other_quiz_id}', headers=other_headers)
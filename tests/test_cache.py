@@ -0,0 +1,70 @@
+from app.db import crud
+from app.db.database import build_engine
+from app.db.schema import create_schema, drop_schema
+from app.helpers.cache import LRUCache, TwoTierCache
+from sqlalchemy.orm import Session
+
+
+def shared_cache(directory, namespace='db'):
+    cache = TwoTierCache(directory=str(directory))
+    cache.open(namespace)
+    return cache
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.put(('a', 1), b'a')
+    cache.put(('b', 1), b'b')
+    cache.get(('a', 1))
+    cache.put(('c', 1), b'c')
+    assert cache.get(('b', 1)) is None
+    assert cache.get(('a', 1)) == b'a'
+
+
+def test_workers_share_payloads(tmp_path):
+    first = shared_cache(tmp_path)
+    second = shared_cache(tmp_path)
+    first.put('quiz-1', 1, b'{"id": 1}')
+    assert second.get('quiz-1', 1) == b'{"id": 1}'
+    assert second.get('quiz-1', 2) is None
+
+
+def test_databases_do_not_share_payloads(tmp_path):
+    first = shared_cache(tmp_path, 'first')
+    second = shared_cache(tmp_path, 'second')
+    first.put('quiz-1', 1, b'{"id": 1}')
+    assert second.get('quiz-1', 1) is None
+
+
+def test_new_version_replaces_old_one(tmp_path):
+    cache = shared_cache(tmp_path)
+    cache.put('quiz-1', 1, b'old')
+    cache.put('quiz-1', 2, b'new')
+    assert [p.name for p in (tmp_path / 'db').iterdir()] == ['quiz-1-2']
+
+
+def test_discard(tmp_path):
+    cache = shared_cache(tmp_path)
+    cache.put('quiz-1', 1, b'{}')
+    cache.discard('quiz-1')
+    assert cache.get('quiz-1', 1) is None
+    assert list((tmp_path / 'db').iterdir()) == []
+
+
+def test_database_namespace(tmp_path):
+    def namespace(engine):
+        with Session(bind=engine) as db:
+            return crud.get_database_namespace(db)
+
+    first = build_engine(f'sqlite:///{tmp_path / "first.db"}')
+    second = build_engine(f'sqlite:///{tmp_path / "second.db"}')
+    create_schema(first)
+    create_schema(second)
+    before = namespace(first)
+    assert namespace(second) != before
+    create_schema(first)
+    assert namespace(first) == before
+    # A database created again starts its ids and versions over.
+    drop_schema(first)
+    create_schema(first)
+    assert namespace(first) != before
@@ -0,0 +1,92 @@
+import asyncio
+import json
+import threading
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from app.db.database import get_testing_engine
+from app.db.replicas import RoutingSession
+from app.events.hub import EventHub, MAX_NOTIFY_PAYLOAD
+
+
+def test_events_reach_every_subscriber_of_the_topic():
+    hub = EventHub(notify=False)
+
+    async def watch():
+        first, second = hub.subscribe('quiz-1'), hub.subscribe('quiz-1')
+        other = hub.subscribe('quiz-2')
+        thread = threading.Thread(target=hub.deliver, args=('quiz-1', 'a'))
+        thread.start()
+        thread.join()
+        assert await first.get(1) == 'a'
+        assert await second.get(1) == 'a'
+        assert other._events.empty()
+        for subscription in (first, second, other):
+            hub.unsubscribe(subscription)
+        assert hub.subscribers('quiz-1') == 0
+
+    asyncio.run(watch())
+
+
+def test_slow_subscribers_drop_their_oldest_events():
+    hub = EventHub(buffer_size=2, notify=False)
+
+    async def watch():
+        subscription = hub.subscribe('quiz-1')
+        for data in 'abc':
+            hub.deliver('quiz-1', data)
+        await asyncio.sleep(0)
+        assert [await subscription.get(1) for _ in range(2)] == ['b', 'c']
+        assert subscription.dropped == 1
+        hub.close()
+        assert await subscription.get(1) is None
+
+    asyncio.run(watch())
+
+
+def test_events_are_published_on_commit_only():
+    hub = EventHub(notify=True)
+    engine = create_engine('sqlite://')
+
+    async def watch():
+        subscription = hub.subscribe('quiz-1')
+        with RoutingSession(bind=engine) as db:
+            db.execute(text('SELECT 1'))
+            hub.publish(db, 'quiz-1', {'id': 1})
+            db.rollback()
+            db.execute(text('SELECT 1'))
+            hub.publish(db, 'quiz-1', {'id': 2})
+            db.commit()
+        assert await subscription.get(1) == '{"id": 2}'
+        assert subscription._events.empty()
+
+    asyncio.run(watch())
+
+
+def test_large_events_are_sent_by_reference():
+    engine = get_testing_engine()
+    if engine.dialect.name != 'postgresql':
+        pytest.skip("NOTIFY needs PostgreSQL")
+    large = {'scores': 'x' * MAX_NOTIFY_PAYLOAD}
+    hub = EventHub(fetch=lambda bind, reference: {**large, 'id': reference})
+    hub.listen(engine)
+
+    async def watch():
+        subscription = hub.subscribe('quiz-1')
+        with RoutingSession(bind=engine) as db:
+            hub.publish(db, 'quiz-1', large, reference=7)
+            db.commit()
+        assert await subscription.get(5) == \
+            json.dumps({**large, 'id': 7})
+        assert hub.local_only == 0
+
+        # Without a reference it only reaches this worker, and says so.
+        with RoutingSession(bind=engine) as db:
+            hub.publish(db, 'quiz-1', large)
+            db.commit()
+        assert await subscription.get(5) == json.dumps(large)
+        assert hub.local_only == 1
+        hub.close()
+
+    asyncio.run(watch())
@@ -0,0 +1,154 @@
+import gzip
+import io
+import json
+from random import random
+
+import pytest
+from sqlalchemy import func, select
+
+from app.db import models
+from app.db.database import build_engine, get_testing_engine
+from app.db.schema import create_schema
+from app.tools import interchange
+from app.tools.bulk import Loader
+from app.tools.synthetic import generate
+from .conftest import client, login
+
+
+def quiz_tree(quiz):
+    return (quiz['title'], quiz['is_active'], [
+        (question['description'], question['single_correct_answer'],
+         sorted(answer['description'] for answer in question['answers']))
+        for question in sorted(quiz['questions'], key=lambda q: q['id'])
+    ])
+
+
+def test_export_and_import_quizes():
+    author_headers = login(f'author{random()}@testing.com')
+    quiz_id = client.post('/users/quiz', json={"title": "Exported"},
+                          headers=author_headers).json()['id']
+    for description in ('First', 'Second'):
+        question_id = client.post(
+            f'/quizes/{quiz_id}/question',
+            json={"description": description, "single_correct_answer": True},
+            headers=author_headers
+        ).json()['id']
+        for is_correct in (True, False):
+            client.post(f'/questions/{question_id}/answer',
+                        json={"description": f'{description} {is_correct}',
+                              "is_correct": is_correct},
+                        headers=author_headers)
+    client.put(f'/quizes/{quiz_id}',
+               json={"title": "Exported", "is_active": True},
+               headers=author_headers)
+
+    assert client.get('/export/quizes?solves=true',
+                      headers=author_headers).status_code == 403
+    response = client.get('/export/quizes', headers=author_headers)
+    assert response.status_code == 200, response.text
+    lines = gzip.decompress(response.content).decode().splitlines()
+    assert json.loads(lines[0])['format'] == interchange.FORMAT
+    assert len(lines) == 2
+
+    importer_headers = login(f'importer{random()}@testing.com')
+    response = client.post('/import/quizes', data=response.content,
+                            headers=importer_headers)
+    assert response.status_code == 200, response.text
+    assert response.json() == {'quizes': 1, 'questions': 2, 'answers': 4}
+
+    exported = client.get(f'/quizes/{quiz_id}', headers=author_headers)
+    imported = client.get('/quizes', headers=importer_headers).json()
+    assert len(imported) == 1 and imported[0]['id'] != quiz_id
+    assert quiz_tree(imported[0]) == quiz_tree(exported.json())
+    assert [
+        stats['is_correct'] for stats in client.get(
+            f'/quizes/{imported[0]["id"]}/answer-stats',
+            headers=importer_headers
+        ).json()
+    ] == [True, False, True, False]
+
+    client.delete(f'/quizes/{quiz_id}', headers=author_headers)
+    client.delete(f'/quizes/{imported[0]["id"]}', headers=importer_headers)
+
+
+def test_import_rejects_invalid_quizes():
+    headers = login(f'importer{random()}@testing.com')
+    header = json.dumps({'format': interchange.FORMAT,
+                         'version': interchange.VERSION})
+    too_many = json.dumps({
+        'type': 'quiz', 'id': 1, 'title': 'Too long', 'is_active': False,
+        'questions': [{'description': 'Question',
+                       'single_correct_answer': True,
+                       'answers': []}] * 11
+    })
+    for body in (b'not an export', f'{header}\n{too_many}\n'.encode(),
+                 f'{header}\n{{"type": "quiz"}}\n'.encode()):
+        response = client.post('/import/quizes', data=body, headers=headers)
+        assert response.status_code == 422, response.text
+    assert client.get('/quizes', headers=headers).json() == []
+
+
+def test_round_trip_with_solves(tmp_path):
+    engine = build_engine(f'sqlite:///{tmp_path / "interchange.db"}')
+    create_schema(engine)
+    generate(engine, users=40, solves=200, open_ratio=0.2)
+
+    with engine.connect() as connection:
+        last_quiz_id = connection.execute(
+            select(func.max(models.Quiz.id))
+        ).scalar()
+        data = b''.join(interchange.dump(interchange.export_quizes(
+            connection, with_solves=True, batch_size=3
+        )))
+    with engine.begin() as connection:
+        totals = interchange.import_quizes(
+            connection, interchange.load(io.BufferedReader(io.BytesIO(data))),
+            owner_id=1, batch_size=4
+        )
+
+    def sums(connection, imported):
+        quiz_ids = select(models.Quiz.id).where(
+            (models.Quiz.id > last_quiz_id) == imported
+        )
+        return (
+            connection.execute(
+                select(func.count(), func.sum(models.Quiz.solve_count))
+                .where(models.Quiz.id.in_(quiz_ids))
+            ).one(),
+            connection.execute(
+                select(func.sum(models.Answer.selection_count))
+                .join(models.Question)
+                .where(models.Question.quiz_id.in_(quiz_ids))
+            ).scalar(),
+            connection.execute(
+                select(func.count(), func.sum(models.QuestionScore.score))
+                .where(models.QuestionScore.quiz_id.in_(quiz_ids))
+            ).one(),
+        )
+
+    with engine.connect() as connection:
+        assert sums(connection, True) == sums(connection, False)
+    assert totals['solves'] > 0
+    assert totals['skipped_solves'] == 0
+
+
+def test_copy_keeps_control_characters():
+    testing_engine = get_testing_engine()
+    if testing_engine.dialect.name != 'postgresql':
+        pytest.skip("COPY needs PostgreSQL")
+    titles = ['Line\r\nbreak', 'Tab\there', 'Back\\slash \\N \\.',
+              'Bell\b\f\v']
+    quizes = models.Quiz.__table__
+    with testing_engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            loader = Loader(connection)
+            ids = loader.reserve_ids(quizes, len(titles))
+            loader.insert(quizes, ['id', 'title'], list(zip(ids, titles)))
+            assert connection.execute(
+                select(quizes.c.title).where(
+                    quizes.c.id.in_(ids)
+                ).order_by(quizes.c.id)
+            ).scalars().all() == titles
+        finally:
+            transaction.rollback()
@@ -0,0 +1,105 @@
+import threading
+
+from app.helpers.leaderboard import Leaderboard, Leaderboards
+
+
+def test_top_orders_by_score_then_finish_time():
+    board = Leaderboard()
+    board.add(1, 10, 50, '2022-07-01T10:00:00')
+    board.add(2, 11, 100, '2022-07-01T10:05:00')
+    board.add(3, 12, 50, '2022-07-01T09:00:00')
+    board.add(4, 13, -100, '2022-07-01T08:00:00')
+    assert [e['solve_id'] for e in board.top(10)] == [2, 3, 1, 4]
+    assert [e['rank'] for e in board.top(2)] == [1, 2]
+
+
+def test_rank_of():
+    board = Leaderboard()
+    board.add(1, 10, 50, '2022-07-01T10:00:00')
+    board.add(2, 11, 100, '2022-07-01T10:05:00')
+    board.add(3, 12, 50, '2022-07-01T09:00:00')
+    assert board.rank_of(10)['rank'] == 3
+    assert board.rank_of(11)['rank'] == 1
+    assert board.rank_of(12)['rank'] == 2
+    assert board.rank_of(99) is None
+
+
+def test_add_ignores_known_solves():
+    board = Leaderboard()
+    board.add(1, 10, 50, '2022-07-01T10:00:00')
+    board.add(1, 10, 50, '2022-07-01T10:00:00')
+    assert len(board) == 1
+
+
+class SolveRow:
+    def __init__(self, id, user_id, quiz_score, finish_datetime):
+        self.id = id
+        self.user_id = user_id
+        self.quiz_score = quiz_score
+        self.finish_datetime = finish_datetime
+
+
+def solve_finished(position, quiz_id, solve_id, user_id, score):
+    return {'position': position, 'kind': 'solve_finished',
+            'data': {'quiz_id': quiz_id, 'solve_id': solve_id,
+                     'user_id': user_id, 'quiz_score': score,
+                     'finish_datetime': '2022-07-01T10:00:00'}}
+
+
+def test_leaderboards_sync_from_the_change_stream():
+    rows = [SolveRow(1, 10, 20, '2022-07-01T10:00:00')]
+    stream = []
+    loads, cursors = [], []
+
+    def load():
+        loads.append(len(stream))
+        return len(stream), list(rows)
+
+    def changes(after, limit):
+        cursors.append(after)
+        if after < 0:
+            raise ValueError(after)
+        return stream[after:after + limit]
+
+    boards = Leaderboards(sync_seconds=0, batch_size=2)
+    assert len(boards.get(1, load, changes)) == 1
+    # Finished on another worker, and committed after a later solve.
+    stream.extend([solve_finished(1, 2, 7, 12, 50),
+                   solve_finished(2, 1, 3, 11, 90),
+                   solve_finished(3, 1, 2, 13, 10)])
+    board = boards.get(1, load, changes)
+    assert cursors == [0, 2]
+    assert board.rank_of(11)['rank'] == 1
+    assert len(board) == 3
+    assert loads == [0]
+
+    stream.append({'position': 4, 'kind': 'quiz_rescored',
+                   'data': {'quiz_id': 1, 'changed': 1}})
+    assert len(boards.get(1, load, changes)) == 1
+    assert loads == [0, 4]
+
+    # Events after the cursor were pruned: every board is rebuilt.
+    boards.position = -5
+    boards.get(1, load, changes)
+    assert loads == [0, 4, 4]
+
+
+def test_leaderboards_load_outside_the_lock():
+    loading, release = threading.Event(), threading.Event()
+
+    def slow_load():
+        loading.set()
+        release.wait(5)
+        return 0, []
+
+    boards = Leaderboards(sync_seconds=0)
+    thread = threading.Thread(target=boards.get,
+                              args=(1, slow_load, lambda *_: []))
+    thread.start()
+    assert loading.wait(5)
+    # Another quiz and the solves finishing here don't wait for it.
+    assert len(boards.get(2, lambda: (0, []), lambda *_: [])) == 0
+    boards.record(1, solve_id=1, user_id=10, score=5,
+                  finish_datetime='2022-07-01T10:00:00')
+    release.set()
+    thread.join(5)
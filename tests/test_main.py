@@ -1,21 +1,10 @@
 from random import random
-from fastapi.testclient import TestClient
-from app.api import app, get_db
+from sqlalchemy import event
+from app.db import crud
 from app.db.database import TestingSessionLocal
+from .conftest import client
 
 
-def override_get_db():
-    db = TestingSessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
-app.dependency_overrides[get_db] = override_get_db
-
-client = TestClient(app)
-
 auth_headers = ''
 last_quiz_id = 0
 last_question_id = 0
@@ -164,6 +153,42 @@ def test_create_answers_for_questions():
                    {"detail": "Maximum answers for a question reached: 5"}
 
 
+def test_owned_answer_is_one_query():
+    user_id = client.get("/users", headers=auth_headers).json()['id']
+    queries = []
+
+    def count(*args):
+        queries.append(args[2])
+
+    with TestingSessionLocal() as db:
+        event.listen(db.get_bind(), 'before_cursor_execute', count)
+        try:
+            db_answer, db_question, db_quiz = crud.get_owned_answer(
+                db, answer_id=last_answer_id, user_id=user_id
+            )
+            assert crud.get_owned_answer(
+                db, answer_id=last_answer_id, user_id=user_id
+            )[0] is db_answer
+            assert crud.get_owned_answer(
+                db, answer_id=last_answer_id, user_id=user_id + 1
+            ) is None
+        finally:
+            event.remove(db.get_bind(), 'before_cursor_execute', count)
+    assert len(queries) == 2
+    assert db_question.id == last_question_id
+    assert db_quiz.id == last_quiz_id
+
+
+def test_create_answer_question_not_found():
+    response = client.post(
+        '/questions/-1/answer',
+        json={"description": "Answer", "is_correct": "true"},
+        headers=auth_headers
+    )
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Question not found"}
+
+
 def test_answer_not_found():
     response = client.get("/answers/-1", headers=auth_headers)
     assert response.status_code == 404
@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta
+from random import random
+
+from sqlalchemy import inspect, text
+
+from app.db import crud, models
+from app.db.database import build_engine, get_testing_engine, \
+    TestingSessionLocal
+from app.db.schema import create_schema
+from app.jobs.sweeper import SolveSweeper
+from .conftest import client, login, publish_quiz
+
+
+def test_one_open_solve_per_user_and_expiry():
+    author_headers = login(f'author{random()}@testing.com')
+    quiz_id, _ = publish_quiz(author_headers, "Open solves")
+    solver_headers = login(f'solver{random()}@testing.com')
+    user_id = client.get('/users', headers=solver_headers).json()['id']
+
+    response = client.post('/solve', headers=solver_headers)
+    assert response.status_code == 200, response.text
+    solve_id = response.json()['id']
+
+    # As if a concurrent request had passed the check at the same time.
+    with TestingSessionLocal() as db:
+        assert crud.create_solve(db, models.Solve(
+            user_id=user_id, quiz_id=quiz_id
+        )) is None
+
+    with TestingSessionLocal() as db:
+        db.query(models.Solve).filter(models.Solve.id == solve_id).update({
+            'start_datetime':
+                (datetime.utcnow() - timedelta(hours=3)).isoformat()
+        })
+        db.commit()
+
+    sweeper = SolveSweeper(timedelta(hours=2), batch_size=1)
+    assert sweeper.sweep(get_testing_engine()) >= 1
+    response = client.get('/users/unfinished_solves', headers=solver_headers)
+    assert response.status_code == 404
+
+    response = client.post('/solve', headers=solver_headers)
+    assert response.status_code == 200, response.text
+
+    client.delete(f'/quizes/{quiz_id}', headers=author_headers)
+
+
+def test_duplicate_open_solves_expired_once(tmp_path):
+    engine = build_engine(f"sqlite:///{tmp_path / 'upgrade.db'}")
+    create_schema(engine)
+    with engine.begin() as connection:
+        connection.execute(text('DROP INDEX ix_solves_open_user_id'))
+        connection.execute(text(
+            "INSERT INTO users (id, email) VALUES (1, 'a'), (2, 'b')"
+        ))
+        connection.execute(text(
+            "INSERT INTO solves (id, user_id, is_finished) VALUES "
+            "(1, 1, 0), (2, 1, 0), (3, 1, 1), (4, 2, 0)"
+        ))
+
+    assert create_schema(engine) == 1
+    assert 'ix_solves_open_user_id' in {
+        index['name'] for index in inspect(engine).get_indexes('solves')
+    }
+    assert create_schema(engine) == 0
+    with engine.connect() as connection:
+        assert connection.execute(text(
+            'SELECT id FROM solves ORDER BY id'
+        )).scalars().all() == [2, 3, 4]
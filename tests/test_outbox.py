@@ -0,0 +1,76 @@
+import json
+from random import random
+
+from sqlalchemy import func, select
+
+from app.auth.auth_handler import admin_emails
+from app.db import crud, models
+from app.db.database import get_testing_engine, TestingSessionLocal
+from app.jobs.relay import OutboxRelay
+from app.tools.changes import FileSink, stream_changes
+from .conftest import client, login, publish_quiz
+
+
+def test_change_stream(monkeypatch, tmp_path):
+    engine = get_testing_engine()
+    relay = OutboxRelay()
+    relay.relay(engine)
+    with TestingSessionLocal() as db:
+        start = db.scalar(select(func.max(models.OutboxEvent.position))) or 0
+
+    admin = f'admin{random()}@testing.com'
+    headers = login(admin)
+    assert client.get('/events', headers=headers).status_code == 403
+    quiz_id, answer_ids = publish_quiz(headers, "Outbox")
+    solver_headers = login(f'solver{random()}@testing.com')
+    solve_id = client.post('/solve', headers=solver_headers).json()['id']
+    response = client.put(
+        f"/solve/{solve_id}",
+        json=[{"id": answer_id, "user_answer": is_correct}
+              for answer_id, is_correct in answer_ids],
+        headers=solver_headers
+    )
+    assert response.status_code == 200, response.text
+    client.delete(f'/quizes/{quiz_id}', headers=headers)
+
+    monkeypatch.setenv('ADMIN_EMAILS', admin)
+    admin_emails.cache_clear()
+    try:
+        # Not visible until the relay numbers them.
+        response = client.get(f'/events?after={start}', headers=headers)
+        assert response.json() == {'events': [], 'after': start}
+        assert relay.relay(engine) == 3
+
+        response = client.get(f'/events?after={start}&limit=2',
+                              headers=headers)
+        batch = response.json()
+        assert [e['position'] for e in batch['events']] == \
+            [start + 1, start + 2]
+        response = client.get(f'/events?after={batch["after"]}',
+                              headers=headers)
+        events = batch['events'] + response.json()['events']
+        assert [e['kind'] for e in events] == \
+            ['quiz_published', 'solve_finished', 'quiz_deleted']
+        assert events[1]['data']['solve_id'] == solve_id
+        assert events[1]['data']['quiz_score'] == 100
+        assert {e['data']['quiz_id'] for e in events} == {quiz_id}
+
+        path = tmp_path / 'events.ndjson'
+        sink = FileSink(str(path))
+        sink.write([{'position': start}])
+        assert stream_changes(engine, sink, batch_size=2) == 3
+        with open(path, 'a') as f:
+            f.write('{"position": ')
+        assert sink.last_position() == start + 3
+        assert stream_changes(engine, sink) == 0
+        with open(path) as f:
+            assert [json.loads(line)['position'] for line in f] == \
+                list(range(start, start + 4))
+
+        with TestingSessionLocal() as db:
+            assert crud.delete_outbox_events(db, '9999', limit=1) == 1
+        response = client.get('/events?after=0', headers=headers)
+        assert response.status_code == 410
+    finally:
+        monkeypatch.undo()
+        admin_emails.cache_clear()
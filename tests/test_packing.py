@@ -0,0 +1,21 @@
+from app.helpers.packing import pack_scores, pack_selections, \
+    unpack_scores, unpack_selections
+
+
+def test_scores_round_trip():
+    scores = [100, -100, 0, 16, -33]
+    packed = pack_scores(scores)
+    assert len(packed) == 5
+    assert unpack_scores(packed) == scores
+
+
+def test_selections_round_trip():
+    order = [3, 4, 8, 9, 12]
+    packed = pack_selections(order, {4, 12, 99})
+    assert packed == bytes([0b10010])
+    assert unpack_selections(packed, order) == {4, 12}
+
+
+def test_fifty_answers_fit_in_seven_bytes():
+    order = list(range(50))
+    assert len(pack_selections(order, set(order))) == 7
@@ -0,0 +1,69 @@
+import pytest
+from sqlalchemy import create_engine, text
+
+from app.db import models
+from app.db.database import get_testing_engine
+from app.db.partitioning import is_partitioned, partition_solves
+from app.db.replicas import RoutingSession
+from app.db.schema import create_schema
+
+SCHEMA = 'partitioning_test'
+
+
+@pytest.fixture
+def bind():
+    testing_engine = get_testing_engine()
+    if testing_engine.dialect.name != 'postgresql':
+        pytest.skip("partitioning needs PostgreSQL")
+    with testing_engine.begin() as connection:
+        connection.execute(text(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE'))
+        connection.execute(text(f'CREATE SCHEMA {SCHEMA}'))
+    engine = create_engine(
+        testing_engine.url,
+        connect_args={'options': f'-csearch_path={SCHEMA}'}
+    )
+    create_schema(engine)
+    yield engine
+    engine.dispose()
+    with testing_engine.begin() as connection:
+        connection.execute(text(f'DROP SCHEMA {SCHEMA} CASCADE'))
+
+
+def test_partition_solves_keeps_rows_and_cascades(bind):
+    with bind.begin() as connection:
+        for statement in [
+            "INSERT INTO users (id, email, hashed_password, is_active) "
+            "VALUES (1, 'author@testing.com', '', true)",
+            "INSERT INTO quizes (id, title, is_active, user_id) "
+            "VALUES (1, 'quiz', true, 1), (2, 'other', true, 1)",
+            "INSERT INTO solves (quiz_id, user_id, is_finished) "
+            "VALUES (1, 1, true), (2, 1, true)",
+            "INSERT INTO questionscores (solve_id, question_id, score) "
+            "SELECT id, 1, 50 FROM solves",
+        ]:
+            connection.execute(text(statement))
+
+    assert partition_solves(bind, partitions=4)
+    assert not partition_solves(bind, partitions=4)
+
+    with bind.connect() as connection:
+        assert is_partitioned(connection, 'solves')
+        assert is_partitioned(connection, 'questionscores')
+        assert connection.execute(text(
+            "SELECT count(*) FROM questionscores WHERE quiz_id IS NULL"
+        )).scalar() == 0
+
+    with RoutingSession(bind=bind) as db:
+        db.add(models.Solve(quiz_id=1, user_id=1))
+        db.commit()
+        solves = db.query(models.Solve).filter(
+            models.Solve.quiz_id == 1
+        ).order_by(models.Solve.id).all()
+        assert [solve.id for solve in solves] == [1, 3]
+        assert [qs.score for qs in solves[0].question_scores] == [50]
+
+    with bind.begin() as connection:
+        connection.execute(text("DELETE FROM quizes WHERE id = 1"))
+        assert connection.execute(text(
+            "SELECT count(*) FROM questionscores"
+        )).scalar() == 1
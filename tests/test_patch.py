@@ -0,0 +1,114 @@
+from random import random
+
+from sqlalchemy import event
+
+from app.db.database import get_testing_engine
+from .conftest import client, login
+
+
+def answer(description, is_correct=False):
+    return {"description": description, "is_correct": is_correct}
+
+
+def test_patch_quiz():
+    headers = login(f'author{random()}@testing.com')
+    quiz_id = client.post('/users/quiz', json={"title": "Draft"},
+                          headers=headers).json()['id']
+    try:
+        response = client.patch(f'/quizes/{quiz_id}', json={
+            'questions': {'add': [
+                {"description": f"Question {number}",
+                 "single_correct_answer": True,
+                 "answers": [answer("Right", True), answer("Wrong")]}
+                for number in range(2)
+            ]}
+        }, headers=headers)
+        assert response.status_code == 200, response.text
+        first, second = sorted(response.json()['questions'],
+                               key=lambda q: q['id'])
+        right, wrong = first['answers']
+
+        queries = []
+
+        def count(*args):
+            queries.append(args[2])
+
+        event.listen(get_testing_engine(), 'before_cursor_execute', count)
+        try:
+            response = client.patch(f'/quizes/{quiz_id}', json={
+                'title': "Edited",
+                'questions': {
+                    'add': [{"description": "New",
+                             "single_correct_answer": False,
+                             "answers": [answer("A", True), answer("B"),
+                                         answer("C", True)]}],
+                    'update': [{'id': first['id'],
+                                'description': "First, edited"}],
+                    'remove': [second['id']]
+                },
+                'answers': {
+                    'add': [{"question_id": first['id'],
+                             **answer("Also wrong")}],
+                    'update': [{'id': wrong['id'], 'is_correct': True}],
+                    'remove': [right['id']]
+                }
+            }, headers=headers)
+        finally:
+            event.remove(get_testing_engine(), 'before_cursor_execute',
+                         count)
+        assert response.status_code == 200, response.text
+        assert len(queries) <= 20
+        quiz = response.json()
+        assert quiz['title'] == "Edited"
+        questions = {q['description']: q for q in quiz['questions']}
+        assert set(questions) == {"First, edited", "New"}
+        assert sorted(a['description'] for a in
+                      questions["First, edited"]['answers']) == \
+            ["Also wrong", "Wrong"]
+        assert len(questions["New"]['answers']) == 3
+        response = client.get(f"/questions/{first['id']}", headers=headers)
+        assert response.json()['single_correct_answer'] is True
+        response = client.get(f"/answers/{wrong['id']}", headers=headers)
+        assert response.json()['description'] == "Wrong"
+
+        response = client.patch(f'/quizes/{quiz_id}', json={
+            'questions': {'remove': [-1]}
+        }, headers=headers)
+        assert response.status_code == 404
+        response = client.patch(f'/quizes/{quiz_id}', json={
+            'answers': {'add': [{"question_id": first['id'],
+                                 **answer("Extra")}] * 4}
+        }, headers=headers)
+        assert response.status_code == 409
+        response = client.patch(f'/quizes/{quiz_id}', json={
+            'questions': {'add': [{"description": "More",
+                                   "single_correct_answer": True}] * 9}
+        }, headers=headers)
+        assert response.status_code == 409
+        response = client.patch(f'/quizes/{quiz_id}', json={
+            'questions': {'update': [{'id': first['id'],
+                                      'description': "Gone"}],
+                          'remove': [first['id']]}
+        }, headers=headers)
+        assert response.status_code == 422
+        for patch in ({'title': None},
+                      {'questions': {'update': [{'id': first['id'],
+                                                 'description': None}]}},
+                      {'answers': {'update': [{'id': wrong['id'],
+                                               'is_correct': None}]}}):
+            response = client.patch(f'/quizes/{quiz_id}', json=patch,
+                                    headers=headers)
+            assert response.status_code == 422
+        response = client.get(f'/quizes/{quiz_id}', headers=headers)
+        assert response.json()['title'] == "Edited"
+        assert len(response.json()['questions']) == 2
+
+        response = client.put(f'/quizes/{quiz_id}',
+                              json={"title": "Edited", "is_active": True},
+                              headers=headers)
+        assert response.status_code == 200, response.text
+        response = client.patch(f'/quizes/{quiz_id}', json={'title': "No"},
+                                headers=headers)
+        assert response.status_code == 405
+    finally:
+        client.delete(f'/quizes/{quiz_id}', headers=headers)
@@ -0,0 +1,41 @@
+import json
+from random import random
+
+from app.api import app
+from app.auth.auth_handler import admin_emails
+from app.diagnostics.profiling import ProfilingMiddleware
+from .conftest import client, login
+
+
+ADMIN = f'admin{random()}@testing.com'
+
+
+def test_profile_requested_by_admin(monkeypatch, tmp_path):
+    monkeypatch.setenv('ADMIN_EMAILS', ADMIN)
+    admin_emails.cache_clear()
+    headers = login(ADMIN)
+    for middleware in app.user_middleware:
+        if middleware.cls is ProfilingMiddleware:
+            monkeypatch.setitem(middleware.options, 'directory',
+                                str(tmp_path))
+    app.middleware_stack = app.build_middleware_stack()
+
+    response = client.get("/quizes", headers={**headers, 'X-Profile': '1'})
+    assert response.status_code == 200
+    profile_id = response.headers['x-profile-id']
+    [summary] = tmp_path.glob(f'*{profile_id}.json')
+    summary = json.loads(summary.read_text())
+    assert summary['route'] == '/quizes'
+    assert summary['queries'] >= 2
+    assert (tmp_path / summary['stats']).exists()
+
+    monkeypatch.undo()
+    admin_emails.cache_clear()
+    app.middleware_stack = app.build_middleware_stack()
+
+
+def test_profile_header_ignored_for_other_users():
+    headers = login(f'user{random()}@testing.com')
+    response = client.get("/quizes", headers={**headers, 'X-Profile': '1'})
+    assert response.status_code == 200
+    assert 'x-profile-id' not in response.headers
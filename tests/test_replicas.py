@@ -0,0 +1,117 @@
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from app.auth.auth_handler import sign_write_time, verify_write_time
+from app.db import crud, schemas
+from app.db.database import build_engine
+from app.db.replicas import ReplicaSet, RoutingSession, WriteTimeMiddleware
+from app.db.schema import create_schema
+
+
+def sqlite_engine(path):
+    engine = build_engine(f'sqlite:///{path}')
+    create_schema(engine)
+    with RoutingSession(bind=engine) as db:
+        db_user = crud.create_user(db, schemas.UserCreate(
+            email='author@testing.com', password='secret'
+        ))
+        crud.create_quiz(db, schemas.QuizBase(title=str(path)),
+                         user_id=db_user.id)
+    return engine
+
+
+def title(db):
+    return crud.get_visible_quiz(db, quiz_id=1, user_id=1).title
+
+
+def test_reads_go_to_replicas_round_robin(tmp_path):
+    primary = sqlite_engine(tmp_path / 'primary.db')
+    first = sqlite_engine(tmp_path / 'first.db')
+    second = sqlite_engine(tmp_path / 'second.db')
+    replicas = ReplicaSet([first, second])
+
+    with RoutingSession(bind=primary, replicas=replicas) as db:
+        assert {title(db), title(db)} == {
+            str(tmp_path / 'first.db'), str(tmp_path / 'second.db')
+        }
+        # Reads outside replica_read crud functions stay on the primary.
+        assert db.execute(text('SELECT title FROM quizes')).scalar() == \
+            str(tmp_path / 'primary.db')
+
+
+def test_reads_stay_on_primary_after_a_write(tmp_path):
+    primary = sqlite_engine(tmp_path / 'primary.db')
+    replicas = ReplicaSet([sqlite_engine(tmp_path / 'replica.db')],
+                          sticky_seconds=60)
+
+    with RoutingSession(bind=primary, replicas=replicas) as db:
+        db.info['user_id'] = 1
+        crud.update_quiz(db, schemas.QuizUpdate(title='updated'), quiz_id=1)
+        assert title(db) == 'updated'
+
+    with RoutingSession(bind=primary, replicas=replicas) as db:
+        db.info['user_id'] = 1
+        assert title(db) == 'updated'
+
+    with RoutingSession(bind=primary, replicas=replicas) as db:
+        db.info['user_id'] = 2
+        assert crud.get_quizes_by_user(db, user_id=1)[0].title == \
+            str(tmp_path / 'replica.db')
+
+
+def test_falls_back_to_primary_without_a_healthy_replica(tmp_path):
+    primary = sqlite_engine(tmp_path / 'primary.db')
+    missing = build_engine(f'sqlite:///{tmp_path}/missing/replica.db')
+    replicas = ReplicaSet([missing])
+
+    with RoutingSession(bind=primary, replicas=replicas) as db:
+        assert title(db) == str(tmp_path / 'primary.db')
+    assert not replicas.is_healthy(missing)
+
+
+def test_reads_stay_on_primary_after_a_write_on_any_worker(tmp_path):
+    primary = sqlite_engine(tmp_path / 'primary.db')
+    replicas = ReplicaSet([sqlite_engine(tmp_path / 'replica.db')],
+                          sticky_seconds=60)
+
+    # Another worker handled the write; only the client's cookie knows.
+    with RoutingSession(bind=primary, replicas=replicas) as db:
+        db.info['request_state'] = {'last_write': time.time() - 1}
+        assert title(db) == str(tmp_path / 'primary.db')
+    with RoutingSession(bind=primary, replicas=replicas) as db:
+        db.info['request_state'] = {'last_write': time.time() - 120}
+        assert title(db) == str(tmp_path / 'replica.db')
+
+    state = {}
+    with RoutingSession(bind=primary, replicas=replicas) as db:
+        db.info['request_state'] = state
+        crud.update_quiz(db, schemas.QuizUpdate(title='updated'), quiz_id=1)
+    assert time.time() - state['wrote_at'] < 5
+    # Lookups that guard writes never read a replica.
+    with RoutingSession(bind=primary, replicas=replicas) as db:
+        assert crud.get_quiz(db, quiz_id=1, user_id=1).title == 'updated'
+
+
+def test_write_time_cookie():
+    app = FastAPI()
+    app.add_middleware(WriteTimeMiddleware, sign=sign_write_time,
+                       verify=verify_write_time)
+
+    @app.post('/write')
+    def write(request: Request):
+        request.scope['state']['wrote_at'] = 1234.5
+
+    @app.get('/read')
+    def read(request: Request):
+        return request.scope['state']['last_write']
+
+    client = TestClient(app)
+    assert client.get('/read').json() is None
+    response = client.post('/write')
+    assert 'HttpOnly' in response.headers['set-cookie']
+    assert client.get('/read').json() == 1234.5
+    forged = {'last_write': '9999.000.' + '0' * 64}
+    assert TestClient(app).get('/read', cookies=forged).json() is None
@@ -0,0 +1,66 @@
+import json
+
+from sqlalchemy import select, text
+
+from app.db import models
+from app.db.database import build_engine
+from app.db.schema import create_schema
+from app.tools.rescore import Checkpoint, rescore
+from app.tools.synthetic import generate
+
+
+def scores(engine):
+    with engine.connect() as connection:
+        return (
+            connection.execute(
+                select(models.Solve.id, models.Solve.quiz_score)
+                .order_by(models.Solve.id)
+            ).fetchall(),
+            connection.execute(
+                select(models.QuestionScore.id, models.QuestionScore.score)
+                .order_by(models.QuestionScore.id)
+            ).fetchall(),
+        )
+
+
+def test_rescore_fixes_stale_scores_and_resumes(tmp_path):
+    engine = build_engine(f'sqlite:///{tmp_path / "rescore.db"}')
+    create_schema(engine)
+    generate(engine, users=40, solves=300, open_ratio=0)
+    expected = scores(engine)
+    with engine.begin() as connection:
+        connection.execute(text(
+            "UPDATE solves SET quiz_score = quiz_score + 1 WHERE id % 3 = 0"
+        ))
+        connection.execute(text(
+            "UPDATE questionscores SET score = 7 WHERE id % 5 = 0"
+        ))
+        quiz_ids = list(connection.execute(
+            select(models.Quiz.id).order_by(models.Quiz.id)
+        ).scalars())
+
+    path = str(tmp_path / 'checkpoint.json')
+    totals = rescore(engine, quiz_ids=quiz_ids[:2],
+                     checkpoint=Checkpoint(path), batch_size=4)
+    with open(path) as f:
+        assert json.load(f)['done'] == quiz_ids[:2]
+
+    checkpoint = Checkpoint(path)
+    totals = rescore(engine, checkpoint=checkpoint, batch_size=4)
+    assert checkpoint.done == set(quiz_ids)
+    assert totals['solves'] == len(expected[0])
+    assert totals['changed'] == len(expected[0]) // 3
+    assert totals['question_scores_changed'] > 0
+    assert scores(engine) == expected
+    # Workers rebuild the leaderboards of the quizes that changed.
+    with engine.connect() as connection:
+        events = connection.execute(
+            select(models.OutboxEvent.kind, models.OutboxEvent.payload)
+        ).fetchall()
+    assert {kind for kind, _ in events} == {'quiz_rescored'}
+    assert sum(json.loads(payload)['changed'] for _, payload in events) == \
+        totals['changed']
+
+    totals = rescore(engine, jobs=2, dry_run=True)
+    assert totals['solves'] == len(expected[0])
+    assert totals['changed'] == totals['question_scores_changed'] == 0
@@ -0,0 +1,65 @@
+import time
+
+from app.helpers.search import InvertedIndex, SearchIndexes, tokenize
+
+
+def test_tokenize():
+    assert tokenize("What's the capital of France?") == \
+           ['what', 's', 'the', 'capital', 'of', 'france']
+
+
+def build_index():
+    index = InvertedIndex()
+    index.add(('quiz', 1), "European capitals", kind='quiz', id=1)
+    index.add(('question', 2), "What is the capital of France?",
+              kind='question', id=2)
+    index.add(('question', 3), "What is the capital of Italy? Capital!",
+              kind='question', id=3)
+    return index
+
+
+def test_search_matches_prefixes_of_every_term():
+    index = build_index()
+    assert [r['id'] for r in index.search("capital fra")] == [2]
+    assert {r['id'] for r in index.search("capital")} == {1, 2, 3}
+    assert index.search("capital germany") == []
+
+
+def test_search_ranks_and_paginates():
+    index = build_index()
+    assert [r['id'] for r in index.search("capital")][0] == 3
+    assert len(index.search("capital", offset=1, limit=1)) == 1
+    assert index.search("capital", offset=3) == []
+
+
+class Row:
+    def __init__(self, kind, id, quiz_id, text):
+        self.kind = kind
+        self.id = id
+        self.quiz_id = quiz_id
+        self.text = text
+
+
+def test_search_indexes_reload_after_invalidate():
+    rows = [Row('quiz', 1, 1, "Geography")]
+    indexes = SearchIndexes()
+    assert len(indexes.get(7, lambda: rows)) == 1
+    rows.append(Row('question', 5, 1, "Longest river?"))
+    assert len(indexes.get(7, lambda: rows)) == 1
+    indexes.invalidate(7)
+    assert len(indexes.get(7, lambda: rows)) == 2
+
+
+def test_search_indexes_reload_on_a_new_version_or_when_old():
+    rows = [Row('quiz', 1, 1, "Geography")]
+    indexes = SearchIndexes()
+    assert len(indexes.get(7, lambda: rows, version=(1, 1, 1))) == 1
+    rows.append(Row('question', 5, 1, "Longest river?"))
+    assert len(indexes.get(7, lambda: rows, version=(1, 1, 1))) == 1
+    # Edited through another worker.
+    assert len(indexes.get(7, lambda: rows, version=(1, 2, 1))) == 2
+
+    indexes = SearchIndexes(max_age=0.01)
+    assert len(indexes.get(7, lambda: rows[:1])) == 1
+    time.sleep(0.02)
+    assert len(indexes.get(7, lambda: rows)) == 2
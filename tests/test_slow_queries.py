@@ -0,0 +1,48 @@
+from random import random
+
+from app.auth.auth_handler import admin_emails
+from app.db import crud
+from app.db.database import TestingSessionLocal
+from app.diagnostics.slow_queries import normalize, SlowQueryLog
+from .conftest import client, login
+
+
+def test_normalize():
+    assert normalize(
+        "SELECT * FROM quizes\n  WHERE id = %(id_1)s AND title = 'it''s'"
+        " AND user_id IN (1, 2, 3) LIMIT 10"
+    ) == 'SELECT * FROM quizes WHERE id = ? AND title = ? ' \
+         'AND user_id IN (?, ...) LIMIT ?'
+
+
+def test_slow_queries_are_summarized_with_plan():
+    log = SlowQueryLog(threshold_ms=0)
+    try:
+        with TestingSessionLocal() as db:
+            crud.get_quiz(db, quiz_id=1, user_id=1)
+            crud.get_quiz(db, quiz_id=2, user_id=1)
+    finally:
+        log.close()
+    [summary] = [item for item in log.summary()
+                 if 'get_quiz' in item['functions']]
+    assert summary['count'] == 2
+    assert summary['statement'].startswith('SELECT')
+    assert '?' in summary['statement']
+    assert summary['plan'] and not summary['plan'][0].startswith('EXPLAIN')
+
+
+def test_slow_queries_endpoint_is_for_admins(monkeypatch):
+    headers = login(f'user{random()}@testing.com')
+    response = client.get("/admin/slow-queries", headers=headers)
+    assert response.status_code == 403
+
+    admin = f'admin{random()}@testing.com'
+    monkeypatch.setenv('ADMIN_EMAILS', admin)
+    admin_emails.cache_clear()
+    try:
+        response = client.get("/admin/slow-queries", headers=login(admin))
+        assert response.status_code == 200
+        assert isinstance(response.json(), list)
+    finally:
+        monkeypatch.undo()
+        admin_emails.cache_clear()
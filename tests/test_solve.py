@@ -0,0 +1,244 @@
+import json
+import threading
+import time
+from random import random
+from app import api
+from app.db import crud, models
+from app.db.database import get_testing_engine, TestingSessionLocal
+from app.jobs.queue import JobQueue
+from app.jobs.tasks import job_queue
+from .conftest import client, login
+
+
+author_headers = ''
+solver_headers = ''
+quiz_id = 0
+solve_id = 0
+answer_ids = []
+
+
+def test_publish_quiz():
+    global author_headers, quiz_id
+    author_headers = login(f'author{random()}@testing.com')
+    response = client.post(
+        '/users/quiz',
+        json={"title": f"Solvable Quiz No. {random()}"},
+        headers=author_headers
+    )
+    assert response.status_code == 200, response.text
+    quiz_id = response.json()['id']
+
+    for single in (True, False):
+        response = client.post(
+            f'/quizes/{quiz_id}/question',
+            json={
+                "description": f"Question {random()}",
+                "single_correct_answer": single
+            },
+            headers=author_headers
+        )
+        assert response.status_code == 200, response.text
+        question_id = response.json()['id']
+        for is_correct in (True, False):
+            response = client.post(
+                f'/questions/{question_id}/answer',
+                json={
+                    "description": f"Answer {random()}",
+                    "is_correct": is_correct
+                },
+                headers=author_headers
+            )
+            assert response.status_code == 200, response.text
+            answer_ids.append((response.json()['id'], is_correct))
+
+    response = client.put(
+        f'/quizes/{quiz_id}',
+        json={"title": f"Solvable Quiz No. {random()}", "is_active": True},
+        headers=author_headers
+    )
+    assert response.status_code == 200, response.text
+
+
+def test_search():
+    response = client.get("/search?q=solvable", headers=author_headers)
+    assert response.status_code == 200, response.text
+    assert [(r['kind'], r['id']) for r in response.json()] == \
+           [('quiz', quiz_id)]
+
+    response = client.get("/search?q=question&per_page=1&page=2",
+                          headers=author_headers)
+    assert response.status_code == 200, response.text
+    assert [r['kind'] for r in response.json()] == ['question']
+
+    other_headers = login(f'other{random()}@testing.com')
+    response = client.get("/search?q=solvable", headers=other_headers)
+    assert response.json() == []
+
+
+def test_create_solve():
+    global solver_headers, solve_id
+    solver_headers = login(f'solver{random()}@testing.com')
+    response = client.post("/solve", headers=solver_headers)
+    assert response.status_code == 200, response.text
+    assert response.json()['quiz_id'] == quiz_id
+    assert response.json()['question_scores'] == []
+    solve_id = response.json()['id']
+
+    published = client.get(f"/quizes/{quiz_id}", headers=author_headers)
+    assert response.json()['quiz'] == published.json()
+    assert len(published.json()['questions']) == 2
+
+
+def test_update_solve():
+    response = client.put(
+        f"/solve/{solve_id}",
+        json=[
+            {"id": answer_id, "user_answer": is_correct}
+            for answer_id, is_correct in answer_ids
+        ],
+        headers=solver_headers
+    )
+    assert response.status_code == 200, response.text
+    assert response.json()['quiz_score'] == 100
+    assert response.json()['is_finished']
+
+
+def test_question_scores_written_in_background():
+    assert job_queue.join()
+    response = client.get(f"/quizes/{quiz_id}/solves", headers=author_headers)
+    assert response.status_code == 200, response.text
+    [solve] = response.json()
+    assert [qs['score'] for qs in solve['question_scores']] == [100, 100]
+
+
+def test_packed_question_scores(monkeypatch):
+    monkeypatch.setattr(api, 'QUESTION_SCORES_STORAGE', 'packed')
+    headers = login(f'solver{random()}@testing.com')
+    response = client.post("/solve", headers=headers)
+    assert response.json()['quiz_id'] == quiz_id
+    response = client.put(
+        f"/solve/{response.json()['id']}",
+        json=[
+            {"id": answer_id, "user_answer": not is_correct}
+            for answer_id, is_correct in answer_ids
+        ],
+        headers=headers
+    )
+    assert response.status_code == 200, response.text
+
+    response = client.get(f"/quizes/{quiz_id}/solves", headers=author_headers)
+    rows, packed = sorted(response.json(), key=lambda solve: solve['id'])
+    assert [qs['question_id'] for qs in packed['question_scores']] == \
+           [qs['question_id'] for qs in rows['question_scores']]
+    assert [qs['score'] for qs in packed['question_scores']] == [-100, -100]
+
+
+def test_answer_stats():
+    assert job_queue.join()
+    response = client.get(f"/quizes/{quiz_id}/answer-stats",
+                          headers=author_headers)
+    assert response.status_code == 200, response.text
+    assert [(a['answer_id'], a['selections'], a['selection_rate'])
+            for a in response.json()] == \
+           [(answer_id, 1, 0.5) for answer_id, _ in answer_ids]
+
+
+def test_leaderboard():
+    response = client.get(f"/quizes/{quiz_id}/leaderboard?top=5",
+                          headers=author_headers)
+    assert response.status_code == 200, response.text
+    assert [(e['rank'], e['solve_id']) for e in response.json()][0] == \
+           (1, solve_id)
+
+
+def test_my_rank():
+    response = client.get(f"/quizes/{quiz_id}/leaderboard/me",
+                          headers=solver_headers)
+    assert response.status_code == 200, response.text
+    assert response.json()['rank'] == 1
+    assert response.json()['quiz_score'] == 100
+
+    response = client.get(f"/quizes/{quiz_id}/leaderboard/me",
+                          headers=author_headers)
+    assert response.status_code == 404
+
+
+def test_finished_solves_are_streamed(monkeypatch):
+    monkeypatch.setattr(api, 'EVENTS_STREAM_SECONDS', 2.0)
+    headers = login(f'solver{random()}@testing.com')
+    new_solve_id = client.post("/solve", headers=headers).json()['id']
+    streams = []
+    watcher = threading.Thread(target=lambda: streams.append(client.get(
+        f"/quizes/{quiz_id}/events", headers=author_headers
+    )))
+    watcher.start()
+    deadline = time.monotonic() + 2
+    while not api.events.subscribers(f'quiz-{quiz_id}') and \
+            time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    response = client.put(
+        f"/solve/{new_solve_id}",
+        json=[
+            {"id": answer_id, "user_answer": is_correct}
+            for answer_id, is_correct in answer_ids
+        ],
+        headers=headers
+    )
+    assert response.status_code == 200, response.text
+    watcher.join(5)
+
+    [stream] = streams
+    assert stream.status_code == 200
+    assert stream.headers['content-type'].startswith('text/event-stream')
+    [data] = [line[len('data: '):] for line in stream.text.splitlines()
+              if line.startswith('data: ')]
+    event = json.loads(data)
+    assert event['id'] == new_solve_id
+    assert event['quiz_score'] == 100
+    assert [qs['score'] for qs in event['question_scores']] == [100, 100]
+
+    response = client.get(f"/quizes/{quiz_id}/events", headers=solver_headers)
+    assert response.status_code == 404
+
+
+def test_delete_solved_quiz():
+    response = client.delete(f"/quizes/{quiz_id}", headers=author_headers)
+    assert response.status_code == 200
+    assert response.json() == {"ok": True}
+
+
+def test_job_queue_stop_shares_one_deadline():
+    release = threading.Event()
+    jobs = JobQueue({'block': lambda db: release.wait(5)}, workers=2,
+                    poll_interval=60)
+    with TestingSessionLocal() as db:
+        for _ in range(2):
+            jobs.submit(db, 'block', {})
+        db.commit()
+    started = time.monotonic()
+    jobs.stop(timeout=0.5)
+    elapsed = time.monotonic() - started
+    release.set()
+    assert jobs.join(5)
+    assert elapsed < 1.0
+
+
+def test_job_that_lost_its_lease_is_rolled_back():
+    kind = f'marker-{random()}'
+
+    def handler(db):
+        # Another worker claims the job again while this run goes on.
+        with TestingSessionLocal() as other:
+            assert crud.claim_job(other, job_id, 0) is not None
+        crud.create_job(db, kind, {})
+
+    jobs = JobQueue({'reclaimed': handler}, lease_seconds=0)
+    with TestingSessionLocal() as db:
+        job_id = crud.create_job(db, 'reclaimed', {}).id
+        db.commit()
+    jobs._run(get_testing_engine(), job_id)
+    with TestingSessionLocal() as db:
+        assert db.query(models.Job).filter(models.Job.kind == kind).count() \
+            == 0
+        assert crud.delete_job(db, job_id, attempts=2)
@@ -0,0 +1,87 @@
+from sqlalchemy import func, select
+
+from app.db import models
+from app.db.database import build_engine
+from app.db.schema import create_schema
+from app.helpers.packing import unpack_scores
+from app.tools.synthetic import generate
+
+
+def sqlite_engine(path):
+    engine = build_engine(f'sqlite:///{path}')
+    create_schema(engine)
+    return engine
+
+
+def dump(engine):
+    with engine.connect() as connection:
+        return {
+            table.name: connection.execute(
+                select(table).order_by(table.c.id)
+            ).fetchall()
+            for table in (models.Quiz.__table__, models.Answer.__table__,
+                          models.Solve.__table__,
+                          models.QuestionScore.__table__)
+        }
+
+
+def test_generates_consistent_data(tmp_path):
+    engine = sqlite_engine(tmp_path / 'synthetic.db')
+    totals = generate(engine, users=50, solves=300, open_ratio=0.5,
+                      batch_size=64)
+
+    data = dump(engine)
+    solves, scores = data['solves'], data['questionscores']
+    assert totals['users'] == 50
+    assert totals['solves'] == len(solves) > 0
+    assert totals['questionscores'] == len(scores) > 0
+    finished = [solve for solve in solves if solve.is_finished]
+    assert {quiz.id: quiz.solve_count for quiz in data['quizes']
+            if quiz.solve_count} == {
+        quiz_id: sum(1 for solve in finished if solve.quiz_id == quiz_id)
+        for quiz_id in {solve.quiz_id for solve in finished}
+    }
+    for solve in finished:
+        solve_scores = [score.score for score in scores
+                        if score.solve_id == solve.id]
+        assert solve.quiz_score == int(sum(solve_scores) / len(solve_scores))
+    open_users = [solve.user_id for solve in solves if not solve.is_finished]
+    assert len(open_users) == len(set(open_users)) > 0
+    assert sum(answer.selection_count for answer in data['answers']) > 0
+
+
+def test_packed_question_scores(tmp_path):
+    engine = sqlite_engine(tmp_path / 'synthetic.db')
+    generate(engine, users=50, solves=200, open_ratio=0,
+             question_scores='packed')
+
+    with engine.connect() as connection:
+        assert connection.execute(
+            select(func.count()).select_from(models.QuestionScore)
+        ).scalar() == 0
+        solves = connection.execute(
+            select(models.Solve.__table__)
+            .where(models.Solve.is_finished.is_(True))
+        ).fetchall()
+    assert solves
+    for solve in solves:
+        solve_scores = unpack_scores(solve.packed_question_scores)
+        assert solve.quiz_score == int(sum(solve_scores) / len(solve_scores))
+
+
+def test_same_seed_gives_same_data(tmp_path):
+    first = sqlite_engine(tmp_path / 'first.db')
+    second = sqlite_engine(tmp_path / 'second.db')
+    third = sqlite_engine(tmp_path / 'third.db')
+    generate(first, users=30, solves=100, seed=7)
+    generate(second, users=30, solves=100, seed=7)
+    generate(third, users=30, solves=100, seed=8)
+
+    def comparable(engine):
+        data = dump(engine)
+        # Start times are relative to now.
+        data['solves'] = [solve[:3] + solve[5:] for solve in data['solves']]
+        return data
+
+    assert comparable(first) == comparable(second)
+    assert comparable(first) != comparable(third)
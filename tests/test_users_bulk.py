@@ -0,0 +1,62 @@
+from random import random
+
+from app.auth.auth_bearer import hash_passwords, shutdown_hash_pool, \
+    verify_password
+from app.auth.auth_handler import admin_emails
+from .conftest import client, login
+
+
+def test_bulk_create_users(monkeypatch):
+    admin = f'admin{random()}@testing.com'
+    headers = login(admin)
+    assert client.post('/users/bulk', json=[],
+                       headers=headers).status_code == 403
+
+    monkeypatch.setenv('ADMIN_EMAILS', admin)
+    admin_emails.cache_clear()
+    try:
+        first, second = (f'student{random()}@testing.com' for _ in range(2))
+        response = client.post('/users/bulk', json=[
+            {'email': first, 'password': 'first'},
+            {'email': admin, 'password': 'secret'},
+            {'email': first, 'password': 'again'},
+            {'email': 'nobody', 'password': 'secret'},
+            {'email': f' {second} ', 'password': ''},
+        ], headers=headers)
+        assert response.status_code == 200, response.text
+        report = response.json()
+        assert [(row['row'], row['status']) for row in report] == [
+            (1, 'created'), (2, 'exists'), (3, 'duplicate'), (4, 'invalid'),
+            (5, 'invalid')
+        ]
+        assert report[0]['id'] > 0
+
+        response = client.post(
+            '/users/bulk',
+            data=f'email,password\n{first},first\n{second},second\n',
+            headers=dict(headers, **{'Content-Type': 'text/csv'})
+        )
+        assert response.status_code == 200, response.text
+        assert [row['status'] for row in response.json()] == \
+            ['exists', 'created']
+
+        response = client.post('/token',
+                               data={'username': second,
+                                     'password': 'second'})
+        assert response.status_code == 200
+
+        response = client.post('/users/bulk', data='{"email": 1}',
+                               headers=headers)
+        assert response.status_code == 422
+    finally:
+        monkeypatch.undo()
+        admin_emails.cache_clear()
+
+
+def test_hash_passwords_in_processes():
+    try:
+        hashes = hash_passwords(['first', 'second', 'third'], workers=2)
+    finally:
+        shutdown_hash_pool()
+    assert [verify_password(password, hashed) for password, hashed
+            in zip(['first', 'second', 'third'], hashes)] == [True] * 3